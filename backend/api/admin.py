@@ -7,6 +7,10 @@ import logging
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from ..cache import (
+    citizen_cache, reference_cache, eligibility_cache, ranking_cache,
+    demographic_cache, similarity_cache
+)
 from ..scheduler.sync_scheduler import (
     trigger_sync_now,
     scheduler,
@@ -92,3 +96,17 @@ async def get_scheduler_status():
     except Exception as e:
         logger.error(f"Failed to get scheduler status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/cache-stats")
+def get_cache_stats():
+    """
+    Request-path cache status for the worker that served this request
+    (each Gunicorn worker has its own caches - repeat the call to sample others).
+    """
+    return {
+        "worker_pid": os.getpid(),
+        "citizen_profiles": citizen_cache.stats(),
+        "snapshots": [cache.info() for cache in (reference_cache, eligibility_cache, ranking_cache,
+                                                 demographic_cache, similarity_cache)]
+    }
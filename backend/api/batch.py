@@ -0,0 +1,260 @@
+"""
+Batch recommendations for bulk citizen scoring (outreach campaigns).
+
+Citizens are processed in chunks. Per chunk, demographics and provision
+history come from set-based queries (`= ANY(:ids)`). Engine outputs are
+memoized per group (district / block / demographic cluster × caste variant),
+so each group is computed once for the whole run. Results are streamed as
+NDJSON, one line per requested citizen, in request order.
+
+Offline CLI (same code path, writes NDJSON):
+    python -m backend.api.batch --phones-file phones.txt --out recs.ndjson
+    python -m backend.api.batch --citizen-ids-file ids.txt
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from typing import Dict, Iterator, List, Optional
+
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..database.connection import SessionLocal
+from ..cache.citizen import format_prov_date
+from ..inference.filters import is_general_caste
+from .recommend import (
+    RecommendRequest, engine_district, engine_block, engine_demographic,
+    engine_content, consolidate_recommendations
+)
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '2000'))
+HISTORY_LIMIT = 10
+
+# Same fallbacks as the single-citizen endpoint when a citizen column is empty
+_DEFAULTS = {name: RecommendRequest.model_fields[name].default for name in ("age", "gender", "caste", "religion")}
+
+
+class BatchRecommendRequest(BaseModel):
+    phones: List[str] = Field(default_factory=list, description="Citizen phone numbers")
+    citizen_ids: List[str] = Field(default_factory=list, description="Citizen IDs")
+
+
+# --- Set-based lookups ---
+
+def fetch_citizens(db: Session, phones: List[int], citizen_ids: List[str]) -> List[dict]:
+    rows = db.execute(text("""
+        SELECT citizen_id, citizen_phone, district_id, age,
+               ml_decode_attribute('gender', gender) AS gender,
+               ml_decode_attribute('caste', caste) AS caste,
+               ml_decode_attribute('religion', religion) AS religion
+        FROM ml_citizen_master
+        WHERE citizen_phone = ANY(:phones) OR citizen_id = ANY(:ids)
+    """), {"phones": phones, "ids": citizen_ids}).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def fetch_histories(db: Session, citizen_ids: List[str]) -> Dict[str, List[dict]]:
+    """Last HISTORY_LIMIT provisions per citizen, newest first, in one query."""
+    if not citizen_ids:
+        return {}
+    # LIMIT per citizen: the newest monthly partitions of ml_provision are read first and the rest skipped
+    rows = db.execute(text("""
+        SELECT h.customer_id, h.service_id, h.service_name, h.prov_date, h.bsk_id
+        FROM (SELECT DISTINCT unnest(CAST(:ids AS VARCHAR[])) AS customer_id) i
+        CROSS JOIN LATERAL (
+            SELECT p.customer_id, p.service_id, p.service_name, p.prov_date, p.bsk_id
+            FROM ml_provision p
+            WHERE p.customer_id = i.customer_id
+            ORDER BY p.prov_date DESC
+            LIMIT :limit
+        ) h
+        ORDER BY h.customer_id, h.prov_date DESC
+    """), {"ids": citizen_ids, "limit": HISTORY_LIMIT}).mappings().all()
+    histories: Dict[str, List[dict]] = {}
+    for r in rows:
+        histories.setdefault(r["customer_id"], []).append(dict(r))
+    return histories
+
+
+def fetch_bsk_blocks(db: Session, bsk_ids: List[int]) -> Dict[int, int]:
+    if not bsk_ids:
+        return {}
+    rows = db.execute(text("""
+        SELECT bsk_id, block_mun_id FROM ml_bsk_master
+        WHERE bsk_id = ANY(:ids) AND block_mun_id IS NOT NULL
+    """), {"ids": bsk_ids}).all()
+    return {int(bsk_id): int(block_id) for bsk_id, block_id in rows}
+
+
+# --- Grouped engine evaluation ---
+
+class GroupMemo:
+    """Engine outputs memoized by the inputs that actually determine them."""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self._memo = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key, compute):
+        if key in self._memo:
+            self.hits += 1
+            return self._memo[key]
+        self.misses += 1
+        value = self._memo[key] = compute()
+        return value
+
+    def district(self, district_id, caste):
+        if district_id is None:
+            return []
+        return self._get(("district", district_id, is_general_caste(caste)),
+                         lambda: engine_district(self.db, district_id, caste))
+
+    def block(self, block_id, caste):
+        if not block_id:
+            return []
+        return self._get(("block", block_id, is_general_caste(caste)),
+                         lambda: engine_block(self.db, block_id, caste))
+
+    def demographic(self, district_id, gender, caste, age, religion):
+        if district_id is None:
+            return []
+        # Under-18 / 60+ lists do not depend on the rest of the cluster key
+        band = "under18" if age < 18 else "above60" if age >= 60 else "youth"
+        key = ("demo", band) if band != "youth" else \
+            ("demo", district_id, gender, caste, 'Hindu' if religion == 'Hindu' else 'Minority')
+        return self._get(key, lambda: engine_demographic(self.db, district_id, gender, caste, age, religion))
+
+
+def _as_int(value) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def recommend_citizens(db: Session, phones: List[str], citizen_ids: List[str],
+                       chunk_size: int = BATCH_CHUNK_SIZE) -> Iterator[dict]:
+    """Yield one result dict per requested phone / citizen_id, in request order."""
+    memo = GroupMemo(db)
+    requested = [("phone", p) for p in phones] + [("citizen_id", c) for c in citizen_ids]
+
+    for start in range(0, len(requested), chunk_size):
+        chunk = requested[start:start + chunk_size]
+        chunk_phones = [n for n in (_as_int(v) for kind, v in chunk if kind == "phone") if n is not None]
+        chunk_ids = [v for kind, v in chunk if kind == "citizen_id"]
+
+        citizens = fetch_citizens(db, chunk_phones, chunk_ids)
+        by_phone = {}
+        by_id = {}
+        for c in citizens:
+            by_id.setdefault(c["citizen_id"], c)
+            if c["citizen_phone"] is not None:
+                by_phone.setdefault(int(c["citizen_phone"]), c)
+
+        histories = fetch_histories(db, list(by_id))
+        latest_bsk = {h[0]["bsk_id"] for h in histories.values() if h and h[0]["bsk_id"] is not None}
+        bsk_blocks = fetch_bsk_blocks(db, [int(b) for b in latest_bsk])
+
+        for kind, value in chunk:
+            citizen = by_phone.get(_as_int(value)) if kind == "phone" else by_id.get(value)
+            if citizen is None:
+                yield {"input": value, "input_type": kind, "citizen_exists": False,
+                       "citizen_id": None, "recommendations": [0]}
+                continue
+
+            age = citizen["age"] or _DEFAULTS["age"]
+            gender = citizen["gender"] or _DEFAULTS["gender"]
+            caste = citizen["caste"] or _DEFAULTS["caste"]
+            religion = citizen["religion"] or _DEFAULTS["religion"]
+            district_id = _as_int(citizen["district_id"])
+
+            history = histories.get(citizen["citizen_id"], [])
+            history_ids = [h["service_id"] for h in history]
+            block_id = None
+            if history and history[0]["bsk_id"] is not None:
+                block_id = bsk_blocks.get(int(history[0]["bsk_id"]))
+
+            content_recs = engine_content(db, history_ids, None, caste)
+            eligible = consolidate_recommendations(
+                db,
+                [memo.district(district_id, caste), memo.block(block_id, caste),
+                 memo.demographic(district_id, gender, caste, age, religion), *content_recs.values()],
+                age, gender, caste, religion
+            )
+            yield {
+                "input": value,
+                "input_type": kind,
+                "citizen_exists": True,
+                "citizen_id": citizen["citizen_id"],
+                "demographics": {"age": age, "gender": gender, "caste": caste},
+                "service_history": [{"service": h["service_name"], "date": format_prov_date(h["prov_date"])} for h in history],
+                "recommendations": [len(eligible)] + eligible,
+            }
+
+        logger.info(f"📦 Batch: {min(start + chunk_size, len(requested))}/{len(requested)} citizens "
+                    f"(group memo hits={memo.hits}, misses={memo.misses})")
+
+
+def _ndjson_stream(phones: List[str], citizen_ids: List[str]) -> Iterator[str]:
+    # Own session: the response body outlives the request dependency scope
+    db = SessionLocal()
+    try:
+        for result in recommend_citizens(db, phones, citizen_ids):
+            yield json.dumps(result, default=str) + "\n"
+    finally:
+        db.close()
+
+
+@router.post("/recommend/batch")
+def recommend_batch(req: BatchRecommendRequest):
+    """
+    Recommendations for many citizens at once, streamed as NDJSON
+    (one JSON object per line, same fields as /api/recommend plus
+    `input` / `input_type` echoing the requested phone or citizen_id).
+    """
+    logger.info(f"📦 Batch recommend: {len(req.phones)} phones, {len(req.citizen_ids)} citizen_ids")
+    return StreamingResponse(_ndjson_stream(req.phones, req.citizen_ids), media_type="application/x-ndjson")
+
+
+def _read_ids(path: Optional[str]) -> List[str]:
+    if not path:
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline batch recommendations (NDJSON output).")
+    parser.add_argument("--phones-file", help="File with one phone number per line")
+    parser.add_argument("--citizen-ids-file", help="File with one citizen_id per line")
+    parser.add_argument("--out", help="Output NDJSON file (default: stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    phones = _read_ids(args.phones_file)
+    citizen_ids = _read_ids(args.citizen_ids_file)
+    if not phones and not citizen_ids:
+        parser.error("Provide --phones-file and/or --citizen-ids-file")
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        for line in _ndjson_stream(phones, citizen_ids):
+            out.write(line)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
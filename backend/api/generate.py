@@ -1,12 +1,29 @@
+import os
 import logging
-from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 from fastapi import APIRouter, Depends, HTTPException, Path
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from enum import Enum
 
-from ..database.connection import get_db
-from ..database.models import RegenerationLog
+from ..database.connection import get_db, engine, SessionLocal
+from ..database.models import RegenerationLog, GroupedDF, ClusterServiceMap, DistrictTopService, BlockTopService
+from ..database.regen_aggregates import (
+    ingest_watermark, last_watermark, last_full_rebuild, reset_aggregates,
+    apply_district_window, apply_block_window, apply_cluster_window, insert_clusters, clusters_match_registry, add_missing_clusters,
+    rank_districts, rank_blocks, rank_clusters,
+    build_scan_aggregate, seed_aggregates_from_scan, insert_clusters_from_scan,
+    DISTRICT_AGGREGATES, BLOCK_AGGREGATES, CLUSTER_AGGREGATES
+)
+from ..database.table_swap import (
+    create_shadow_table, build_shadow_indexes, drop_shadow_table, swap_in_transaction, restore_previous
+)
+from ..database.generations import publish_generation
+from ..cache import bump_marker, demographic_cache, RANKINGS_MARKER, DEMOGRAPHIC_MARKER
+from ..cache.demographic import latest_demographic_version
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -18,10 +35,285 @@ class RegenerationType(str, Enum):
     DEMOGRAPHIC = "demographic"
     ALL = "all"
 
+class RegenerationMode(str, Enum):
+    """full = recount all provision history; incremental = fold in rows ingested since the last run"""
+    FULL = "full"
+    INCREMENTAL = "incremental"
+
+DEFAULT_REGENERATION_MODE = RegenerationMode(os.getenv("REGENERATION_MODE", "incremental").lower())
+# Build the demographic / district / block stages concurrently, each on its own pooled connection
+# (not used by single-scan full rebuilds, which are faster than the parallel per-output scans)
+REGENERATION_PARALLEL = os.getenv("REGENERATION_PARALLEL", "true").lower() == "true"
+# type=all full rebuilds: seed every counter from one provision/citizen scan instead of one per output
+REGENERATION_SINGLE_SCAN = os.getenv("REGENERATION_SINGLE_SCAN", "true").lower() == "true"
+# Incremental runs never re-attribute citizens whose district / age_group changed after their
+# provisions were counted: recount everything with current attributes at least this often (0 = never)
+REGENERATION_FULL_EVERY_DAYS = int(os.getenv("REGENERATION_FULL_EVERY_DAYS", "28"))
+# Advisory lock key that serializes regenerations and rollbacks across workers
+REGENERATION_LOCK_ID = 7262001
+
+def resolve_mode(db: Session, mode: RegenerationMode, table_name: str) -> Tuple[RegenerationMode, Optional[datetime]]:
+    """
+    (effective mode, window start). Incremental needs a previous watermark and a
+    full rebuild within REGENERATION_FULL_EVERY_DAYS - otherwise full.
+    """
+    if mode == RegenerationMode.INCREMENTAL:
+        since = last_watermark(db, table_name)
+        if since is None:
+            logger.info(f"No previous watermark for {table_name} - running a full rebuild")
+        elif REGENERATION_FULL_EVERY_DAYS > 0 and (
+            (last_full_rebuild(db, table_name) or datetime.min) < datetime.now() - timedelta(days=REGENERATION_FULL_EVERY_DAYS)
+        ):
+            logger.info(f"No full rebuild of {table_name} in {REGENERATION_FULL_EVERY_DAYS} days - running one "
+                        f"(re-attributes citizens whose district / demographics changed)")
+        else:
+            return RegenerationMode.INCREMENTAL, since
+    return RegenerationMode.FULL, None
+
+def log_regeneration(db: Session, table_name: str, rows: int, duration: float,
+                     mode: RegenerationMode, watermark: Optional[datetime] = None,
+                     status: str = "staged") -> RegenerationLog:
+    """Stage outputs are logged as 'staged' and flipped to 'success' by the publish that swaps them in."""
+    entry = RegenerationLog(
+        table_name=table_name,
+        rows_generated=rows,
+        duration_seconds=duration,
+        status=status,
+        triggered_by="api",
+        mode=mode.value,
+        watermark=watermark
+    )
+    db.add(entry)
+    return entry
+
+@contextmanager
+def regeneration_lock():
+    """
+    Hold the regeneration advisory lock on a dedicated autocommit connection
+    (stage and publish sessions commit independently). 409 if another
+    regeneration or rollback is running.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": REGENERATION_LOCK_ID}).scalar():
+            raise HTTPException(status_code=409, detail="A regeneration or rollback is already running")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": REGENERATION_LOCK_ID})
+
+OUTPUT_TABLES = ["grouped_df", "cluster_service_map", "district_top_services", "block_wise_top_services"]
+
+# Declared before /regenerate/{type} so "rollback" is not parsed as a RegenerationType
+@router.post("/regenerate/rollback")
+def rollback_regeneration(db: Session = Depends(get_db)):
+    """
+    Swap the previous generation of the output tables (kept as <table>_prev by
+    the last regeneration) back in. Calling it again rolls forward.
+    The next regeneration after a rollback recounts all history (mode=full).
+    """
+    with regeneration_lock():
+        try:
+            restored = restore_previous(db, OUTPUT_TABLES)
+            if not restored:
+                raise HTTPException(status_code=404, detail="No previous generation to roll back to")
+            version = publish_generation(db, restored)
+            for table_name in restored:
+                db.add(RegenerationLog(
+                    table_name=table_name,
+                    rows_generated=db.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar(),
+                    duration_seconds=0,
+                    status="rolled_back",
+                    triggered_by="api",
+                    version=version
+                ))
+            db.commit()
+        except HTTPException:
+            raise
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Regeneration rollback failed: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    bump_marker(RANKINGS_MARKER)
+    if "cluster_service_map" in restored or "grouped_df" in restored:
+        bump_marker(DEMOGRAPHIC_MARKER, latest_demographic_version(db))
+        demographic_cache.reload(db)
+    
+    logger.info(f"⏪ Rolled back to the previous generation {version}: {', '.join(restored)}")
+    return {"status": "success", "restored": restored, "version": version, "timestamp": datetime.now().isoformat()}
+
+# ------------------------------------------------------------------------------
+# Stages: each builds its outputs into <table>_staging (nothing live is touched)
+# ------------------------------------------------------------------------------
+
+class StagePlan(NamedTuple):
+    mode: RegenerationMode
+    since: Optional[datetime]  # window start (incremental)
+    watermark: datetime        # window end, shared by every stage of the run
+    seeded: bool = False       # counters (and grouped_df) come from this session's single scan
+
+class StageResult(NamedTuple):
+    tables: Dict[str, tuple]   # live table name → (live Table, staging Table)
+    log_ids: List[int]         # 'staged' regeneration_log rows, flipped to 'success' on publish
+    files: List[str]
+    partitions: Dict[str, object]
+    duration: float
+
+def _stage_table(db: Session, tables: Dict[str, tuple], model) -> str:
+    """Create the staging table the new generation of `model` is written to."""
+    live = model.__table__
+    tables[live.name] = (live, create_shadow_table(db, live))
+    return tables[live.name][1].name
+
+def _finish_stage(db: Session, tables: Dict[str, tuple], logs: List[RegenerationLog], files: List[str],
+                  partitions: Dict[str, object], started: datetime) -> StageResult:
+    for live, shadow in tables.values():
+        build_shadow_indexes(db, live, shadow)
+    db.flush()
+    return StageResult(tables, [entry.id for entry in logs], files, partitions,
+                       (datetime.now() - started).total_seconds())
+
+def demographic_stage(db: Session, plan: StagePlan) -> StageResult:
+    """grouped_df + cluster_service_map"""
+    started = datetime.now()
+    tables, logs, partitions = {}, [], {}
+    
+    # 1a. Generate grouped_df
+    table_start = datetime.now()
+    grouped = _stage_table(db, tables, GroupedDF)
+    if plan.seeded:
+        row_count = insert_clusters_from_scan(db, grouped)
+        changed_clusters = None
+    elif plan.mode == RegenerationMode.FULL:
+        logger.info("Generating grouped_df...")
+        row_count = insert_clusters(db, grouped)
+        reset_aggregates(db, CLUSTER_AGGREGATES)
+        apply_cluster_window(db, None, plan.watermark)
+        changed_clusters = None
+    else:
+        # New clusters only: clusters seen in the window that grouped_df does not have yet
+        changed_clusters = apply_cluster_window(db, plan.since, plan.watermark)
+        db.execute(text(f"INSERT INTO {grouped} SELECT * FROM grouped_df"))
+        row_count = add_missing_clusters(db, grouped, changed_clusters)
+    
+    duration = (datetime.now() - table_start).total_seconds()
+    logs.append(log_regeneration(db, "grouped_df", row_count, duration, plan.mode))
+    logger.info(f"✅ grouped_df ({plan.mode.value}): {row_count:,} rows in {duration:.2f}s")
+    
+    # 1b. Generate cluster_service_map
+    table_start = datetime.now()
+    logger.info("Generating cluster_service_map...")
+    
+    row_count = rank_clusters(db, _stage_table(db, tables, ClusterServiceMap), grouped, changed_clusters,
+                              carry_from="cluster_service_map")
+    duration = (datetime.now() - table_start).total_seconds()
+    logs.append(log_regeneration(db, "cluster_service_map", row_count, duration, plan.mode, plan.watermark))
+    partitions["cluster_service_map"] = "all" if changed_clusters is None else len(changed_clusters)
+    logger.info(f"✅ cluster_service_map ({plan.mode.value}): {row_count:,} rows for "
+                f"{partitions['cluster_service_map']} clusters in {duration:.2f}s")
+    
+    return _finish_stage(db, tables, logs, ["grouped_df", "final_df", "cluster_service_map.pkl"], partitions, started)
+
+def district_stage(db: Session, plan: StagePlan) -> StageResult:
+    """district_top_services"""
+    started = datetime.now()
+    tables, partitions = {}, {}
+    logger.info("Generating district_top_services...")
+    
+    if plan.mode == RegenerationMode.FULL:
+        if not plan.seeded:
+            reset_aggregates(db, DISTRICT_AGGREGATES)
+            apply_district_window(db, None, plan.watermark)
+        changed_districts = None
+    else:
+        changed_districts = apply_district_window(db, plan.since, plan.watermark)
+    
+    row_count = rank_districts(db, _stage_table(db, tables, DistrictTopService), changed_districts,
+                               carry_from="district_top_services")
+    duration = (datetime.now() - started).total_seconds()
+    logs = [log_regeneration(db, "district_top_services", row_count, duration, plan.mode, plan.watermark)]
+    partitions["district_top_services"] = "all" if changed_districts is None else len(changed_districts)
+    logger.info(f"✅ district_top_services ({plan.mode.value}): {row_count:,} rows for "
+                f"{partitions['district_top_services']} districts in {duration:.2f}s")
+    
+    return _finish_stage(db, tables, logs, ["district_top_services"], partitions, started)
+
+def block_stage(db: Session, plan: StagePlan) -> StageResult:
+    """block_wise_top_services"""
+    started = datetime.now()
+    tables, partitions = {}, {}
+    logger.info("Generating block_wise_top_services...")
+    
+    if plan.mode == RegenerationMode.FULL:
+        if not plan.seeded:
+            reset_aggregates(db, BLOCK_AGGREGATES)
+            apply_block_window(db, None, plan.watermark)
+        changed_blocks = None
+    else:
+        changed_blocks = apply_block_window(db, plan.since, plan.watermark)
+    
+    row_count = rank_blocks(db, _stage_table(db, tables, BlockTopService), changed_blocks,
+                            carry_from="block_wise_top_services")
+    duration = (datetime.now() - started).total_seconds()
+    logs = [log_regeneration(db, "block_wise_top_services", row_count, duration, plan.mode, plan.watermark)]
+    partitions["block_wise_top_services"] = "all" if changed_blocks is None else len(changed_blocks)
+    logger.info(f"✅ block_wise_top_services ({plan.mode.value}): {row_count:,} rows for "
+                f"{partitions['block_wise_top_services']} blocks in {duration:.2f}s")
+    
+    return _finish_stage(db, tables, logs, ["block_top_services"], partitions, started)
+
+# stage → (builder, table whose watermark drives its mode)
+STAGES: Dict[str, Tuple[Callable[[Session, StagePlan], StageResult], str]] = {
+    "demographic": (demographic_stage, "cluster_service_map"),
+    "district": (district_stage, "district_top_services"),
+    "block": (block_stage, "block_wise_top_services"),
+}
+
+STAGES_BY_TYPE = {
+    RegenerationType.DEMOGRAPHIC: ["demographic"],
+    RegenerationType.DISTRICT: ["district"],
+    RegenerationType.BLOCK: ["block"],
+    RegenerationType.ALL: ["demographic", "district", "block"],
+}
+
+def _run_stage_in_session(name: str, plan: StagePlan) -> StageResult:
+    """Build one stage on its own pooled connection and commit its staging tables (published later)."""
+    db = SessionLocal()
+    try:
+        result = STAGES[name][0](db, plan)
+        db.commit()
+        logger.info(f"   🧱 Stage {name} staged in {result.duration:.2f}s")
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _discard_staged(results: Dict[str, StageResult]):
+    """Drop the committed staging tables of a generation that will not be published."""
+    db = SessionLocal()
+    try:
+        for result in results.values():
+            for _, shadow in result.tables.values():
+                drop_shadow_table(db, shadow.name)
+        log_ids = [i for result in results.values() for i in result.log_ids]
+        if log_ids:
+            # The counters these stages advanced are ahead of the live outputs now: next run goes full
+            db.query(RegenerationLog).filter(RegenerationLog.id.in_(log_ids)).update(
+                {"status": "discarded"}, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to discard staged tables: {e}")
+    finally:
+        db.close()
+
 @router.post("/regenerate/{type}")
-async def regenerate_files(
+def regenerate_files(
     type: RegenerationType = Path(..., description="Type of files to regenerate: district, block, demographic, or all"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    mode: RegenerationMode = DEFAULT_REGENERATION_MODE
 ):
     """
     Regenerate pre-computed recommendation files from database.
@@ -30,231 +322,128 @@ async def regenerate_files(
     - **block**: Regenerate block-wise recommendations only
     - **demographic**: Regenerate demographic clustering files only
     - **all**: Regenerate all recommendation files
+    
+    Each output is built in <table>_staging and swapped in at commit, so
+    recommendation reads never wait on the aggregation; the replaced
+    generation is kept as <table>_prev (see /regenerate/rollback).
+    
+    `mode=incremental` (default) folds the ml_provision rows ingested since the
+    last successful run into the regen_* counter tables and re-ranks only the
+    districts / blocks / clusters whose counts changed. `mode=full` recounts
+    all history (and is used automatically when there is no previous run).
+    
+    A full rebuild of `all` derives every output from a single pass over the
+    provision/citizen join (REGENERATION_SINGLE_SCAN), logged as provision_scan.
+    Otherwise the demographic, district and block stages are independent: with
+    REGENERATION_PARALLEL they are built concurrently on separate connections.
+    Either way the outputs are published together by one transaction that swaps
+    every staging table in and advances the regeneration_version pointer. If
+    any stage fails, nothing is published.
     """
+    with regeneration_lock():
+        return _regenerate(type, db, mode)
+
+def _regenerate(type: RegenerationType, db: Session, mode: RegenerationMode):
     start_time = datetime.now()
-    logger.info(f"Starting regeneration: type={type}")
+    logger.info(f"Starting regeneration: type={type}, mode={mode}")
     
-    district_files = []
-    block_files = []
-    demographic_files = []
+    stages = STAGES_BY_TYPE[type]
+    parallel = REGENERATION_PARALLEL and len(stages) > 1
+    results: Dict[str, StageResult] = {}
     
     try:
-        # Determine which files to generate based on type
-        generate_district = type in [RegenerationType.DISTRICT, RegenerationType.ALL]
-        generate_block = type in [RegenerationType.BLOCK, RegenerationType.ALL]
-        generate_demographic = type in [RegenerationType.DEMOGRAPHIC, RegenerationType.ALL]
+        # One upper bound for every output of this run (rows ingested later go to the next run)
+        watermark = ingest_watermark(db)
         
-        # 1. Generate DEMOGRAPHIC files (grouped_df, cluster_service_map)
-        if generate_demographic:
-            # 1a. Generate grouped_df
-            table_start = datetime.now()
-            logger.info("Generating grouped_df...")
-            
-            db.execute(text("TRUNCATE TABLE grouped_df"))
-            
-            query = text("""
-                INSERT INTO grouped_df (cluster_id, district_id, gender, caste, age_group, religion_group)
-                SELECT 
-                    ROW_NUMBER() OVER () as cluster_id,
-                    district_id,
-                    gender,
-                    caste,
-                    CASE 
-                        WHEN age < 18 THEN 'child'
-                        WHEN age < 60 THEN 'youth'
-                        ELSE 'elderly'
-                    END as age_group,
-                    CASE 
-                        WHEN religion = 'Hindu' THEN 'Hindu'
-                        ELSE 'Minority'
-                    END as religion_group
-                FROM ml_citizen_master
-                GROUP BY 
-                    district_id,
-                    gender,
-                    caste,
-                    CASE 
-                        WHEN age < 18 THEN 'child'
-                        WHEN age < 60 THEN 'youth'
-                        ELSE 'elderly'
-                    END,
-                    CASE 
-                        WHEN religion = 'Hindu' THEN 'Hindu'
-                        ELSE 'Minority'
-                    END;
-            """)
-            db.execute(query)
-            
-            row_count = db.execute(text("SELECT COUNT(*) FROM grouped_df")).scalar()
-            duration = (datetime.now() - table_start).total_seconds()
-            
-            log_entry = RegenerationLog(
-                table_name="grouped_df",
-                rows_generated=row_count,
-                duration_seconds=duration,
-                status="success",
-                triggered_by="api"
-            )
-            db.add(log_entry)
-            
-            demographic_files.append("grouped_df")
-            logger.info(f"✅ grouped_df: {row_count:,} rows in {duration:.2f}s")
-            
-            # 1b. Generate cluster_service_map
-            table_start = datetime.now()
-            logger.info("Generating cluster_service_map...")
-            
-            db.execute(text("TRUNCATE TABLE cluster_service_map"))
-            
-            query = text("""
-                INSERT INTO cluster_service_map (cluster_id, service_id, rank)
-                WITH cluster_services AS (
-                    SELECT 
-                        g.cluster_id,
-                        p.service_id,
-                        COUNT(*) as usage_count
-                    FROM grouped_df g
-                    JOIN ml_citizen_master c ON 
-                        c.district_id = g.district_id AND
-                        c.gender = g.gender AND
-                        c.caste = g.caste AND
-                        (CASE WHEN c.age < 18 THEN 'child' WHEN c.age < 60 THEN 'youth' ELSE 'elderly' END) = g.age_group AND
-                        (CASE WHEN c.religion = 'Hindu' THEN 'Hindu' ELSE 'Minority' END) = g.religion_group
-                    JOIN ml_provision p ON c.citizen_id = p.customer_id
-                    GROUP BY g.cluster_id, p.service_id
-                )
-                SELECT 
-                    cluster_id,
-                    service_id,
-                    RANK() OVER (PARTITION BY cluster_id ORDER BY usage_count DESC) as rank
-                FROM cluster_services;
-            """)
-            db.execute(query)
-            
-            row_count = db.execute(text("SELECT COUNT(*) FROM cluster_service_map")).scalar()
-            duration = (datetime.now() - table_start).total_seconds()
-            
-            log_entry = RegenerationLog(
-                table_name="cluster_service_map",
-                rows_generated=row_count,
-                duration_seconds=duration,
-                status="success",
-                triggered_by="api"
-            )
-            db.add(log_entry)
-            
-            demographic_files.append("final_df")
-            demographic_files.append("cluster_service_map.pkl")
-            logger.info(f"✅ cluster_service_map: {row_count:,} rows in {duration:.2f}s")
-
-        # 2. Generate DISTRICT files (district_top_services)
-        if generate_district:
-            table_start = datetime.now()
-            logger.info("Generating district_top_services...")
-            
-            db.execute(text("TRUNCATE TABLE district_top_services"))
-            
-            query = text("""
-                INSERT INTO district_top_services (district_id, district_name, service_id, service_name, unique_citizen_count, citizen_percentage, rank_in_district)
-                WITH district_service_counts AS (
-                    SELECT 
-                        c.district_id,
-                        d.district_name,
-                        p.service_id,
-                        p.service_name,
-                        COUNT(DISTINCT p.customer_id) as unique_citizen_count
-                    FROM ml_provision p
-                    JOIN ml_citizen_master c ON p.customer_id = c.citizen_id
-                    JOIN ml_district d ON c.district_id = d.district_id
-                    GROUP BY c.district_id, d.district_name, p.service_id, p.service_name
-                ),
-                district_totals AS (
-                    SELECT district_id, COUNT(DISTINCT customer_id) as total_citizens
-                    FROM ml_provision p
-                    JOIN ml_citizen_master c ON p.customer_id = c.citizen_id
-                    GROUP BY c.district_id
-                )
-                SELECT 
-                    dsc.district_id,
-                    dsc.district_name,
-                    dsc.service_id,
-                    dsc.service_name,
-                    dsc.unique_citizen_count,
-                    COALESCE(ROUND((dsc.unique_citizen_count::DECIMAL /NULLIF(dt.total_citizens, 0)) * 100, 2), 0) as citizen_percentage,
-                    RANK() OVER (PARTITION BY dsc.district_id ORDER BY dsc.unique_citizen_count DESC) as rank_in_district
-                FROM district_service_counts dsc
-                JOIN district_totals dt ON dsc.district_id = dt.district_id;
-            """)
-            db.execute(query)
-            
-            row_count = db.execute(text("SELECT COUNT(*) FROM district_top_services")).scalar()
-            duration = (datetime.now() - table_start).total_seconds()
-            
-            log_entry = RegenerationLog(
-                table_name="district_top_services",
-                rows_generated=row_count,
-                duration_seconds=duration,
-                status="success",
-                triggered_by="api"
-            )
-            db.add(log_entry)
-            
-            district_files.append("district_top_services")
-            logger.info(f"✅ district_top_services: {row_count:,} rows in {duration:.2f}s")
-
-        # 3. Generate BLOCK files (block_wise_top_services)
-        if generate_block:
+        plans = {}
+        for name in stages:
+            stage_mode, since = resolve_mode(db, mode, STAGES[name][1])
+            if name == "demographic" and stage_mode == RegenerationMode.INCREMENTAL and not clusters_match_registry(db):
+                logger.info("grouped_df ids predate ml_citizen_cluster - running a full rebuild")
+                stage_mode, since = RegenerationMode.FULL, None
+            plans[name] = StagePlan(stage_mode, since, watermark)
+        
+        # 0. Everything is rebuilt from scratch in this session: one pass over the provision/citizen
+        # join feeds grouped_df and all counter tables (instead of a scan per output). This beats
+        # running the per-output scans in parallel, so it takes precedence over REGENERATION_PARALLEL.
+        single_scan = (
+            REGENERATION_SINGLE_SCAN and type == RegenerationType.ALL
+            and all(plan.mode == RegenerationMode.FULL for plan in plans.values())
+        )
+        parallel = parallel and not single_scan
+        scan_logs = []
+        if single_scan:
             table_start = datetime.now()
-            logger.info("Generating block_wise_top_services...")
+            logger.info("Scanning ml_provision ⟗ ml_citizen_master once for all outputs...")
             
-            db.execute(text("TRUNCATE TABLE block_wise_top_services"))
-            
-            query = text("""
-                INSERT INTO block_wise_top_services (block_id, service_name, block_name, rank_in_block)
-                WITH block_service_counts AS (
-                    SELECT 
-                        b.block_mun_id as block_id,
-                        b.block_municipalty_name as block_name,
-                        p.service_name,
-                        COUNT(DISTINCT p.customer_id) as unique_citizen_count
-                    FROM ml_provision p
-                    JOIN ml_bsk_master b ON p.bsk_id = b.bsk_id
-                    WHERE b.block_mun_id IS NOT NULL
-                    GROUP BY b.block_mun_id, b.block_municipalty_name, p.service_name
-                )
-                SELECT 
-                    bsc.block_id,
-                    bsc.service_name,
-                    bsc.block_name,
-                    RANK() OVER (PARTITION BY bsc.block_id ORDER BY bsc.unique_citizen_count DESC) as rank_in_block
-                FROM block_service_counts bsc;
-            """)
-            db.execute(query)
-            
-            row_count = db.execute(text("SELECT COUNT(*) FROM block_wise_top_services")).scalar()
+            row_count = build_scan_aggregate(db, watermark)
+            reset_aggregates(db, CLUSTER_AGGREGATES + DISTRICT_AGGREGATES + BLOCK_AGGREGATES)
+            seeded = seed_aggregates_from_scan(db)
             duration = (datetime.now() - table_start).total_seconds()
-            
-            log_entry = RegenerationLog(
-                table_name="block_wise_top_services",
-                rows_generated=row_count,
-                duration_seconds=duration,
-                status="success",
-                triggered_by="api"
-            )
-            db.add(log_entry)
-            
-            block_files.append("block_top_services")
-            logger.info(f"✅ block_wise_top_services: {row_count:,} rows in {duration:.2f}s")
-            
+            scan_logs.append(log_regeneration(db, "provision_scan", row_count, duration, RegenerationMode.FULL, watermark))
+            logger.info(f"✅ provision scan: {row_count:,} aggregate rows → "
+                        f"{sum(seeded.values()):,} counter rows in {duration:.2f}s")
+            plans = {name: plan._replace(seeded=True) for name, plan in plans.items()}
+        
+        # 1. Build the stages: concurrently on their own connections (each commits its
+        # staging tables), or one after another in this session's transaction
+        if parallel:
+            db.commit()  # nothing written yet - do not sit idle in a transaction while the stages run
+            with ThreadPoolExecutor(max_workers=len(stages), thread_name_prefix="regen-stage") as pool:
+                futures = {name: pool.submit(_run_stage_in_session, name, plans[name]) for name in stages}
+            errors = {}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    errors[name] = e
+            if errors:
+                name, error = next(iter(errors.items()))
+                raise RuntimeError(f"Stage {name} failed: {error}") from error
+        else:
+            for name in stages:
+                results[name] = STAGES[name][0](db, plans[name])
+        
+        # 2. Publish: swap every staging table in and advance the version pointer in one
+        # transaction. Readers only wait for the renames; the replaced tables stay as <table>_prev.
+        tables = {live: shadow for result in results.values() for live, shadow in result.tables.values()}
+        swap_in_transaction(db, [(live.name, shadow.name) for live, shadow in tables.items()])
+        version = publish_generation(db, [live.name for live in tables])
+        db.flush()
+        log_ids = [entry.id for entry in scan_logs] + [i for result in results.values() for i in result.log_ids]
+        db.query(RegenerationLog).filter(RegenerationLog.id.in_(log_ids)).update(
+            {"status": "success", "version": version}, synchronize_session=False)
         db.commit()
         total_duration = (datetime.now() - start_time).total_seconds()
         
+        # New rankings are committed - every worker rebuilds its in-memory top-N store
+        if "district" in results or "block" in results:
+            bump_marker(RANKINGS_MARKER)
+        
+        # Build the demographic lookup table right away in this worker, tagged with
+        # the regeneration timestamp; other workers see the marker and follow
+        if "demographic" in results:
+            bump_marker(DEMOGRAPHIC_MARKER, latest_demographic_version(db))
+            demographic_cache.reload(db)
+        
         # Build response based on what was generated
+        partitions = {k: v for result in results.values() for k, v in result.partitions.items()}
         response = {
             "status": "success",
+            "mode": mode.value,
+            "version": version,
+            "parallel": parallel,
+            "single_scan": single_scan,
+            "stage_seconds": {name: round(result.duration, 2) for name, result in results.items()},
+            "watermark": watermark.isoformat(),
+            "partitions_reranked": partitions,
             "timestamp": datetime.now().isoformat()
         }
         
+        district_files = results["district"].files if "district" in results else []
+        block_files = results["block"].files if "block" in results else []
+        demographic_files = results["demographic"].files if "demographic" in results else []
+        
         if type == RegenerationType.ALL:
             response["message"] = "All files regenerated successfully"
             response["district_files"] = district_files
@@ -270,12 +459,14 @@ async def regenerate_files(
             response["message"] = "Demographic files regenerated successfully"
             response["demographic_files"] = demographic_files
         
-        logger.info(f"🎉 Regeneration complete! Total time: {total_duration:.2f}s")
+        logger.info(f"🎉 Regeneration complete! Generation {version}, total time: {total_duration:.2f}s")
         
         return response
-        
+    
     except Exception as e:
         db.rollback()
+        if parallel:
+            _discard_staged(results)
         total_duration = (datetime.now() - start_time).total_seconds()
         logger.error(f"Regeneration failed after {total_duration:.2f}s: {e}")
         
@@ -293,5 +484,5 @@ async def regenerate_files(
             db.commit()
         except:
             pass
-            
+        
         raise HTTPException(status_code=500, detail=str(e))
@@ -2,15 +2,22 @@ import logging
 import math
 import json
 import os
-import pandas as pd
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func, desc, or_
-from typing import List, Optional, Dict, Any
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, func, desc, or_, select
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel, Field
 from datetime import date
 
-from ..database.connection import get_db
+from ..database.connection import get_async_db, SessionLocal
+from ..cache import reference_cache, eligibility_cache, ranking_cache, demographic_cache, similarity_cache, citizen_cache
+from ..cache.citizen import CitizenProfile, HistoryEntry, CITIZEN_HISTORY_LIMIT, format_prov_date
+from ..cache.rankings import RANKING_CACHE_DEPTH
+from ..inference.eligibility import find_eligibility_rule, rule_allows
+from ..inference.filters import block_service_filter
+from ..utils.static_lists import under18_services, above60_services
 from ..database.models import (
     CitizenMaster, Provision, District, BSKMaster, Service, 
     ServiceEligibility, DistrictTopService, BlockTopService,
@@ -34,58 +41,26 @@ class RecommendRequest(BaseModel):
 
 # --- Helper Functions (Engines) ---
 
-def block_service_filter(service_name: str, caste: str) -> bool:
-    """Filter out birth/death and caste-specific services for General."""
-    if not service_name:
-        return False
-    s = service_name.lower()
-    if "birth" in s or "death" in s:
-        return False
-    if caste and caste.lower() == "general" and "caste" in s:
-        return False
-    return True
+def _snapshot(cache, db: Optional[Session]):
+    """
+    The cache's snapshot for this call. db=None is the async path: ensure_snapshots()
+    already refreshed the caches in the threadpool, so take what is loaded (peek)
+    rather than risk a synchronous reload on the event loop.
+    """
+    return cache.get() if db is not None else cache.peek()
 
 def check_eligibility(db: Session, service_name: str, age: int, gender: str, caste: str, religion: str) -> bool:
-    """Check service eligibility against services_eligibility table."""
-    # Find service rules
-    # Note: services_eligibility might have multiple entries or map by name. 
-    # Ideally link by ID but Streamlit used Name. Using Name for consistency with legacy.
-    rule = db.query(ServiceEligibility).filter(
-        func.lower(ServiceEligibility.service_name) == func.lower(service_name)
-    ).first()
-    
-    if not rule:
-        return True # Default to allow if no specific rules found
-        
-    # 1. Age Check
-    if rule.min_age is not None and age < rule.min_age: return False
-    if rule.max_age is not None and age > rule.max_age: return False
-    
-    # 2. Universal Check
-    if rule.for_all: return True
-    
-    # 3. Caste Check
-    if caste == 'SC' and not rule.is_sc: return False
-    if caste == 'ST' and not rule.is_st: return False
-    if caste == 'OBC-A' and not rule.is_obc_a: return False
-    if caste == 'OBC-B' and not rule.is_obc_b: return False
-    if caste == 'General':
-        # General cannot take caste-specific schemes
-        if rule.is_sc or rule.is_st or rule.is_obc_a or rule.is_obc_b: return False
-        
-    # 4. Gender Check
-    if gender == 'Female' and not rule.is_female: return False # Assuming is_female means ONLY female? Verification needed. 
-    # Streamlit Logic: if user=Male and is_female=1 -> False.
-    if gender == 'Male' and rule.is_female: return False 
-    
-    # 5. Religion Check
-    is_minority = religion not in ['Hindu']
-    if not is_minority and rule.is_minority: return False # Hindu user, Minority scheme
-    if is_minority and not rule.is_minority: return False # Warning: This logic assumes non-minority schemes are Hindu only? 
-    # Streamlit Logic: if is_minority and rule.is_minority==0 -> False. 
-    # This implies schemes are either for Minority or Not (Hindu). 
-    
-    return True
+    """Check service eligibility against services_eligibility table (one query per call)."""
+    # Note: services_eligibility maps by name - Streamlit used Name, kept for consistency with legacy.
+    rule = find_eligibility_rule(db, service_name)
+    return rule_allows(rule, age, gender, caste, religion)
+
+def filter_eligible(db: Session, service_names: List[str], age: int, gender: str, caste: str, religion: str) -> List[str]:
+    """Filter a whole candidate set in one vectorized pass; per-candidate queries only as fallback."""
+    matrix = _snapshot(eligibility_cache, db)
+    if matrix is not None:
+        return matrix.filter(service_names, age, gender, caste, religion)
+    return [s for s in service_names if check_eligibility(db, s, age, gender, caste, religion)]
 
 def get_citizen_by_phone(db: Session, phone: str):
     try:
@@ -107,25 +82,34 @@ def get_block_id_from_history(db: Session, citizen_id: str):
     return None
 
 def get_district_id_by_name(db: Session, district_name: str) -> Optional[int]:
-    """Convert district name to district_id"""
+    """Convert district name to district_id (in-memory snapshot, DB fallback)"""
+    snapshot = _snapshot(reference_cache, db)
+    if snapshot is not None:
+        return snapshot.district_id(district_name)
     district = db.query(District).filter(
         func.lower(District.district_name) == func.lower(district_name)
     ).first()
     return district.district_id if district else None
 
 def get_block_id_by_name(db: Session, block_name: str) -> Optional[int]:
-    """Convert block name to block_id"""
+    """Convert block name to block_id (in-memory snapshot, DB fallback)"""
     if not block_name or block_name.lower() == "none":
         return None
+    snapshot = _snapshot(reference_cache, db)
+    if snapshot is not None:
+        return snapshot.block_id(block_name)
     bsk = db.query(BSKMaster).filter(
         func.lower(BSKMaster.block_municipalty_name) == func.lower(block_name)
     ).first()
     return bsk.block_mun_id if bsk else None
 
 def get_service_id_by_name(db: Session, service_name: str) -> Optional[int]:
-    """Convert service name to service_id"""
+    """Convert service name to service_id (in-memory snapshot, DB fallback)"""
     if not service_name:
         return None
+    snapshot = _snapshot(reference_cache, db)
+    if snapshot is not None:
+        return snapshot.service_id(service_name)
     service = db.query(Service).filter(
         func.lower(Service.service_name) == func.lower(service_name)
     ).first()
@@ -134,6 +118,10 @@ def get_service_id_by_name(db: Session, service_name: str) -> Optional[int]:
 # --- Main Engines ---
 
 def engine_district(db: Session, district_id: int, caste: str, limit: int = 5) -> List[str]:
+    rankings = _snapshot(ranking_cache, db)
+    if rankings is not None and limit <= RANKING_CACHE_DEPTH:
+        return rankings.district_top(district_id, caste, limit)
+    
     recs = db.query(DistrictTopService.service_name).filter(
         DistrictTopService.district_id == district_id
     ).order_by(DistrictTopService.rank_in_district).all()
@@ -147,6 +135,10 @@ def engine_district(db: Session, district_id: int, caste: str, limit: int = 5) -
 
 def engine_block(db: Session, block_id: int, caste: str, limit: int = 5) -> List[str]:
     if not block_id: return []
+    rankings = _snapshot(ranking_cache, db)
+    if rankings is not None and limit <= RANKING_CACHE_DEPTH:
+        return rankings.block_top(block_id, caste, limit)
+    
     recs = db.query(BlockTopService.service_name).filter(
         BlockTopService.block_id == block_id
     ).order_by(BlockTopService.rank_in_block).all()
@@ -160,27 +152,21 @@ def engine_block(db: Session, block_id: int, caste: str, limit: int = 5) -> List
 
 def engine_demographic(db: Session, district_id: int, gender: str, caste: str, age: int, religion: str, limit: int = 5) -> List[str]:
     # Age Groups
-    # Static CSV paths
-    DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
-    
+    # Static CSV lists (parsed once per file change, shared with inference/demo.py)
     if age < 18:
-        # Read from static CSV
         try:
-            csv_path = os.path.join(DATA_DIR, "under18_top_services.csv")
-            if os.path.exists(csv_path):
-                df = pd.read_csv(csv_path)
-                return df['service_name'].tolist()
+            services = under18_services()
+            if services is not None:
+                return list(services)
         except Exception as e:
             logger.error(f"Error reading under18 CSV: {e}")
         return ["Student Credit Card", "Kanyashree", "Aikyasree", "Sikshashree", "Pre Matric Scholarship"] 
         
     elif age >= 60:
-        # Read from static CSV
         try:
-            csv_path = os.path.join(DATA_DIR, "above60_top_services.csv")
-            if os.path.exists(csv_path):
-                df = pd.read_csv(csv_path)
-                return df['service_name'].tolist()
+            services = above60_services()
+            if services is not None:
+                return list(services)
         except Exception as e:
             logger.error(f"Error reading above60 CSV: {e}")
         return ["Old Age Pension", "Widow Pension", "Lakshmir Bhandar", "Swasthya Sathi", "Jai Bangla"]
@@ -188,6 +174,11 @@ def engine_demographic(db: Session, district_id: int, gender: str, caste: str, a
     age_group = 'youth' if age < 60 else 'elderly'
     religion_group = 'Hindu' if religion == 'Hindu' else 'Minority'
     
+    # 0. Precomputed cluster lookup table (no DB access)
+    clusters = _snapshot(demographic_cache, db)
+    if clusters is not None and limit <= RANKING_CACHE_DEPTH:
+        return clusters.top(district_id, gender, caste, age_group, religion_group, limit)
+    
     # 1. Find Cluster
     cluster = db.query(GroupedDF).filter(
         GroupedDF.district_id == district_id,
@@ -219,85 +210,204 @@ def engine_content(db: Session, service_history_ids: List[int], selected_service
     target_ids = list(service_history_ids)
     if selected_service_id and selected_service_id not in target_ids:
         target_ids.append(selected_service_id)
-        
-    results = {}
+    if not target_ids:
+        return {}
     
-    # Simple Content Logic: Fetch similar from DB (Placeholder for now)
-    # Real logic: Query OpenAISimilarity table
-    # Since we defined OpenAISimilarity with a JSON string, we'd need to parse it. 
-    # For MVP without real data in that table, we skip or use dummy.
-    
-    return results
+    # Preloaded top-K neighbour index: one vectorized gather/filter over all targets
+    index = _snapshot(similarity_cache, db)
+    if index is None:
+        logger.warning("Similarity index not loaded - skipping content recommendations")
+        return {}
+    return index.similar(target_ids, caste, limit)
 
-# --- Main Endpoint ---
+def consolidate_recommendations(db: Session, rec_lists: List[List[str]], age, gender: str, caste: str, religion: str) -> List[str]:
+    """Union every engine's output and keep what the citizen is eligible for."""
+    all_recs_set = set()
+    for sublist in rec_lists:
+        all_recs_set.update(sublist)
+    return filter_eligible(db, list(all_recs_set), age, gender, caste, religion)
 
-@router.post("/recommend")
-async def recommend(req: RecommendRequest, db: Session = Depends(get_db)):
-    # 0. Resolve Names to IDs
+# --- Request Assembly (shared by the async and threadpool paths) ---
+
+# Snapshots the recommendation path needs to run without any sync DB access
+# (the similarity index has no DB fallback, so it is refreshed but not required)
+_REQUIRED_SNAPSHOTS = (reference_cache, eligibility_cache, ranking_cache, demographic_cache)
+
+async def ensure_snapshots() -> bool:
+    """Reload stale snapshots in the threadpool (never on the event loop). True if all required ones are loaded."""
+    for cache in (*_REQUIRED_SNAPSHOTS, similarity_cache):
+        if not cache.is_current():
+            await run_in_threadpool(cache.get)
+    return all(cache.peek() is not None for cache in _REQUIRED_SNAPSHOTS)
+
+def resolve_request_ids(db: Optional[Session], req: RecommendRequest) -> Tuple[int, Optional[int], Optional[int]]:
+    """district_id, block_id, selected_service_id for the request names."""
     district_id = get_district_id_by_name(db, req.district_name)
     if not district_id:
         raise HTTPException(status_code=400, detail=f"District '{req.district_name}' not found")
     
     block_id = get_block_id_by_name(db, req.block_name) if req.block_name else None
     selected_service_id = get_service_id_by_name(db, req.selected_service_name) if req.selected_service_name else None
+    return district_id, block_id, selected_service_id
+
+def apply_citizen_profile(req: RecommendRequest, profile) -> None:
+    """Override request inputs with DB data where the citizen profile has it."""
+    req.age = profile.age if profile.age else req.age
+    req.gender = profile.gender if profile.gender else req.gender
+    req.caste = profile.caste if profile.caste else req.caste
+    req.religion = profile.religion if profile.religion else req.religion
+
+def build_recommendation(db: Optional[Session], req: RecommendRequest, district_id: int, block_id: Optional[int],
+                         selected_service_id: Optional[int], citizen_id: Optional[str],
+                         history) -> Dict[str, Any]:
+    """Run the engines + eligibility and format the response ([count, service1, service2, ...])."""
+    history_ids = [h.service_id for h in history]
+    service_history = [{"service": h.service_name, "date": h.prov_date} for h in history]
     
-    # 1. Citizen Lookup
-    citizen_exists = False
-    citizen_id = None
-    if req.phone:
-        citizen_row = get_citizen_by_phone(db, req.phone)
-        if citizen_row:
-            citizen_exists = True
-            citizen_id = citizen_row.citizen_id
-            # Override inputs with DB data
-            req.age = citizen_row.age if citizen_row.age else req.age
-            req.gender = citizen_row.gender if citizen_row.gender else req.gender
-            req.caste = citizen_row.caste if citizen_row.caste else req.caste
-            req.religion = citizen_row.religion if citizen_row.religion else req.religion
-            if not block_id:
-                block_id = get_block_id_from_history(db, citizen_id)
-
-    # 2. Service History
-    history_ids = []
-    service_history = []
-    if citizen_exists:
-        logging.info(f"Querying provisions for citizen_id: {citizen_id}")
-        provisions = db.query(Provision).filter(Provision.customer_id == citizen_id).order_by(desc(Provision.prov_date)).limit(10).all()
-        logging.info(f"Found {len(provisions)} provisions for citizen {citizen_id}")
-        for p in provisions:
-            history_ids.append(p.service_id)
-            service_history.append({"service": p.service_name, "date": str(p.prov_date)})
-        if len(provisions) == 0:
-            logging.warning(f"No provisions found for citizen_id={citizen_id}, but citizen exists in citizen_master")
-            
-    # 3. Engines Execution
     district_recs = engine_district(db, district_id, req.caste)
     block_recs = engine_block(db, block_id, req.caste)
     demo_recs = engine_demographic(db, district_id, req.gender, req.caste, req.age, req.religion)
     content_recs = engine_content(db, history_ids, selected_service_id, req.caste)
     
-    # 4. Consolidation & Eligibility
-    all_recs_set = set()
-    all_recs_set.update(district_recs)
-    all_recs_set.update(block_recs)
-    all_recs_set.update(demo_recs)
-    for sublist in content_recs.values():
-        all_recs_set.update(sublist)
-        
-    eligible_recs = []
-    for s_name in all_recs_set:
-        if check_eligibility(db, s_name, req.age, req.gender, req.caste, req.religion):
-            eligible_recs.append(s_name)
-            
-    # Format: [count, service1, service2, ...]
-    recommendations_with_count = [len(eligible_recs)] + eligible_recs
+    eligible_recs = consolidate_recommendations(
+        db, [district_recs, block_recs, demo_recs, *content_recs.values()],
+        req.age, req.gender, req.caste, req.religion
+    )
     
     return {
-        "citizen_exists": citizen_exists,
+        "citizen_exists": citizen_id is not None,
         "citizen_id": citizen_id,
         "demographics": {
             "age": req.age, "gender": req.gender, "caste": req.caste
         },
         "service_history": service_history,
-        "recommendations": recommendations_with_count
+        "recommendations": [len(eligible_recs)] + eligible_recs
     }
+
+def citizen_profile_from_rows(citizen_row, block_id: Optional[int], provisions: list) -> CitizenProfile:
+    return CitizenProfile(
+        citizen_id=citizen_row.citizen_id,
+        phone=citizen_row.citizen_phone,
+        age=citizen_row.age,
+        gender=citizen_row.gender,
+        caste=citizen_row.caste,
+        religion=citizen_row.religion,
+        block_id=block_id,
+        history=tuple(HistoryEntry(p.service_id, p.service_name, format_prov_date(p.prov_date)) for p in provisions)
+    )
+
+def get_citizen_profile(db: Session, phone: str) -> Optional[CitizenProfile]:
+    """Citizen demographics + history block + last provisions (profile cache first, then 3 queries)."""
+    profile = citizen_cache.get_by_phone(phone)
+    if profile is not None:
+        return profile
+    citizen_row = get_citizen_by_phone(db, phone)
+    if not citizen_row:
+        return None
+    provisions = db.query(Provision).filter(
+        Provision.customer_id == citizen_row.citizen_id
+    ).order_by(desc(Provision.prov_date)).limit(CITIZEN_HISTORY_LIMIT).all()
+    profile = citizen_profile_from_rows(citizen_row, get_block_id_from_history(db, citizen_row.citizen_id), provisions)
+    citizen_cache.put(profile)
+    return profile
+
+def recommend_with_session(db: Session, req: RecommendRequest) -> Dict[str, Any]:
+    """Fully synchronous recommendation (DB fallbacks allowed). Run in the threadpool, never on the loop."""
+    district_id, block_id, selected_service_id = resolve_request_ids(db, req)
+    
+    citizen_id = None
+    history = ()
+    if req.phone:
+        profile = get_citizen_profile(db, req.phone)
+        if profile:
+            citizen_id = profile.citizen_id
+            apply_citizen_profile(req, profile)
+            block_id = block_id or profile.block_id
+            history = profile.history
+    
+    return build_recommendation(db, req, district_id, block_id, selected_service_id, citizen_id, history)
+
+def _recommend_in_threadpool(req: RecommendRequest) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        return recommend_with_session(db, req)
+    finally:
+        db.close()
+
+# --- Async citizen lookups (asyncpg pool) ---
+
+async def get_citizen_by_phone_async(adb: AsyncSession, phone: str):
+    try:
+        phone_int = int(phone)
+    except (TypeError, ValueError):
+        return None
+    result = await adb.execute(
+        select(CitizenMaster).where(CitizenMaster.citizen_phone == phone_int).limit(1)
+    )
+    return result.scalars().first()
+
+async def get_block_id_from_history_async(adb: AsyncSession, citizen_id: str) -> Optional[int]:
+    """Same as get_block_id_from_history (latest provision's BSK), in one round trip."""
+    result = await adb.execute(
+        select(BSKMaster.block_mun_id)
+        .select_from(Provision)
+        .outerjoin(BSKMaster, BSKMaster.bsk_id == Provision.bsk_id)
+        .where(Provision.customer_id == citizen_id)
+        .order_by(desc(Provision.prov_date))
+        .limit(1)
+    )
+    return result.scalar()
+
+async def get_recent_provisions_async(adb: AsyncSession, citizen_id: str, limit: int = CITIZEN_HISTORY_LIMIT) -> list:
+    result = await adb.execute(
+        select(Provision).where(Provision.customer_id == citizen_id)
+        .order_by(desc(Provision.prov_date)).limit(limit)
+    )
+    return list(result.scalars().all())
+
+async def get_citizen_profile_async(adb: AsyncSession, phone: str) -> Optional[CitizenProfile]:
+    """Async twin of get_citizen_profile: repeat visits cost no DB round trips."""
+    profile = citizen_cache.get_by_phone(phone)
+    if profile is not None:
+        return profile
+    citizen_row = await get_citizen_by_phone_async(adb, phone)
+    if not citizen_row:
+        return None
+    citizen_id = citizen_row.citizen_id
+    provisions = await get_recent_provisions_async(adb, citizen_id)
+    logger.info(f"Found {len(provisions)} provisions for citizen {citizen_id}")
+    if len(provisions) == 0:
+        logger.warning(f"No provisions found for citizen_id={citizen_id}, but citizen exists in citizen_master")
+    profile = citizen_profile_from_rows(citizen_row, await get_block_id_from_history_async(adb, citizen_id), provisions)
+    citizen_cache.put(profile)
+    return profile
+
+# --- Main Endpoint ---
+
+@router.post("/recommend")
+async def recommend(req: RecommendRequest, adb: AsyncSession = Depends(get_async_db)):
+    """
+    Citizen lookups run on the asyncpg pool; engines and eligibility read the
+    in-memory snapshots. If a snapshot cannot be loaded, the whole request runs
+    on the sync DB path in the threadpool so the event loop never blocks.
+    """
+    if not await ensure_snapshots():
+        logger.warning("Request snapshots unavailable - serving /recommend from the DB in the threadpool")
+        return await run_in_threadpool(_recommend_in_threadpool, req)
+    
+    # 0. Resolve Names to IDs (reference snapshot)
+    district_id, block_id, selected_service_id = resolve_request_ids(None, req)
+    
+    # 1. Citizen Lookup + 2. Service History (profile cache, asyncpg on miss)
+    citizen_id = None
+    history = ()
+    if req.phone:
+        profile = await get_citizen_profile_async(adb, req.phone)
+        if profile:
+            citizen_id = profile.citizen_id
+            apply_citizen_profile(req, profile)
+            block_id = block_id or profile.block_id
+            history = profile.history
+    
+    # 3. Engines + 4. Consolidation & Eligibility (in-memory)
+    return build_recommendation(None, req, district_id, block_id, selected_service_id, citizen_id, history)
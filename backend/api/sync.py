@@ -1,18 +1,27 @@
 import os
+import zlib
 import requests
 import math
 import logging
-from datetime import datetime, date
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import BigInteger, Integer, Float, Numeric, Date, Boolean, String, Text
+from sqlalchemy import BigInteger, Integer, Float, Numeric, Date, DateTime, Boolean, String, Text
 from sqlalchemy import insert, update, select, and_, or_, tuple_, text
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterator, Tuple, Callable
 from pydantic import BaseModel
 
-from ..database.connection import get_db
-from ..database.models import SyncMetadata, CitizenMaster, Provision, District, BSKMaster, Service, ServiceEligibility
+from ..database.connection import get_db, SessionLocal, engine
+from ..database.bulk_load import copy_insert, upsert_on_conflict, merge_key
+from ..database.partitions import ensure_partitions_for
+from ..database.schema import register_attribute_labels
+from ..database.table_swap import create_shadow_table, build_shadow_indexes, swap_in, drop_shadow_table
+from ..database.models import SyncMetadata, SyncCheckpoint, CitizenMaster, Provision, District, BSKMaster, Service, ServiceEligibility
 from ..utils.jwt_auth import jwt_manager
+from ..utils.json_stream import RecordStream
+from ..cache import bump_marker, invalidate_synced_records, REFERENCE_MARKER, CITIZEN_MARKER
 
 # Initialize Router and Logger
 router = APIRouter()
@@ -21,6 +30,25 @@ logger = logging.getLogger(__name__)
 # Configuration
 EXTERNAL_SYNC_BASE_URL = os.getenv("EXTERNAL_SYNC_URL", "https://bsk.wb.gov.in/aiapi/api/sync")
 SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "1000"))
+# Pattern B pipeline: pages fetched concurrently, written in page order by one writer
+SYNC_FETCH_WORKERS = int(os.getenv("SYNC_FETCH_WORKERS", "4"))
+# Max pages fetched ahead of the writer (backpressure: bounds memory to window × page size)
+SYNC_FETCH_WINDOW = int(os.getenv("SYNC_FETCH_WINDOW", str(SYNC_FETCH_WORKERS * 2)))
+# Date-window sharding for long Pattern B ranges (backfills): month | week | none
+SYNC_SHARD_BY = os.getenv("SYNC_SHARD_BY", "month").lower()
+# Windows up to this many days run as one shard (weekly incremental syncs stay unsharded)
+SYNC_SHARD_MIN_DAYS = int(os.getenv("SYNC_SHARD_MIN_DAYS", "45"))
+SYNC_SHARD_WORKERS = int(os.getenv("SYNC_SHARD_WORKERS", "3"))
+# Upsert tables: shards run oldest-first, one at a time, so newer data always lands last
+SEQUENTIAL_SHARD_TABLES = {"citizen_master"}
+# COPY + set-based merge for insert paths (false = legacy per-row SAVEPOINT inserts only)
+SYNC_BULK_LOAD = os.getenv("SYNC_BULK_LOAD", "true").lower() == "true"
+# Pattern A: decode the response incrementally and load it in chunks while it downloads
+SYNC_STREAM_JSON = os.getenv("SYNC_STREAM_JSON", "true").lower() == "true"
+SYNC_STREAM_CHUNK_SIZE = int(os.getenv("SYNC_STREAM_CHUNK_SIZE", "5000"))
+SYNC_STREAM_READ_BYTES = 64 * 1024
+# Pattern A: load into <table>_staging and RENAME-swap it in (false = DELETE + INSERT on the live table)
+SYNC_SHADOW_SWAP = os.getenv("SYNC_SHADOW_SWAP", "true").lower() == "true"
 
 # ──────────────────────────────────────────────────────────────────────────────
 # API PATTERN CLASSIFICATION (verified via exhaustive endpoint testing)
@@ -29,7 +57,8 @@ SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "1000"))
 #   API returns ALL records in a single call regardless of parameters.
 #   Dates, Page, Pagesize are ALL IGNORED by the external API.
 #   Response: {success, table_name, total_records, records: [...]}
-#   Strategy: TRUNCATE existing data + INSERT all records atomically.
+#   Strategy: load all records into <table>_staging, then RENAME-swap it in
+#   (SYNC_SHADOW_SWAP=false: TRUNCATE existing data + INSERT atomically).
 #
 # PATTERN B – "Paginated" tables:
 #   Step 1 (Meta):  POST {start_date, end_date}
@@ -51,6 +80,7 @@ class SyncRequest(BaseModel):
     start_date: Optional[str] = None
     end_date: Optional[str] = None
     force_full: bool = False
+    shard_by: Optional[str] = None  # month | week | none (default: SYNC_SHARD_BY for long ranges)
 
 # ------------------------------------------------------------------------------
 # Helper Functions
@@ -62,8 +92,9 @@ def call_sync_api(url_suffix: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         url_suffix = url_suffix[1:]
         
     url = f"{EXTERNAL_SYNC_BASE_URL}/{url_suffix}"
-    headers = jwt_manager.get_auth_header()
-    session = jwt_manager.session
+    token = jwt_manager.get_token()
+    headers = jwt_manager.get_auth_header(token)
+    session = jwt_manager.session  # per thread (fetch_pages_ordered calls this from a pool)
     
     try:
         logger.debug(f"Calling External Sync API: {url} | Payload: {payload}")
@@ -73,8 +104,7 @@ def call_sync_api(url_suffix: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 401:
             logger.warning("Token expired during sync call, refreshing...")
-            jwt_manager.refresh_token()
-            headers = jwt_manager.get_auth_header()
+            headers = jwt_manager.get_auth_header(jwt_manager.refresh_token(token))
             response = session.post(url, json=payload, headers=headers, timeout=60)
             response.raise_for_status()
             return response.json()
@@ -83,6 +113,196 @@ def call_sync_api(url_suffix: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         logger.error(f"Sync API call failed: {e}")
         raise
 
+@contextmanager
+def stream_sync_api(url_suffix: str, payload: Dict[str, Any]) -> Iterator[RecordStream]:
+    """
+    Like call_sync_api, but the body is not read up front: yields a RecordStream over
+    the response's `records` array (other top-level keys land in `.fields`).
+    The connection is released when the block exits.
+    """
+    if url_suffix.startswith("/"):
+        url_suffix = url_suffix[1:]
+    
+    url = f"{EXTERNAL_SYNC_BASE_URL}/{url_suffix}"
+    session = jwt_manager.session
+    token = jwt_manager.get_token()
+    
+    logger.debug(f"Streaming External Sync API: {url} | Payload: {payload}")
+    response = session.post(url, json=payload, headers=jwt_manager.get_auth_header(token), timeout=60, stream=True)
+    try:
+        if response.status_code == 401:
+            response.close()
+            logger.warning("Token expired during sync call, refreshing...")
+            token = jwt_manager.refresh_token(token)
+            response = session.post(url, json=payload, headers=jwt_manager.get_auth_header(token), timeout=60, stream=True)
+        response.raise_for_status()
+        yield RecordStream(response.iter_content(chunk_size=SYNC_STREAM_READ_BYTES))
+    except Exception as e:
+        logger.error(f"Sync API stream failed: {e}")
+        raise
+    finally:
+        response.close()
+
+def fetch_pages_ordered(table_name: str, start_date: str, end_date: str, page_size: int,
+                        last_page: int, first_page: int = 1) -> Iterator[Tuple[int, list]]:
+    """
+    Yield (page, records) for pages first_page..last_page strictly in page order, while up to
+    SYNC_FETCH_WINDOW pages are fetched ahead by SYNC_FETCH_WORKERS threads.
+    A page is only requested once the writer is less than a window behind it.
+    Closing the generator (caller stops early) cancels everything still queued.
+    """
+    def fetch(page: int) -> list:
+        page_payload = {
+            "start_date": start_date,
+            "end_date": end_date,
+            "Page": page,
+            "Pagesize": page_size
+        }
+        return call_sync_api(table_name, page_payload).get("records", [])
+    
+    window = max(1, SYNC_FETCH_WINDOW)
+    pool = ThreadPoolExecutor(max_workers=max(1, SYNC_FETCH_WORKERS), thread_name_prefix=f"sync-fetch-{table_name}")
+    pending = {}
+    next_page = first_page
+    try:
+        for page in range(first_page, last_page + 1):
+            while next_page <= last_page and len(pending) < window:
+                pending[next_page] = pool.submit(fetch, next_page)
+                next_page += 1
+            yield page, pending.pop(page).result()
+    finally:
+        for future in pending.values():
+            future.cancel()
+        # Don't wait for speculative fetches past the end - their results are discarded
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def find_checkpoint(db: Session, table_name: str, start_date: str, end_date: str) -> Optional[SyncCheckpoint]:
+    return db.query(SyncCheckpoint).filter(
+        SyncCheckpoint.table_name == table_name,
+        SyncCheckpoint.window_start == datetime.strptime(start_date, "%Y-%m-%d").date(),
+        SyncCheckpoint.window_end == datetime.strptime(end_date, "%Y-%m-%d").date()
+    ).first()
+
+def find_unfinished_checkpoint(db: Session, table_name: str) -> Optional[SyncCheckpoint]:
+    """Most recent window that crashed or failed part-way (status still 'running' or 'failed')."""
+    return db.query(SyncCheckpoint).filter(
+        SyncCheckpoint.table_name == table_name,
+        SyncCheckpoint.status.in_(["running", "failed"])
+    ).order_by(SyncCheckpoint.updated_at.desc()).first()
+
+def supersede_checkpoints(db: Session, table_name: str, start_date: str, end_date: str) -> int:
+    """
+    Retire the unfinished checkpoints whose window lies inside a range that just synced
+    completely (e.g. an explicit-date rerun), so the next scheduled run does not resume them.
+    """
+    superseded = db.query(SyncCheckpoint).filter(
+        SyncCheckpoint.table_name == table_name,
+        SyncCheckpoint.status.in_(["running", "failed"]),
+        SyncCheckpoint.window_start >= datetime.strptime(start_date, "%Y-%m-%d").date(),
+        SyncCheckpoint.window_end <= datetime.strptime(end_date, "%Y-%m-%d").date()
+    ).update({SyncCheckpoint.status: "superseded"}, synchronize_session=False)
+    if superseded:
+        logger.info(f"   🧹 {superseded} unfinished {table_name} checkpoint(s) covered by [{start_date} → {end_date}] superseded")
+    return superseded
+
+def start_checkpoint(db: Session, table_name: str, start_date: str, end_date: str,
+                     page_size: int, total_records: int, resume: bool = True) -> SyncCheckpoint:
+    """Create or pick up the checkpoint for this window (committed before the first page)."""
+    checkpoint = find_checkpoint(db, table_name, start_date, end_date)
+    if checkpoint is None:
+        checkpoint = SyncCheckpoint(
+            table_name=table_name,
+            window_start=datetime.strptime(start_date, "%Y-%m-%d").date(),
+            window_end=datetime.strptime(end_date, "%Y-%m-%d").date(),
+            last_committed_page=0,
+            records_committed=0
+        )
+        db.add(checkpoint)
+    elif not resume or checkpoint.status in ("completed", "superseded") or checkpoint.page_size != page_size:
+        # Fresh pass over the window (forced, already done, or page numbers no longer line up)
+        checkpoint.last_committed_page = 0
+        checkpoint.records_committed = 0
+    elif checkpoint.last_committed_page:
+        logger.info(f"   ⏩ Resuming {table_name} [{start_date} → {end_date}] after page "
+                    f"{checkpoint.last_committed_page} ({checkpoint.records_committed} records already committed)")
+    
+    checkpoint.page_size = page_size
+    checkpoint.total_records = total_records
+    checkpoint.status = "running"
+    db.commit()
+    return checkpoint
+
+def split_date_window(start_date: str, end_date: str, shard_by: str) -> List[Tuple[str, str]]:
+    """
+    Split [start_date, end_date] at calendar month / week (Monday) boundaries.
+    Adjacent shards share their boundary day, like consecutive incremental syncs
+    (end date reused as the next start) - overlap is absorbed by the idempotent writes.
+    """
+    start = datetime.strptime(start_date, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date()
+    if shard_by not in ("month", "week") or start >= end:
+        return [(start_date, end_date)]
+    
+    shards = []
+    current = start
+    while current < end:
+        if shard_by == "month":
+            boundary = (current.replace(day=1) + timedelta(days=32)).replace(day=1)
+        else:
+            boundary = current + timedelta(days=7 - current.weekday())
+        boundary = min(boundary, end)
+        shards.append((current.isoformat(), boundary.isoformat()))
+        current = boundary
+    return shards
+
+def resolve_shard_by(requested: Optional[str], start_date: str, end_date: str) -> str:
+    """Explicit request wins; otherwise SYNC_SHARD_BY applies only to ranges longer than SYNC_SHARD_MIN_DAYS."""
+    if requested:
+        shard_by = requested.lower()
+        if shard_by not in ("month", "week", "none"):
+            raise HTTPException(status_code=400, detail=f"Invalid shard_by '{requested}'. Valid: month, week, none")
+        return shard_by
+    days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days
+    return SYNC_SHARD_BY if days > SYNC_SHARD_MIN_DAYS else "none"
+
+def sync_shards(table_name: str, shards: List[Tuple[str, str]], resume: bool = True) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Run each date shard through sync_table_paginated with its own session and checkpoint.
+    Shards run in parallel (SYNC_SHARD_WORKERS), except upsert tables which go oldest-first
+    and stop at the first failure. With resume, shards already completed are skipped.
+    Returns (records committed across shards, per-shard results).
+    """
+    def run_shard(window: Tuple[str, str]) -> Dict[str, Any]:
+        shard_start, shard_end = window
+        shard_db = SessionLocal()
+        try:
+            if resume:
+                checkpoint = find_checkpoint(shard_db, table_name, shard_start, shard_end)
+                if checkpoint and checkpoint.status == "completed":
+                    logger.info(f"   ⏭️  Shard {shard_start} → {shard_end} already completed")
+                    return {"start": shard_start, "end": shard_end, "status": "skipped",
+                            "records": checkpoint.records_committed}
+            logger.info(f"🧩 Shard {table_name} [{shard_start} → {shard_end}] started")
+            records = sync_table_paginated(shard_db, table_name, shard_start, shard_end, resume)
+            return {"start": shard_start, "end": shard_end, "status": "completed", "records": records}
+        except Exception as e:
+            logger.error(f"❌ Shard {table_name} [{shard_start} → {shard_end}] failed: {str(e)[:200]}")
+            return {"start": shard_start, "end": shard_end, "status": "failed", "error": str(e)[:200]}
+        finally:
+            shard_db.close()
+    
+    if table_name in SEQUENTIAL_SHARD_TABLES or SYNC_SHARD_WORKERS <= 1:
+        results = []
+        for window in shards:
+            results.append(run_shard(window))
+            if results[-1]["status"] == "failed":
+                break
+    else:
+        with ThreadPoolExecutor(max_workers=SYNC_SHARD_WORKERS, thread_name_prefix=f"sync-shard-{table_name}") as pool:
+            results = list(pool.map(run_shard, shards))
+    
+    return sum(r.get("records") or 0 for r in results), results
+
 def get_model_class(table_name: str):
     """Map external table identifiers to SQLAlchemy models."""
     if table_name == "citizen_master": return CitizenMaster
@@ -101,61 +321,149 @@ def get_model_class(table_name: str):
     else:
         raise ValueError(f"Unknown table or no model defined: {table_name}")
 
+# ── Column plans: per-table converters, compiled once from the Table metadata ──
+
+def _is_string_column(col_type) -> bool:
+    if isinstance(col_type, (String, Text)):
+        return True
+    try:
+        return issubclass(col_type.python_type, str)
+    except Exception:
+        return False
+
+def _to_int(v):
+    if isinstance(v, str):
+        if v == "":
+            return None
+        try:
+            return int(v)
+        except ValueError:
+            return v  # Let database handle invalid values
+    return v
+
+def _to_float(v):
+    if isinstance(v, str):
+        if v == "":
+            return None
+        try:
+            return float(v)
+        except ValueError:
+            return v  # Let database handle invalid values
+    return v
+
+def _to_bool(v):
+    if isinstance(v, str):
+        if v == "":
+            return None
+        lowered = v.lower()
+        if lowered in ('true', '1', 'yes'):
+            return True
+        if lowered in ('false', '0', 'no'):
+            return False
+        return None
+    return v
+
+def _empty_to_none(v):
+    return None if v == "" else v
+
+# Source format first ('31/03/2025 20:39:54'); the database's DateStyle would read it month-first
+DATETIME_FORMATS = ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y")
+
+def _to_datetime(v):
+    if isinstance(v, str):
+        if v == "":
+            return None
+        if len(v) == 19 and v[2] == "/" and v[5] == "/":
+            # Fast path for the source format (strptime is several times slower)
+            try:
+                return datetime(int(v[6:10]), int(v[3:5]), int(v[0:2]), int(v[11:13]), int(v[14:16]), int(v[17:19]))
+            except ValueError:
+                pass
+        for fmt in DATETIME_FORMATS:
+            try:
+                return datetime.strptime(v, fmt)
+            except ValueError:
+                pass
+        try:
+            return datetime.fromisoformat(v)
+        except ValueError:
+            return v  # Let database handle invalid values
+    return v
+
+def compile_column_plan(table) -> Dict[str, Optional[Callable[[Any], Any]]]:
+    """
+    column name → converter (None = pass through unchanged, i.e. string columns).
+    Same rules as the original row-wise sanitize_data:
+    - empty string → None for non-string columns
+    - string numbers / booleans coerced for Integer/BigInteger, Float and Boolean columns
+    - 'DD/MM/YYYY HH:MM:SS' (or ISO) strings parsed for DateTime columns
+    - anything else left for the database to validate
+    - derived columns (generated, or info={"derived": True}) dropped - the database maintains them
+    """
+    plan = {}
+    for column in table.columns:
+        if column.computed is not None or column.info.get("derived"):
+            continue
+        col_type = column.type
+        if _is_string_column(col_type):
+            plan[column.name] = None
+        elif isinstance(col_type, (BigInteger, Integer)):
+            plan[column.name] = _to_int
+        elif isinstance(col_type, Float):
+            plan[column.name] = _to_float
+        elif isinstance(col_type, Boolean):
+            plan[column.name] = _to_bool
+        elif isinstance(col_type, DateTime):
+            plan[column.name] = _to_datetime
+        else:
+            plan[column.name] = _empty_to_none
+    return plan
+
+_column_plans: Dict[str, Dict[str, Optional[Callable[[Any], Any]]]] = {}
+
+def get_column_plan(table) -> Dict[str, Optional[Callable[[Any], Any]]]:
+    plan = _column_plans.get(table.name)
+    if plan is None:
+        plan = _column_plans[table.name] = compile_column_plan(table)
+    return plan
+
 def sanitize_data(table, data):
     """
     Sanitize data before insertion/update.
     - Converts empty strings to None for non-string columns
     - Attempts type coercion for string numbers
+    - Drops keys that are not table columns
+    Uses the table's compiled column plan (see compile_column_plan).
     """
+    plan = get_column_plan(table)
     sanitized_data = []
     for record in data:
         clean_record = {}
         for k, v in record.items():
-            if k not in table.columns:
-                continue
-
-            col_type = table.columns[k].type
-            
-            # Check if column is string type
-            is_string_type = isinstance(col_type, (String, Text))
-            if not is_string_type:
-                try:
-                    if issubclass(col_type.python_type, str):
-                        is_string_type = True
-                except:
-                    pass
-            
-            # Data Sanitization Logic
-            if v == "":
-                # Empty string handling
-                if not is_string_type:
-                    v = None
-            elif isinstance(v, str) and not is_string_type:
-                # Type coercion for string numbers
-                try:
-                    if isinstance(col_type, (BigInteger, Integer)):
-                        v = int(v)
-                    elif isinstance(col_type, Float):
-                        v = float(v)
-                    elif isinstance(col_type, Boolean):
-                        # Handle boolean strings
-                        if v.lower() in ('true', '1', 'yes'):
-                            v = True
-                        elif v.lower() in ('false', '0', 'no'):
-                            v = False
-                        else:
-                            v = None
-                except (ValueError, AttributeError):
-                    # Let database handle invalid values
-                    pass
-            
-            clean_record[k] = v
+            if k in plan:
+                convert = plan[k]
+                clean_record[k] = v if convert is None else convert(v)
         
         if clean_record:
             sanitized_data.append(clean_record)
             
     return sanitized_data
 
+def try_copy_insert(db: Session, table, data) -> Optional[int]:
+    """
+    Bulk path: COPY the page into staging and merge it in one statement.
+    Returns the inserted count, or None if the caller should fall back to per-row inserts.
+    """
+    if not SYNC_BULK_LOAD:
+        return None
+    try:
+        inserted, rejected = copy_insert(db, table, data)
+        logger.info(f"   ⚡ COPY {table.name}: {inserted} inserted, {rejected} rejected")
+        return inserted
+    except Exception as e:
+        logger.warning(f"⚠️  Bulk COPY failed for {table.name}, falling back to row-by-row: {str(e)[:200]}")
+        return None
+
 def insert_only(db: Session, table, data):
     """
     INSERT ONLY (no TRUNCATE) - for paginated data streaming.
@@ -164,6 +472,10 @@ def insert_only(db: Session, table, data):
     if not data:
         return 0
     
+    bulk_count = try_copy_insert(db, table, data)
+    if bulk_count is not None:
+        return bulk_count
+    
     insert_success = 0
     insert_failed = 0
     
@@ -184,163 +496,16 @@ def insert_only(db: Session, table, data):
     
     return insert_success
 
-def manual_upsert(db: Session, model, table, pk_cols, data):
-    """
-    Performs Manual Upsert with ROW-LEVEL FAULT TOLERANCE:
-    1. Identify existing records by PK (supports Composite Keys).
-    2. Split into Inserts (New) and Updates (Existing).
-    3. Execute operations with per-record error handling using SAVEPOINTS.
-    If one record fails, others continue processing.
-    """
-    if not data:
-        return 0
-
-    # Handle Composite keys correctly
-    pk_columns = [table.columns[k] for k in pk_cols]
-    
-    # helper for composite key tuple creation with NULL validation
-    def make_key(item):
-        key = tuple(item.get(k) for k in pk_cols)
-        # CRITICAL: Reject records with NULL in primary key
-        if None in key:
-            key_dict = dict(zip(pk_cols, key))
-            raise ValueError(f"NULL value in primary key: {key_dict}")
-        return key
-
-    incoming_keys = []
-    invalid_records = 0
-    
-    for item in data:
-        try:
-            incoming_keys.append(make_key(item))
-        except ValueError as e:
-            invalid_records += 1
-            logger.warning(f"Skipping invalid record: {e}")
-    
-    if invalid_records > 0:
-        logger.warning(f"Skipped {invalid_records} records with invalid/NULL primary keys")
-    
-    if not incoming_keys:
-        return 0
-
-    existing_keys = set()
-    chunk_size = 500
-    
-    # Process chunks to query existing keys
-    for i in range(0, len(incoming_keys), chunk_size):
-        chunk = incoming_keys[i:i + chunk_size]
-        
-        # Build query for composite or single keys
-        if len(pk_cols) == 1:
-            # Single PK Optimization
-            pk_col = pk_columns[0]
-            # Unwrap tuples for single column IN clause
-            keys_for_query = [k[0] for k in chunk]
-            stmt = select(pk_col).where(pk_col.in_(keys_for_query))
-            result = db.execute(stmt).scalars().all()
-            existing_keys.update((r,) for r in result)
-        else:
-            stmt = select(*pk_columns).where(tuple_(*pk_columns).in_(chunk))
-            result = db.execute(stmt).all()
-            existing_keys.update(result)
-        
-    to_insert = []
-    to_update = []
-    
-    # Filter data to only valid records (those with valid keys)
-    for item in data:
-        try:
-            key = make_key(item)
-            if key in existing_keys:
-                to_update.append(item)
-            else:
-                to_insert.append(item)
-        except ValueError:
-            # Already logged above, skip
-            pass
-    
-    # Track success/failure counts
-    insert_success = 0
-    insert_failed = 0
-    update_success = 0
-    update_failed = 0
-    
-    # ROW-LEVEL FAULT TOLERANCE: Insert with SAVEPOINTS
-    if to_insert:
-        logger.info(f"   - Inserting {len(to_insert)} new records...")
-        for record in to_insert:
-            # Create savepoint for this record
-            savepoint = db.begin_nested()
-            try:
-                db.execute(insert(table).values(record))
-                db.flush()  # Flush to detect errors immediately
-                savepoint.commit()  # Commit savepoint (keeps this record)
-                insert_success += 1
-            except Exception as e:
-                savepoint.rollback()  # Rollback ONLY this savepoint
-                insert_failed += 1
-                pk_val = {k: record.get(k) for k in pk_cols}
-                logger.error(f"Failed to insert record {pk_val}: {str(e)[:200]}")
-        
-        if insert_failed > 0:
-            logger.warning(f"⚠️ {insert_failed}/{len(to_insert)} inserts failed")
-    
-    # ROW-LEVEL FAULT TOLERANCE: Update with SAVEPOINTS
-    if to_update:
-        logger.info(f"   - Updating {len(to_update)} existing records...")
-        for record in to_update:
-            # Create savepoint for this record
-            savepoint = db.begin_nested()
-            try:
-                # CRITICAL: Validate complete PK exists (prevent partial key updates)
-                pk_filter = {}
-                for k in pk_cols:
-                    if k not in record:
-                        raise ValueError(f"Missing primary key column '{k}' in update record")
-                    pk_filter[k] = record[k]
-                
-                update_data = {k: v for k, v in record.items() if k not in pk_cols}
-                
-                if not update_data:
-                    # Record has only PK columns, nothing to update
-                    # This is valid - commit as successful no-op
-                    savepoint.commit()
-                    update_success += 1
-                else:
-                    # Perform actual update
-                    stmt = update(table).where(
-                        *[table.columns[k] == pk_filter[k] for k in pk_cols]
-                    ).values(**update_data)
-                    db.execute(stmt)
-                    db.flush()
-                    savepoint.commit()  # Commit savepoint (keeps this record)
-                    update_success += 1
-            except Exception as e:
-                savepoint.rollback()  # Rollback ONLY this savepoint
-                update_failed += 1
-                pk_val = {k: record.get(k) for k in pk_cols}
-                logger.error(f"Failed to update record {pk_val}: {str(e)[:200]}")
-        
-        if update_failed > 0:
-            logger.warning(f"⚠️ {update_failed}/{len(to_update)} updates failed")
-    
-    # Log final summary
-    total_success = insert_success + update_success
-    total_failed = insert_failed + update_failed
-    
-    if total_failed > 0:
-        logger.warning(f"📊 Sync Summary: {total_success} succeeded, {total_failed} failed")
-    
-    return total_success
-
 def upsert_data(db: Session, table_name: str, data: list, skip_commit: bool = False):
     """
     Upsert data into the database.
     Strategy varies by table type:
-    - citizen_master: Manual UPSERT (check + insert/update)
+    - citizen_master: INSERT ... ON CONFLICT DO UPDATE (skips unchanged rows, bisects failing batches)
     - bsk_master, district, service_master: INSERT ONLY (used after TRUNCATE)
-    - provision: Pure INSERT (no checking, preserve historical data)
+    - provision: Pure INSERT (no checking, preserve historical data), routed into its monthly partitions
     - Other tables: Pure INSERT
+    INSERT ONLY / Pure INSERT go through COPY + one set-based merge (rejects → sync_rejects),
+    falling back to per-row SAVEPOINT inserts if the bulk path fails.
     
     Args:
         skip_commit: If True, don't commit (caller manages transaction)
@@ -351,10 +516,10 @@ def upsert_data(db: Session, table_name: str, data: list, skip_commit: bool = Fa
     try:
         model = get_model_class(table_name)
         table = model.__table__
-        pk_cols = [c.name for c in table.primary_key.columns]
+        pk_cols = merge_key(table)
         
         if not pk_cols:
-             raise ValueError(f"Table {table_name} has no primary key defined.")
+             raise ValueError(f"Table {table_name} has no primary key or unique key defined.")
              
         # Normalize/Sanitize Data first
         clean_data = sanitize_data(table, data)
@@ -363,13 +528,20 @@ def upsert_data(db: Session, table_name: str, data: list, skip_commit: bool = Fa
                 logger.warning(f"🚨 All {len(data)} records filtered out during sanitization for {table_name}")
             return 0
 
-        # --- STRATEGY 1: MANUAL UPSERT (citizen_master only) ---
+        # Partitioned tables (ml_provision): the page's months need their partitions first
+        ensure_partitions_for(table, clean_data)
+        # Coded columns (ml_citizen_master gender / caste / religion): new labels need a code first
+        register_attribute_labels(db, table, clean_data)
+
+        # --- STRATEGY 1: ON CONFLICT UPSERT (citizen_master only) ---
         if table_name in ["ml_citizen_master", "citizen_master"]:
-            logger.info(f"Using Manual Upsert for {table_name} on PK: {pk_cols}")
-            total = manual_upsert(db, model, table, pk_cols, clean_data)
+            logger.info(f"Using ON CONFLICT upsert for {table_name} on PK: {pk_cols}")
+            counts = upsert_on_conflict(db, table, clean_data, pk_cols)
+            logger.info(f"   ⚡ {counts['inserted']} inserted, {counts['updated']} updated, "
+                        f"{counts['unchanged']} unchanged, {counts['failed'] + counts['rejected']} rejected")
             if not skip_commit:
                 db.commit()
-            return total
+            return counts["inserted"] + counts["updated"] + counts["unchanged"]
 
         # --- STRATEGY 2: INSERT ONLY (for master tables after TRUNCATE) ---
         if table_name in ["bsk_master", "ml_bsk_master", "district", "ml_district", 
@@ -383,6 +555,12 @@ def upsert_data(db: Session, table_name: str, data: list, skip_commit: bool = Fa
         # --- STRATEGY 3: PURE INSERT (all other tables) ---
         logger.info(f"Using Pure Insert for {table_name}")
         
+        bulk_count = try_copy_insert(db, table, clean_data)
+        if bulk_count is not None:
+            if not skip_commit:
+                db.commit()
+            return bulk_count
+        
         # Use row-level fault tolerance with pure inserts
         insert_success = 0
         insert_failed = 0
@@ -414,7 +592,133 @@ def upsert_data(db: Session, table_name: str, data: list, skip_commit: bool = Fa
         logger.error(f"Upsert failed for {table_name}: {e}")
         raise
 
-def sync_table_paginated(db: Session, table_name: str, start_date: str, end_date: str):
+def replace_direct_table(db: Session, table_name: str, chunks: Iterator[list]) -> int:
+    """
+    Pattern A write, under an advisory lock. `chunks` may be lazy (streamed download) -
+    the table is only replaced if all of it loads.
+    """
+    if SYNC_SHADOW_SWAP:
+        return shadow_swap_direct_table(db, table_name, chunks)
+    return truncate_insert_direct_table(db, table_name, chunks)
+
+def table_lock_id(table_name: str) -> int:
+    """Advisory lock key for a table - the same in every worker (str hash() is randomized per process)."""
+    return zlib.crc32(table_name.encode())
+
+@contextmanager
+def table_lock(table_name: str):
+    """
+    Hold the table's advisory lock on a dedicated autocommit connection for the
+    whole block. A session-level lock taken through the load's Session would be
+    left on whichever pooled connection that Session held when it commits.
+    """
+    lock_id = table_lock_id(table_name)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        logger.info(f"   🔒 Acquiring advisory lock for {table_name}...")
+        conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": lock_id})
+        try:
+            yield
+        finally:
+            if conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id}).scalar():
+                logger.info(f"   🔓 Released lock for {table_name}")
+            else:
+                logger.error(f"   ❌ Advisory lock for {table_name} was not held at release")
+
+def shadow_swap_direct_table(db: Session, table_name: str, chunks: Iterator[list]) -> int:
+    """
+    Bulk-load every chunk into <table>_staging, build its indexes, then swap it in
+    with a RENAME. Readers keep using the old table until the swap, which holds
+    its exclusive lock for milliseconds.
+    """
+    model = get_model_class(table_name)
+    table = model.__table__
+    
+    with table_lock(table.name):
+        shadow = None
+        try:
+            shadow = create_shadow_table(db, table)
+            logger.info(f"   📥 Loading {shadow.name}...")
+            
+            total_inserted = 0
+            total_received = 0
+            for chunk in chunks:
+                total_received += len(chunk)
+                clean_chunk = sanitize_data(table, chunk)
+                if len(clean_chunk) < len(chunk):
+                    logger.warning(f"🚨 {len(chunk) - len(clean_chunk)} records filtered out during sanitization for {table_name}")
+                total_inserted += insert_only(db, shadow, clean_chunk)
+            
+            indexes = build_shadow_indexes(db, table, shadow)
+            db.commit()
+            logger.info(f"   🏗️  {shadow.name}: {total_inserted} rows loaded, {indexes} indexes built")
+            
+            swap_in(db, table, shadow)
+            logger.info(f"   ✅ {table.name}: {total_inserted}/{total_received} records replaced")
+            return total_inserted
+        except Exception as e:
+            db.rollback()
+            logger.error(f"   ❌ Shadow load + swap failed for {table.name} (live table untouched): {e}")
+            if shadow is not None:
+                try:
+                    drop_shadow_table(db, shadow.name)
+                    db.commit()
+                except Exception:
+                    db.rollback()
+            raise
+
+def truncate_insert_direct_table(db: Session, table_name: str, chunks: Iterator[list]) -> int:
+    """Legacy Pattern A write: DELETE + INSERT every chunk on the live table in one savepoint."""
+    model = get_model_class(table_name)
+    table = model.__table__
+    
+    with table_lock(table.name):
+        truncate_savepoint = db.begin_nested()
+        try:
+            logger.info(f"   🗑️  TRUNCATE {table.name}...")
+            db.execute(table.delete())
+            db.flush()
+            
+            total_inserted = 0
+            total_received = 0
+            for chunk in chunks:
+                total_received += len(chunk)
+                total_inserted += upsert_data(db, table_name, chunk, skip_commit=True)
+            truncate_savepoint.commit()
+            
+            logger.info(f"   ✅ {table.name}: {total_inserted}/{total_received} records replaced")
+            return total_inserted
+        except Exception as e:
+            truncate_savepoint.rollback()
+            logger.error(f"   ❌ TRUNCATE + INSERT failed for {table.name}: {e}")
+            raise
+
+def replace_direct_table_streaming(db: Session, table_name: str) -> int:
+    """
+    Pattern A over a streamed response: records are decoded as they arrive and loaded
+    SYNC_STREAM_CHUNK_SIZE at a time, so memory stays bounded by one chunk and the
+    first insert starts before the download has finished.
+    """
+    with stream_sync_api(table_name, {}) as stream:
+        chunks = stream.batches(max(1, SYNC_STREAM_CHUNK_SIZE))
+        try:
+            # An empty dump must not truncate the table
+            first = next(chunks, None)
+            if not first:
+                logger.warning(f"⚠️  {table_name}: API returned 0 records!")
+                return 0
+            
+            def all_chunks():
+                yield first
+                for i, chunk in enumerate(chunks, start=2):
+                    logger.info(f"📦 {table_name}: streamed chunk {i} ({len(chunk)} records)")
+                    yield chunk
+            
+            logger.info(f"📦 {table_name}: streaming records in chunks of {SYNC_STREAM_CHUNK_SIZE}")
+            return replace_direct_table(db, table_name, all_chunks())
+        finally:
+            chunks.close()
+
+def sync_table_paginated(db: Session, table_name: str, start_date: str, end_date: str, resume: bool = True):
     """
     Sync data from external BSK API. Handles TWO verified API response patterns:
     
@@ -422,7 +726,7 @@ def sync_table_paginated(db: Session, table_name: str, start_date: str, end_date
       - API ignores ALL parameters (dates, Page, Pagesize).
       - Always returns ALL records in a single response.
       - Response: {success, table_name, total_records, records: [...]}
-      - Strategy: TRUNCATE + INSERT atomically.
+      - Strategy: shadow-table load + RENAME swap (or TRUNCATE + INSERT atomically).
     
     PATTERN B - Paginated (provision, citizen_master):
       - Requires start_date & end_date (400 error without them).
@@ -430,6 +734,8 @@ def sync_table_paginated(db: Session, table_name: str, start_date: str, end_date
       - Page call (dates+Page+Pagesize) → {flow:"pagination", records: [...]}
       - End condition: len(records) == 0
       - Strategy: INSERT (provision) or UPSERT (citizen_master) per page.
+      - Each page commits together with its sync_checkpoint row; a rerun of the same
+        window resumes after the last committed page (resume=False starts over).
     """
     
     # =========================================================================
@@ -438,6 +744,9 @@ def sync_table_paginated(db: Session, table_name: str, start_date: str, end_date
     if table_name in DIRECT_TABLES:
         logger.info(f"🔄 Syncing Direct Table: {table_name} (Pattern A — all records in one call)")
         
+        if SYNC_STREAM_JSON:
+            return replace_direct_table_streaming(db, table_name)
+        
         # Send empty payload — API ignores all parameters anyway
         response = call_sync_api(table_name, {})
         records = response.get("records", [])
@@ -447,34 +756,7 @@ def sync_table_paginated(db: Session, table_name: str, start_date: str, end_date
             return 0
         
         logger.info(f"📦 {table_name}: received {len(records)} records")
-        
-        # Atomic TRUNCATE + INSERT with advisory lock
-        model = get_model_class(table_name)
-        table = model.__table__
-        lock_id = hash(table.name) % 2147483647
-        
-        logger.info(f"   🔒 Acquiring advisory lock for {table.name}...")
-        db.execute(text(f"SELECT pg_advisory_lock({lock_id})"))
-        
-        try:
-            truncate_savepoint = db.begin_nested()
-            try:
-                logger.info(f"   🗑️  TRUNCATE {table.name}...")
-                db.execute(table.delete())
-                db.flush()
-                
-                total_inserted = upsert_data(db, table_name, records, skip_commit=True)
-                truncate_savepoint.commit()
-                
-                logger.info(f"   ✅ {table.name}: {total_inserted}/{len(records)} records replaced")
-                return total_inserted
-            except Exception as e:
-                truncate_savepoint.rollback()
-                logger.error(f"   ❌ TRUNCATE + INSERT failed for {table.name}: {e}")
-                raise
-        finally:
-            db.execute(text(f"SELECT pg_advisory_unlock({lock_id})"))
-            logger.info(f"   🔓 Released lock for {table.name}")
+        return replace_direct_table(db, table_name, [records])
     
     # =========================================================================
     # PATTERN B: Paginated tables (provision, citizen_master)
@@ -507,40 +789,59 @@ def sync_table_paginated(db: Session, table_name: str, start_date: str, end_date
         max_pages = math.ceil(total_records / page_size)
         logger.info(f"   📄 Paginating: ~{max_pages} pages × {page_size} per page")
         
-        total_upserted = 0
+        # Page-level checkpoint: resume after the last committed page of this window
+        checkpoint = start_checkpoint(db, table_name, start_date, end_date, page_size, total_records, resume)
+        first_page = checkpoint.last_committed_page + 1
+        total_upserted = checkpoint.records_committed
         consecutive_empty = 0
         MAX_CONSECUTIVE_EMPTY = 3  # Safety: stop after 3 consecutive empty pages
         
-        for page in range(1, max_pages + 2):  # +2 for safety margin
-            logger.info(f"   📥 Page {page}/{max_pages}...")
+        # Fetch-ahead pipeline: network latency of later pages overlaps the DB write of this one
+        pages = fetch_pages_ordered(table_name, start_date, end_date, page_size,
+                                    max(max_pages + 1, first_page), first_page)  # +1 for safety margin
+        try:
+            for page, records in pages:
+                logger.info(f"   📥 Page {page}/{max_pages}...")
             
-            page_payload = {
-                "start_date": start_date,
-                "end_date": end_date,
-                "Page": page,
-                "Pagesize": page_size
-            }
+                if not records or len(records) == 0:
+                    consecutive_empty += 1
+                    logger.info(f"      ⚠️  Empty page {page} ({consecutive_empty}/{MAX_CONSECUTIVE_EMPTY})")
+                    if consecutive_empty >= MAX_CONSECUTIVE_EMPTY:
+                        logger.info(f"   🏁 {MAX_CONSECUTIVE_EMPTY} consecutive empty pages — pagination complete")
+                        break
+                    continue
             
-            page_response = call_sync_api(table_name, page_payload)
-            records = page_response.get("records", [])
+                consecutive_empty = 0  # Reset on non-empty page
+                inserted_count = upsert_data(db, table_name, records, skip_commit=True)
+                total_upserted += inserted_count
+                # Page rows and checkpoint commit together
+                checkpoint.last_committed_page = page
+                checkpoint.records_committed = total_upserted
+                db.commit()
+                invalidate_synced_records(table_name, records)
+                logger.info(f"      ✅ {inserted_count} records (Total: {total_upserted}/{total_records})")
             
-            if not records or len(records) == 0:
-                consecutive_empty += 1
-                logger.info(f"      ⚠️  Empty page {page} ({consecutive_empty}/{MAX_CONSECUTIVE_EMPTY})")
-                if consecutive_empty >= MAX_CONSECUTIVE_EMPTY:
-                    logger.info(f"   🏁 {MAX_CONSECUTIVE_EMPTY} consecutive empty pages — pagination complete")
+                # Natural end: got fewer records than page size
+                if len(records) < page_size:
+                    logger.info(f"   🏁 Last page (got {len(records)} < {page_size}) — pagination complete")
                     break
-                continue
             
-            consecutive_empty = 0  # Reset on non-empty page
-            inserted_count = upsert_data(db, table_name, records)
-            total_upserted += inserted_count
-            logger.info(f"      ✅ {inserted_count} records (Total: {total_upserted}/{total_records})")
-            
-            # Natural end: got fewer records than page size
-            if len(records) < page_size:
-                logger.info(f"   🏁 Last page (got {len(records)} < {page_size}) — pagination complete")
-                break
+            checkpoint.status = "completed"
+            db.commit()
+        except Exception:
+            db.rollback()
+            try:
+                checkpoint.status = "failed"
+                db.commit()
+            except Exception:
+                db.rollback()
+            logger.error(f"   💾 {table_name} checkpoint kept at page {checkpoint.last_committed_page} — next run resumes there")
+            raise
+        finally:
+            pages.close()  # Cancel fetches still queued if we stopped early
+            # Other workers flush their citizen profile caches (pages committed so far are visible)
+            if total_upserted:
+                bump_marker(CITIZEN_MARKER)
         
         logger.info(f"📊 {table_name} DONE: {total_upserted}/{total_records} records synced")
         return total_upserted
@@ -557,13 +858,13 @@ def sync_table_paginated(db: Session, table_name: str, start_date: str, end_date
 # ------------------------------------------------------------------------------
 
 @router.post("/sync")
-async def sync_data(request: SyncRequest, db: Session = Depends(get_db)):
+def sync_data(request: SyncRequest, db: Session = Depends(get_db)):
     """
     Sync data from external server to local PostgreSQL.
     
     Pattern A tables (bsk_master, district, service_master):
       Dates are irrelevant — API always returns all records.
-      TRUNCATE + INSERT atomically.
+      Loaded into a shadow table and swapped in atomically.
     
     Pattern B tables (provision, citizen_master):
       Require valid start_date and end_date.
@@ -584,6 +885,8 @@ async def sync_data(request: SyncRequest, db: Session = Depends(get_db)):
         # Pattern A: Dates are irrelevant (API ignores them)
         from_date = "N/A"
         end_date = "N/A"
+        shard_by = "none"
+        resumed_window = None
         logger.info(f"📋 Direct table ({external_table_name}) — dates ignored, fetching all records")
     else:
         # Pattern B: Dates are REQUIRED
@@ -598,10 +901,43 @@ async def sync_data(request: SyncRequest, db: Session = Depends(get_db)):
         if not from_date:
             from_date = "2024-01-01"
         
+        shard_by = resolve_shard_by(request.shard_by, from_date, end_date)
+        resumed_window = None
+        
+        # A window that died part-way is finished first (resumes from its last committed page),
+        # then the regular window is synced in the same run
+        if not request.start_date and not request.end_date and not request.force_full:
+            unfinished = find_unfinished_checkpoint(db, external_table_name)
+            if unfinished and shard_by == "none":
+                window = (str(unfinished.window_start), str(unfinished.window_end))
+                if window != (from_date, end_date):
+                    resumed_window = window
+                logger.info(f"⏩ Unfinished {external_table_name} window found — resuming "
+                            f"[{window[0]} → {window[1]}] from page {unfinished.last_committed_page + 1}")
+            elif unfinished:
+                # Sharded: widen the range so the unfinished shard recurs (completed shards are skipped)
+                from_date = min(from_date, str(unfinished.window_start))
+        
         logger.info(f"📋 Paginated table ({external_table_name}) — date range: {from_date} → {end_date}")
     
+    shards = None
     try:
-        total_processed = sync_table_paginated(db, external_table_name, from_date, end_date)
+        if external_table_name in PAGINATED_TABLES and shard_by != "none":
+            windows = split_date_window(from_date, end_date, shard_by)
+            logger.info(f"🧩 {external_table_name}: {len(windows)} {shard_by} shards")
+            total_processed, shards = sync_shards(external_table_name, windows, resume=not request.force_full)
+            failed = [f"{r['start']}→{r['end']}" for r in shards if r["status"] == "failed"]
+            if failed or len(shards) < len(windows):
+                raise RuntimeError(f"{len(failed)} of {len(windows)} shards failed ({', '.join(failed)}); "
+                                   f"rerun to resume them")
+        else:
+            total_processed = 0
+            if resumed_window:
+                total_processed += sync_table_paginated(db, external_table_name, *resumed_window)
+                supersede_checkpoints(db, external_table_name, *resumed_window)
+                db.commit()
+            total_processed += sync_table_paginated(db, external_table_name, from_date, end_date,
+                                                    resume=not request.force_full)
         
         metadata = db.query(SyncMetadata).filter(SyncMetadata.table_name == target_table).first()
         if not metadata:
@@ -613,18 +949,29 @@ async def sync_data(request: SyncRequest, db: Session = Depends(get_db)):
         metadata.last_sync_status = "SUCCESS"
         
         # Only update last_sync_from_date for paginated tables
+        # (never moved backwards, e.g. after finishing an older unfinished window)
         if external_table_name in PAGINATED_TABLES:
-            metadata.last_sync_from_date = datetime.strptime(end_date, "%Y-%m-%d").date()
+            synced_until = datetime.strptime(max(end_date, resumed_window[1]) if resumed_window else end_date,
+                                             "%Y-%m-%d").date()
+            if not metadata.last_sync_from_date or synced_until > metadata.last_sync_from_date:
+                metadata.last_sync_from_date = synced_until
+            supersede_checkpoints(db, external_table_name, from_date, end_date)
         
         db.commit()
         
+        # Master tables feed the per-worker reference snapshots - tell workers to rebuild
+        if external_table_name in DIRECT_TABLES:
+            bump_marker(REFERENCE_MARKER)
+        
         return {
             "status": "success", 
             "table": target_table,
             "external_table": external_table_name,
             "pattern": "A-direct" if external_table_name in DIRECT_TABLES else "B-paginated",
             "total_records_processed": total_processed,
-            "date_range": {"start": from_date, "end": end_date}
+            "date_range": {"start": from_date, "end": end_date},
+            "resumed_window": {"start": resumed_window[0], "end": resumed_window[1]} if resumed_window else None,
+            "shards": shards
         }
 
     except Exception as e:
@@ -641,6 +988,37 @@ async def sync_data(request: SyncRequest, db: Session = Depends(get_db)):
         logger.error(f"Sync failed for {target_table}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/sync/progress")
+def sync_progress(table: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db)):
+    """
+    Page-level progress of paginated sync windows / shards (most recently active first).
+    One entry per sync_checkpoint row; a sharded backfill shows one row per shard.
+    """
+    query = db.query(SyncCheckpoint)
+    if table:
+        query = query.filter(SyncCheckpoint.table_name == table)
+    checkpoints = query.order_by(SyncCheckpoint.updated_at.desc(), SyncCheckpoint.window_start).limit(limit).all()
+    
+    shards = []
+    for cp in checkpoints:
+        total_pages = math.ceil(cp.total_records / cp.page_size) if cp.total_records and cp.page_size else None
+        shards.append({
+            "table": cp.table_name,
+            "window": {"start": str(cp.window_start), "end": str(cp.window_end)},
+            "status": cp.status,
+            "last_committed_page": cp.last_committed_page,
+            "total_pages": total_pages,
+            "records_committed": cp.records_committed,
+            "total_records": cp.total_records,
+            "percent": round(100.0 * cp.records_committed / cp.total_records, 1) if cp.total_records else None,
+            "updated_at": cp.updated_at.isoformat() if cp.updated_at else None
+        })
+    
+    summary = {}
+    for shard in shards:
+        summary[shard["status"]] = summary.get(shard["status"], 0) + 1
+    return {"shards": shards, "summary": summary}
+
 @router.get("/test-auth")
 def test_auth_token():
     try:
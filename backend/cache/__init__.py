@@ -0,0 +1,26 @@
+"""
+In-process caches for the recommendation request path.
+"""
+
+import logging
+
+from .versioning import bump_marker, read_marker
+from .reference_data import reference_cache, REFERENCE_MARKER
+from .eligibility import eligibility_cache
+from .rankings import ranking_cache, RANKINGS_MARKER
+from .demographic import demographic_cache, DEMOGRAPHIC_MARKER
+from .content import similarity_cache
+from .citizen import citizen_cache, CITIZEN_MARKER, invalidate_synced_records
+
+logger = logging.getLogger(__name__)
+
+
+def warm_caches():
+    """Load every request-path snapshot once (called at worker startup)."""
+    for cache in (reference_cache, eligibility_cache, ranking_cache, demographic_cache, similarity_cache):
+        cache.reload()
+
+
+__all__ = ['reference_cache', 'eligibility_cache', 'ranking_cache', 'demographic_cache', 'similarity_cache',
+           'citizen_cache', 'REFERENCE_MARKER', 'RANKINGS_MARKER', 'DEMOGRAPHIC_MARKER', 'CITIZEN_MARKER',
+           'bump_marker', 'read_marker', 'invalidate_synced_records', 'warm_caches']
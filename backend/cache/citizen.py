@@ -0,0 +1,198 @@
+"""
+Citizen profile cache for returning citizens on the recommend path.
+
+One entry per citizen: demographics, the block of their latest BSK visit and
+the last 10 provisions, reachable by phone and by citizen_id. Entries are
+LRU-evicted and expire after CITIZEN_CACHE_TTL_SECONDS.
+
+Invalidation:
+  - sync_table_paginated drops the citizens it just upserted (this worker).
+  - The 'citizen' marker is bumped when a citizen_master / provision sync
+    finishes, and every worker flushes its whole cache on the next access.
+    The TTL bounds how stale other workers can be while a sync is running.
+  - A 'reference' bump (ml_bsk_master resync) also flushes, since block_id is
+    derived from it.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from .versioning import read_marker
+from .reference_data import REFERENCE_MARKER
+
+logger = logging.getLogger(__name__)
+
+CITIZEN_MARKER = "citizen"
+CITIZEN_CACHE_SIZE = int(os.getenv('CITIZEN_CACHE_SIZE', '50000'))
+CITIZEN_CACHE_TTL_SECONDS = float(os.getenv('CITIZEN_CACHE_TTL_SECONDS', '300'))
+CITIZEN_HISTORY_LIMIT = 10
+# service_history dates in API responses: the source's format, as prov_date was stored before it was typed
+PROV_DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+
+def format_prov_date(value) -> Optional[str]:
+    """TIMESTAMP prov_date → 'DD/MM/YYYY HH:MM:SS' (strings are passed through)."""
+    if value is None or isinstance(value, str):
+        return value
+    return value.strftime(PROV_DATE_FORMAT)
+
+
+class HistoryEntry(NamedTuple):
+    service_id: int
+    service_name: str
+    prov_date: str  # PROV_DATE_FORMAT
+
+
+class CitizenProfile(NamedTuple):
+    citizen_id: str
+    phone: Optional[int]
+    age: Optional[int]
+    gender: Optional[str]
+    caste: Optional[str]
+    religion: Optional[str]
+    block_id: Optional[int]               # block of the latest provision's BSK
+    history: Tuple[HistoryEntry, ...]     # newest first
+
+
+def _phone_key(phone) -> Optional[int]:
+    try:
+        return int(phone) if phone is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CitizenProfileCache:
+    """Thread-safe LRU + TTL map citizen_id → profile, with a phone → citizen_id index."""
+
+    def __init__(self, maxsize: int = CITIZEN_CACHE_SIZE, ttl: float = CITIZEN_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, CitizenProfile]]" = OrderedDict()
+        self._by_phone: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._marker = self._current_marker()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.flushes = 0
+
+    @staticmethod
+    def _current_marker():
+        return (read_marker(CITIZEN_MARKER), read_marker(REFERENCE_MARKER))
+
+    def _check_marker(self):
+        marker = self._current_marker()
+        if marker != self._marker:
+            self._marker = marker
+            if self._entries:
+                self.flushes += 1
+                logger.info(f"🔄 Citizen cache flushed ({len(self._entries)} entries) after sync")
+            self._entries.clear()
+            self._by_phone.clear()
+
+    def _drop(self, citizen_id: str):
+        entry = self._entries.pop(citizen_id, None)
+        if entry is not None:
+            phone = entry[1].phone
+            if phone is not None and self._by_phone.get(phone) == citizen_id:
+                del self._by_phone[phone]
+        return entry
+
+    def get_by_id(self, citizen_id: str) -> Optional[CitizenProfile]:
+        with self._lock:
+            self._check_marker()
+            entry = self._entries.get(citizen_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(citizen_id)
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(citizen_id)
+            self.hits += 1
+            return entry[1]
+
+    def get_by_phone(self, phone) -> Optional[CitizenProfile]:
+        phone = _phone_key(phone)
+        if phone is None:
+            return None
+        with self._lock:
+            self._check_marker()
+            citizen_id = self._by_phone.get(phone)
+        if citizen_id is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        return self.get_by_id(citizen_id)
+
+    def put(self, profile: CitizenProfile):
+        with self._lock:
+            self._check_marker()
+            self._drop(profile.citizen_id)
+            self._entries[profile.citizen_id] = (time.monotonic() + self.ttl, profile)
+            if profile.phone is not None:
+                self._by_phone[profile.phone] = profile.citizen_id
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))   # least recently used
+                self.evictions += 1
+
+    def invalidate(self, citizen_ids: Iterable[str] = (), phones: Iterable = ()) -> int:
+        """Drop the given citizens (by id and/or phone). Returns how many entries were removed."""
+        removed = 0
+        with self._lock:
+            for phone in phones:
+                citizen_id = self._by_phone.get(_phone_key(phone))
+                if citizen_id is not None and self._drop(citizen_id) is not None:
+                    removed += 1
+            for citizen_id in citizen_ids:
+                if citizen_id is not None and self._drop(citizen_id) is not None:
+                    removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_phone.clear()
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "flushes": self.flushes,
+        }
+
+
+citizen_cache = CitizenProfileCache()
+
+
+def invalidate_synced_records(table_name: str, records: list) -> int:
+    """Drop cached profiles touched by a synced citizen_master / provision page."""
+    if table_name in ("citizen_master", "ml_citizen_master"):
+        ids = {r.get("citizen_id") for r in records}
+        phones = {r.get("citizen_phone") for r in records}
+    elif table_name in ("provision", "ml_provision"):
+        ids = {r.get("customer_id") for r in records}
+        phones = {r.get("customer_phone") for r in records}
+    else:
+        return 0
+    return citizen_cache.invalidate(
+        citizen_ids=[str(i) for i in ids if i is not None],
+        phones=[p for p in phones if p is not None]
+    )
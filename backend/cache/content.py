@@ -0,0 +1,37 @@
+"""
+Per-worker content-similarity index.
+
+Built from the similarity matrix (.npy memory map, or CSV) plus current service names. Rebuilt when
+services are re-synced ('reference' marker) or the matrix file changes on disk.
+"""
+
+import os
+
+from sqlalchemy.orm import Session
+
+from ..database.models import Service
+from ..inference.content import SimilarityIndex, load_similarity_matrix, SIMILARITY_MATRIX_PATH
+from ..inference.similarity_store import npy_paths
+from .reference_data import REFERENCE_MARKER
+from .snapshot import SnapshotCache
+
+
+def _matrix_fingerprint():
+    """stat() of the CSV and its binary (.npy) copy - whichever changes triggers a rebuild."""
+    fingerprint = []
+    for path in (SIMILARITY_MATRIX_PATH,) + npy_paths(SIMILARITY_MATRIX_PATH):
+        try:
+            st = os.stat(path)
+            fingerprint.append((st.st_mtime_ns, st.st_ino, st.st_size))
+        except OSError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+
+def load_similarity_index(db: Session) -> SimilarityIndex:
+    service_ids, matrix = load_similarity_matrix()
+    names = {int(sid): name for sid, name in db.query(Service.service_id, Service.service_name) if sid is not None}
+    return SimilarityIndex(service_ids, matrix, names)
+
+
+similarity_cache = SnapshotCache(REFERENCE_MARKER, load_similarity_index, fingerprint=_matrix_fingerprint)
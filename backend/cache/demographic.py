@@ -0,0 +1,85 @@
+"""
+Demographic cluster lookup table.
+
+Maps (district_id, gender, caste, age_group, religion_group) straight to the
+cluster's ranked, block_service_filter-ed service names, replacing the
+grouped_df filter + cluster_service_map/services join per request.
+The snapshot carries the regeneration timestamp it was built from; the same
+timestamp is written into the 'demographic' marker so a worker can tell a
+stale map from a fresh one.
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..database.models import GroupedDF, ClusterServiceMap, Service, RegenerationLog
+from ..database.generations import read_consistent
+from ..inference.filters import block_service_filter
+from .rankings import RANKING_CACHE_DEPTH
+from .snapshot import SnapshotCache
+
+DEMOGRAPHIC_MARKER = "demographic"
+
+ClusterKey = Tuple[int, str, str, str, str]
+
+
+class DemographicSnapshot:
+    """Cluster 5-tuple → ranked service names, tagged with its regeneration timestamp."""
+
+    __slots__ = ("clusters", "version")
+
+    def __init__(self, clusters: Dict[ClusterKey, Tuple[str, ...]], version: Optional[str]):
+        self.clusters = clusters
+        self.version = version
+
+    def top(self, district_id: int, gender: str, caste: str, age_group: str,
+            religion_group: str, limit: int) -> List[str]:
+        return list(self.clusters.get((district_id, gender, caste, age_group, religion_group), ())[:limit])
+
+
+def latest_demographic_version(db: Session) -> Optional[str]:
+    """Timestamp of the last successful cluster_service_map regeneration."""
+    ts = db.query(func.max(RegenerationLog.regeneration_timestamp)).filter(
+        RegenerationLog.table_name == "cluster_service_map",
+        RegenerationLog.status == "success"
+    ).scalar()
+    return ts.isoformat() if ts else None
+
+
+def _load_demographic(db: Session) -> DemographicSnapshot:
+    version = latest_demographic_version(db)
+
+    ranked = defaultdict(list)
+    rows = db.query(ClusterServiceMap.cluster_id, Service.service_name).join(
+        Service, ClusterServiceMap.service_id == Service.service_id
+    ).order_by(ClusterServiceMap.cluster_id, ClusterServiceMap.rank, ClusterServiceMap.service_id)
+    for cluster_id, name in rows:
+        ranked[cluster_id].append(name)
+
+    clusters = {}
+    groups = db.query(
+        GroupedDF.cluster_id, GroupedDF.district_id, GroupedDF.gender,
+        GroupedDF.caste, GroupedDF.age_group, GroupedDF.religion_group
+    ).order_by(GroupedDF.cluster_id)
+    for cluster_id, district_id, gender, caste, age_group, religion_group in groups:
+        if district_id is None:
+            continue
+        key = (int(district_id), gender, caste, age_group, religion_group)
+        if key in clusters:
+            continue  # first cluster wins, like .first()
+        names = (n for n in ranked.get(cluster_id, ()) if block_service_filter(n, caste))
+        clusters[key] = tuple(names)[:RANKING_CACHE_DEPTH]
+
+    return DemographicSnapshot(clusters, version)
+
+
+def load_demographic_snapshot(db: Session) -> DemographicSnapshot:
+    # grouped_df and cluster_service_map from the same published generation
+    snapshot, _ = read_consistent(db, _load_demographic)
+    return snapshot
+
+
+demographic_cache = SnapshotCache(DEMOGRAPHIC_MARKER, load_demographic_snapshot)
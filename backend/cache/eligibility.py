@@ -0,0 +1,12 @@
+"""
+Per-worker EligibilityMatrix snapshot.
+
+services_eligibility is derived from the services master, so it follows the
+same 'reference' marker as the name-resolution snapshot.
+"""
+
+from ..inference.eligibility import EligibilityMatrix
+from .reference_data import REFERENCE_MARKER
+from .snapshot import SnapshotCache
+
+eligibility_cache = SnapshotCache(REFERENCE_MARKER, EligibilityMatrix.from_db)
@@ -0,0 +1,88 @@
+"""
+Materialized per-district and per-block top-N lists.
+
+district_top_services / block_wise_top_services are read once into memory,
+already passed through block_service_filter for both caste variants
+("General" and everyone else), so engine_district / engine_block become a
+dict lookup plus a slice. Rebuilt when regenerate_files bumps the
+'rankings' marker.
+"""
+
+import os
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..database.models import DistrictTopService, BlockTopService
+from ..database.generations import read_consistent
+from ..inference.filters import block_service_filter, is_general_caste
+from .snapshot import SnapshotCache
+
+RANKINGS_MARKER = "rankings"
+
+# How many filtered services to keep per key (engines ask for 5)
+RANKING_CACHE_DEPTH = int(os.getenv('RANKING_CACHE_DEPTH', '50'))
+
+# (non-General list, General list)
+RankingLists = Tuple[Tuple[str, ...], Tuple[str, ...]]
+
+
+def _materialize(ranked: Dict[int, List[str]]) -> Dict[int, RankingLists]:
+    out = {}
+    for key, names in ranked.items():
+        other = tuple(n for n in names if block_service_filter(n, ""))[:RANKING_CACHE_DEPTH]
+        general = tuple(n for n in names if block_service_filter(n, "General"))[:RANKING_CACHE_DEPTH]
+        out[key] = (other, general)
+    return out
+
+
+class RankingSnapshot:
+    """Prefiltered top-N lists keyed by district_id and block_id."""
+
+    __slots__ = ("districts", "blocks")
+
+    def __init__(self, districts: Dict[int, RankingLists], blocks: Dict[int, RankingLists]):
+        self.districts = districts
+        self.blocks = blocks
+
+    @staticmethod
+    def _slice(lists, caste: str, limit: int) -> List[str]:
+        if not lists:
+            return []
+        return list(lists[1 if is_general_caste(caste) else 0][:limit])
+
+    def district_top(self, district_id: int, caste: str, limit: int) -> List[str]:
+        return self._slice(self.districts.get(district_id), caste, limit)
+
+    def block_top(self, block_id: int, caste: str, limit: int) -> List[str]:
+        return self._slice(self.blocks.get(block_id), caste, limit)
+
+
+def _load_rankings(db: Session) -> RankingSnapshot:
+    districts = defaultdict(list)
+    rows = db.query(DistrictTopService.district_id, DistrictTopService.service_name).order_by(
+        DistrictTopService.district_id, DistrictTopService.rank_in_district, DistrictTopService.service_id
+    )
+    for district_id, name in rows:
+        if district_id is not None:
+            districts[int(district_id)].append(name)
+
+    blocks = defaultdict(list)
+    rows = db.query(BlockTopService.block_id, BlockTopService.service_name).order_by(
+        BlockTopService.block_id, BlockTopService.rank_in_block, BlockTopService.service_name
+    )
+    for block_id, name in rows:
+        if block_id is not None:
+            blocks[int(block_id)].append(name)
+
+    return RankingSnapshot(_materialize(districts), _materialize(blocks))
+
+
+def load_ranking_snapshot(db: Session) -> RankingSnapshot:
+    # District and block lists from the same published generation
+    snapshot, _ = read_consistent(db, _load_rankings)
+    return snapshot
+
+
+ranking_cache = SnapshotCache(RANKINGS_MARKER, load_ranking_snapshot)
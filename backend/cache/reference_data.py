@@ -0,0 +1,69 @@
+"""
+Reference-data snapshot for name resolution on the recommend path.
+
+Holds ml_district, ml_bsk_master (block names) and services as lower-cased
+dict indexes so district/block/service name lookups cost no DB round trips.
+Rebuilt when the 'reference' marker is bumped after a master-table sync.
+"""
+
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from ..database.models import District, BSKMaster, Service
+from .snapshot import SnapshotCache
+
+REFERENCE_MARKER = "reference"
+
+
+class ReferenceSnapshot:
+    """Immutable-by-convention name → id indexes (keys are lower-cased like func.lower)."""
+
+    __slots__ = ("districts", "blocks", "services", "service_names")
+
+    def __init__(self, districts: Dict[str, int], blocks: Dict[str, int],
+                 services: Dict[str, int], service_names: Dict[int, str]):
+        self.districts = districts
+        self.blocks = blocks
+        self.services = services
+        self.service_names = service_names
+
+    def district_id(self, district_name: str) -> Optional[int]:
+        return self.districts.get(district_name.lower()) if district_name else None
+
+    def block_id(self, block_name: str) -> Optional[int]:
+        return self.blocks.get(block_name.lower()) if block_name else None
+
+    def service_id(self, service_name: str) -> Optional[int]:
+        return self.services.get(service_name.lower()) if service_name else None
+
+    def service_name(self, service_id: int) -> Optional[str]:
+        return self.service_names.get(service_id)
+
+
+def load_reference_snapshot(db: Session) -> ReferenceSnapshot:
+    """Read the three reference tables once. First row (by PK) wins on duplicate names."""
+    districts: Dict[str, int] = {}
+    for district_id, name in db.query(District.district_id, District.district_name).order_by(District.district_id):
+        if name and district_id is not None:
+            districts.setdefault(name.lower(), int(district_id))
+
+    blocks: Dict[str, int] = {}
+    rows = db.query(BSKMaster.block_municipalty_name, BSKMaster.block_mun_id).filter(
+        BSKMaster.block_mun_id.isnot(None)
+    ).order_by(BSKMaster.bsk_id)
+    for name, block_id in rows:
+        if name:
+            blocks.setdefault(name.lower(), int(block_id))
+
+    services: Dict[str, int] = {}
+    service_names: Dict[int, str] = {}
+    for service_id, name in db.query(Service.service_id, Service.service_name).order_by(Service.service_id):
+        if name and service_id is not None:
+            services.setdefault(name.lower(), int(service_id))
+            service_names[int(service_id)] = name
+
+    return ReferenceSnapshot(districts, blocks, services, service_names)
+
+
+reference_cache = SnapshotCache(REFERENCE_MARKER, load_reference_snapshot)
@@ -0,0 +1,102 @@
+"""
+Per-worker, read-only snapshot holder.
+
+A SnapshotCache wraps a loader `fn(db) -> snapshot`. The snapshot is built off
+to the side and swapped in with a single reference assignment, so readers
+always see either the old or the new snapshot - never a half-built one.
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from ..database.connection import SessionLocal
+from .versioning import read_marker
+
+logger = logging.getLogger(__name__)
+
+# Do not hammer the DB if a load fails (e.g. DB down at startup)
+RELOAD_RETRY_SECONDS = 30
+
+
+class SnapshotCache:
+    """Lazily (re)loaded snapshot, invalidated through a version marker file."""
+
+    def __init__(self, name: str, loader: Callable[[Session], Any],
+                 fingerprint: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self._loader = loader
+        # Optional extra staleness source (e.g. a data file's stat), checked with the marker
+        self._fingerprint = fingerprint
+        self._snapshot = None
+        self._marker = None
+        self._loaded_at: Optional[datetime] = None
+        self._last_failure = 0.0
+        self._lock = threading.Lock()
+
+    def _current_marker(self):
+        if self._fingerprint is None:
+            return read_marker(self.name)
+        return (read_marker(self.name), self._fingerprint())
+
+    def is_current(self) -> bool:
+        """True if a snapshot is loaded and its marker still matches (no DB access)."""
+        return self._snapshot is not None and self._current_marker() == self._marker
+
+    def peek(self):
+        """The loaded snapshot as-is (no marker check, never touches the DB)."""
+        return self._snapshot
+
+    def get(self):
+        """
+        Return the current snapshot, reloading first if the marker changed.
+        Returns the stale snapshot (or None) if a reload fails - callers fall back to the DB.
+        """
+        if self.is_current():
+            return self._snapshot
+
+        with self._lock:
+            if self.is_current():
+                return self._snapshot
+            if time.monotonic() - self._last_failure < RELOAD_RETRY_SECONDS:
+                return self._snapshot
+            self.reload()
+        return self._snapshot
+
+    def reload(self, db: Optional[Session] = None) -> bool:
+        """Build a fresh snapshot and swap it in. Uses `db` if given, else a short-lived session."""
+        marker = self._current_marker()
+        start = time.monotonic()
+        owns_session = db is None
+        if owns_session:
+            db = SessionLocal()
+        try:
+            snapshot = self._loader(db)
+        except Exception as e:
+            self._last_failure = time.monotonic()
+            logger.error(f"❌ Snapshot '{self.name}' load failed: {str(e)[:200]}")
+            return False
+        finally:
+            if owns_session:
+                db.close()
+
+        # Atomic swap: a single reference assignment
+        self._snapshot = snapshot
+        self._marker = marker
+        self._loaded_at = datetime.now()
+        self._last_failure = 0.0
+        logger.info(f"✅ Snapshot '{self.name}' loaded in {(time.monotonic() - start) * 1000:.1f}ms")
+        return True
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "loaded": self._snapshot is not None,
+            "loaded_at": self._loaded_at.isoformat() if self._loaded_at else None,
+            "current": self.is_current(),
+            "version": getattr(self._snapshot, "version", None),
+        }
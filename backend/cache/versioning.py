@@ -0,0 +1,58 @@
+"""
+Cross-worker cache version markers.
+
+Every Gunicorn worker keeps its own in-memory snapshots. Whoever changes the
+underlying tables (sync, regeneration) bumps a small marker file; workers stat
+that file on access and rebuild their snapshot when it changes. Same /tmp
+file-coordination approach as the scheduler and DB-verify locks.
+"""
+
+import os
+import logging
+from datetime import datetime
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CACHE_MARKER_DIR = os.getenv('CACHE_MARKER_DIR', '/tmp')
+
+
+def _marker_path(name: str) -> str:
+    return os.path.join(CACHE_MARKER_DIR, f"bsk_cache_{name}.version")
+
+
+def read_marker(name: str) -> Optional[Tuple[int, int, int]]:
+    """Return a cheap fingerprint (mtime_ns, inode, size) of the marker, or None if never bumped."""
+    try:
+        st = os.stat(_marker_path(name))
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+def read_marker_token(name: str) -> Optional[str]:
+    """Return the token written by the last bump (e.g. a regeneration timestamp)."""
+    try:
+        with open(_marker_path(name), 'r') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def bump_marker(name: str, token: Optional[str] = None) -> str:
+    """
+    Publish a new version for `name`.
+    Written to a temp file and os.replace()d so readers never see a partial token
+    and the inode always changes.
+    """
+    token = token or datetime.now().isoformat()
+    path = _marker_path(name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(token)
+        os.replace(tmp_path, path)
+        logger.info(f"🔖 Cache marker '{name}' bumped → {token}")
+    except OSError as e:
+        logger.error(f"❌ Failed to bump cache marker '{name}': {e}")
+    return token
@@ -0,0 +1,279 @@
+"""
+Set-based bulk ingestion for sync pages.
+
+Insert-only tables (copy_insert):
+instead of one SAVEPOINT + INSERT + flush per record, a sanitized page is
+streamed into a temp staging table with `COPY ... FROM STDIN` and merged into
+the target with a single INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+Rows that cannot be merged (key already present, duplicate key within the
+page, NULL primary key) are written to `sync_rejects` instead of being lost.
+
+Everything runs inside a SAVEPOINT. If COPY or the merge fails (bad value
+for a column type, NOT NULL / FK violation, ...), the savepoint is rolled
+back and the caller falls back to the per-row savepoint path.
+
+Upsert tables (upsert_on_conflict, ml_citizen_master):
+multi-row INSERT ... ON CONFLICT (pk) DO UPDATE ... WHERE <row> IS DISTINCT
+FROM excluded, in batches. Unchanged rows cause no write (no new tuple, no
+WAL). A failing batch is bisected until the bad rows are isolated; those go
+to `sync_rejects` with the database error.
+"""
+
+import io
+import os
+import json
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text, insert, or_, literal_column, UniqueConstraint
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .models import SyncReject
+
+logger = logging.getLogger(__name__)
+
+ROW_COLUMN = "_stg_row"
+UPSERT_BATCH_SIZE = int(os.getenv("SYNC_UPSERT_BATCH_SIZE", "1000"))
+# PostgreSQL caps bind parameters per statement at 65535
+MAX_BIND_PARAMS = 65535
+
+
+def _copy_value(value) -> str:
+    """Render one value in COPY text format (\\N = NULL)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    s = value.isoformat() if isinstance(value, (date, datetime)) else str(value)
+    return s.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_buffer(rows: List[dict], columns: List[str]) -> io.StringIO:
+    buf = io.StringIO()
+    for i, row in enumerate(rows):
+        buf.write(str(i))
+        for c in columns:
+            buf.write("\t")
+            buf.write(_copy_value(row.get(c)))
+        buf.write("\n")
+    buf.seek(0)
+    return buf
+
+
+def _json_safe(record: dict) -> dict:
+    return json.loads(json.dumps(record, default=str))
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def reject_records(db: Session, table_name: str, records: List[dict], reason: str) -> int:
+    """Store records that could not be merged (NULL primary key, row-level DB error)."""
+    if not records:
+        return 0
+    db.execute(insert(SyncReject.__table__), [
+        {"table_name": table_name, "reason": reason, "record": _json_safe(r)} for r in records
+    ])
+    return len(records)
+
+
+def merge_key(table) -> List[str]:
+    """
+    Columns that identify a row when merging: the primary key, or the first
+    UNIQUE constraint when the primary key holds a database-assigned surrogate
+    (info={"derived": True}, e.g. ml_provision (provision_id, prov_date)).
+    """
+    pk = list(table.primary_key.columns)
+    if not any(c.info.get("derived") for c in pk):
+        return [c.name for c in pk]
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            return [c.name for c in constraint.columns]
+    return []
+
+
+def split_null_keys(data: List[dict], pk_cols: List[str]) -> Tuple[List[dict], List[dict]]:
+    """(rows with a complete primary key, rows with a NULL/missing key column)."""
+    valid, invalid = [], []
+    for r in data:
+        (invalid if any(r.get(k) is None for k in pk_cols) else valid).append(r)
+    return valid, invalid
+
+
+def copy_insert(db: Session, table, data: List[dict], pk_cols: Optional[List[str]] = None) -> Tuple[int, int]:
+    """
+    Bulk INSERT `data` (already sanitized) into `table`, skipping key conflicts.
+
+    Returns (inserted, rejected). Raises on any other failure, after rolling
+    back its own SAVEPOINT, so the caller can retry row by row.
+    """
+    if not data:
+        return 0, 0
+
+    pk_cols = pk_cols if pk_cols is not None else merge_key(table)
+    # Column list: every table column present in the page, in table order
+    present = set()
+    for r in data:
+        present.update(r.keys())
+    columns = [c.name for c in table.columns if c.name in present]
+
+    savepoint = db.begin_nested()
+    try:
+        valid, null_key = split_null_keys(data, pk_cols)
+        rejected = reject_records(db, table.name, null_key, "null primary key")
+        if not valid:
+            savepoint.commit()
+            return 0, rejected
+
+        target = _quote(table.name)
+        staging = _quote(f"_stg_{table.name}")
+        col_list = ", ".join(_quote(c) for c in columns)
+
+        db.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+        db.execute(text(
+            f"CREATE TEMP TABLE {staging} ({ROW_COLUMN} bigint, "
+            f"LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP"
+        ))
+
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {staging} ({ROW_COLUMN}, {col_list}) FROM STDIN",
+                _copy_buffer(valid, columns)
+            )
+        finally:
+            cursor.close()
+
+        # One statement: dedupe the page by key (first row wins, like the per-row path),
+        # insert what does not conflict, and send every staged row that did not land to sync_rejects
+        if pk_cols:
+            pk_list = ", ".join(_quote(k) for k in pk_cols)
+            key_match = " AND ".join(f"i.{_quote(k)} = s.{_quote(k)}" for k in pk_cols)
+            merge_sql = f"""
+                WITH candidates AS (
+                    SELECT DISTINCT ON ({pk_list}) * FROM {staging}
+                    ORDER BY {pk_list}, {ROW_COLUMN}
+                ), ins AS (
+                    INSERT INTO {target} ({col_list})
+                    SELECT {col_list} FROM candidates ORDER BY {ROW_COLUMN}
+                    ON CONFLICT DO NOTHING
+                    RETURNING {pk_list}
+                ), rej AS (
+                    INSERT INTO sync_rejects (table_name, reason, record)
+                    SELECT :table_name,
+                           CASE WHEN c.{ROW_COLUMN} IS NULL THEN 'duplicate key in page'
+                                ELSE 'conflict with existing row' END,
+                           to_jsonb(s) - '{ROW_COLUMN}'
+                    FROM {staging} s
+                    LEFT JOIN candidates c ON c.{ROW_COLUMN} = s.{ROW_COLUMN}
+                    WHERE c.{ROW_COLUMN} IS NULL
+                       OR NOT EXISTS (SELECT 1 FROM ins i WHERE {key_match})
+                    RETURNING 1
+                )
+                SELECT (SELECT count(*) FROM ins), (SELECT count(*) FROM rej)
+            """
+        else:
+            merge_sql = f"""
+                WITH ins AS (
+                    INSERT INTO {target} ({col_list})
+                    SELECT {col_list} FROM {staging} ORDER BY {ROW_COLUMN}
+                    RETURNING 1
+                )
+                SELECT (SELECT count(*) FROM ins), 0
+            """
+        inserted, conflicts = db.execute(text(merge_sql), {"table_name": table.name}).one()
+        db.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+        savepoint.commit()
+    except Exception:
+        savepoint.rollback()
+        raise
+
+    rejected += conflicts
+    if rejected:
+        logger.warning(f"⚠️  {rejected}/{len(data)} {table.name} rows rejected → sync_rejects")
+    return inserted, rejected
+
+
+# ------------------------------------------------------------------------------
+# ON CONFLICT upsert
+# ------------------------------------------------------------------------------
+
+def dedupe_by_key(data: List[dict], pk_cols: List[str]) -> List[dict]:
+    """Keep the last row per primary key (a later row in the page supersedes an earlier one)."""
+    latest: Dict[tuple, dict] = {}
+    for r in data:
+        latest[tuple(r[k] for k in pk_cols)] = r
+    return list(latest.values())
+
+
+def _upsert_statement(table, pk_cols: List[str], columns: List[str], batch: List[dict]):
+    stmt = pg_insert(table).values([{c: r.get(c) for c in columns} for r in batch])
+    update_cols = [c for c in columns if c not in pk_cols]
+    if not update_cols:
+        return stmt.on_conflict_do_nothing(index_elements=pk_cols).returning(literal_column("xmax = 0"))
+    return stmt.on_conflict_do_update(
+        index_elements=pk_cols,
+        set_={c: stmt.excluded[c] for c in update_cols},
+        # No-op for unchanged citizens: the row is not rewritten at all
+        where=or_(*[table.c[c].is_distinct_from(stmt.excluded[c]) for c in update_cols])
+    ).returning(literal_column("xmax = 0"))
+
+
+def _upsert_batch(db: Session, table, pk_cols: List[str], columns: List[str], batch: List[dict],
+                  counts: Dict[str, int]):
+    """Upsert one batch in a SAVEPOINT; on failure bisect until single bad rows are isolated."""
+    savepoint = db.begin_nested()
+    try:
+        written = db.execute(_upsert_statement(table, pk_cols, columns, batch)).scalars().all()
+        savepoint.commit()
+    except Exception as e:
+        savepoint.rollback()
+        if len(batch) == 1:
+            pk_val = {k: batch[0].get(k) for k in pk_cols}
+            logger.error(f"Failed to upsert {table.name} record {pk_val}: {str(e)[:200]}")
+            reject_records(db, table.name, batch, f"upsert failed: {str(e).splitlines()[0][:150]}")
+            counts["failed"] += 1
+            return
+        mid = len(batch) // 2
+        _upsert_batch(db, table, pk_cols, columns, batch[:mid], counts)
+        _upsert_batch(db, table, pk_cols, columns, batch[mid:], counts)
+        return
+
+    inserted = sum(1 for is_insert in written if is_insert)
+    counts["inserted"] += inserted
+    counts["updated"] += len(written) - inserted
+    counts["unchanged"] += len(batch) - len(written)
+
+
+def upsert_on_conflict(db: Session, table, data: List[dict], pk_cols: Optional[List[str]] = None,
+                       batch_size: int = UPSERT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Set-based upsert of sanitized rows. Rows are grouped by their column set so a
+    record never overwrites columns it did not carry.
+
+    Returns counts: inserted, updated, unchanged, failed, rejected (NULL key).
+    """
+    pk_cols = pk_cols if pk_cols is not None else merge_key(table)
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": 0, "rejected": 0}
+    if not data:
+        return counts
+
+    valid, null_key = split_null_keys(data, pk_cols)
+    if null_key:
+        logger.warning(f"Skipped {len(null_key)} records with invalid/NULL primary keys → sync_rejects")
+        counts["rejected"] = reject_records(db, table.name, null_key, "null primary key")
+
+    groups: Dict[tuple, List[dict]] = {}
+    for r in dedupe_by_key(valid, pk_cols):
+        columns = tuple(c.name for c in table.columns if c.name in r)
+        groups.setdefault(columns, []).append(r)
+
+    for columns, rows in groups.items():
+        size = max(1, min(batch_size, MAX_BIND_PARAMS // len(columns)))
+        for i in range(0, len(rows), size):
+            _upsert_batch(db, table, pk_cols, list(columns), rows[i:i + size], counts)
+
+    return counts
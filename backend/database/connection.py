@@ -1,6 +1,8 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -33,6 +35,22 @@ engine = create_engine(
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine (asyncpg) for the request path - separate pool so long sync/regeneration
+# jobs on the psycopg2 pool never starve recommendation requests
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL') or \
+    make_url(DATABASE_URL).set(drivername='postgresql+asyncpg').render_as_string(hide_password=False)
+ASYNC_POOL_SIZE = int(os.getenv('DB_ASYNC_POOL_SIZE', '10'))
+ASYNC_MAX_OVERFLOW = int(os.getenv('DB_ASYNC_MAX_OVERFLOW', '20'))
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=ASYNC_POOL_SIZE,
+    max_overflow=ASYNC_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    echo=ECHO_SQL
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -45,3 +63,13 @@ def get_db():
         raise
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for FastAPI to get an AsyncSession (request path)"""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
@@ -0,0 +1,60 @@
+"""
+Version pointer for the regeneration output tables.
+
+A regeneration may build its outputs on several connections, but they are all
+published by one transaction: the staging tables are swapped in and the
+single regeneration_version row is advanced together, so the pointer names
+exactly one complete generation at any time.
+
+Readers that load more than one output table (the per-worker caches) use
+read_consistent(): if the pointer moved while they were reading, a publish
+happened in between and the read is repeated, so a snapshot never mixes
+two generations.
+"""
+
+import logging
+from typing import Any, Callable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+CONSISTENT_READ_ATTEMPTS = 3
+
+
+def current_generation(db: Session) -> Optional[int]:
+    """The published generation, or None before the first publish."""
+    return db.execute(text("SELECT version FROM regeneration_version WHERE id = 1")).scalar()
+
+
+def publish_generation(db: Session, tables: List[str]) -> int:
+    """
+    Advance the pointer inside the caller's transaction - the same one that
+    swaps the new tables in (caller commits). Returns the new version.
+    Publishes are serialized by the row lock until that commit.
+    """
+    return db.execute(text("""
+        INSERT INTO regeneration_version AS v (id, version, published_at, tables)
+        VALUES (1, 1, now(), :tables)
+        ON CONFLICT (id) DO UPDATE
+            SET version = v.version + 1, published_at = excluded.published_at, tables = excluded.tables
+        RETURNING version
+    """), {"tables": ", ".join(tables)[:500]}).scalar()
+
+
+def read_consistent(db: Session, load: Callable[[Session], Any]) -> Tuple[Any, Optional[int]]:
+    """
+    Run `load(db)` so that every table it reads comes from one generation.
+    Returns (result, generation). Retries when a publish lands mid-read; after
+    CONSISTENT_READ_ATTEMPTS the last result is returned (the marker bump that
+    follows every publish triggers another reload anyway).
+    """
+    for attempt in range(1, CONSISTENT_READ_ATTEMPTS + 1):
+        before = current_generation(db)
+        result = load(db)
+        after = current_generation(db)
+        if before == after:
+            return result, after
+        logger.info(f"🔁 Generation {before} → {after} published during read, retry {attempt}")
+    return result, after
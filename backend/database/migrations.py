@@ -0,0 +1,377 @@
+"""
+In-place conversion of the hot dataset tables to the typed schema in models.py.
+
+    ml_citizen_master   district_id / sub_div_id / gp_id   FLOAT   → BIGINT
+                        age                                FLOAT   → SMALLINT (whole years)
+                        gender / caste / religion          VARCHAR → SMALLINT code (ml_attribute_code)
+    ml_provision        prov_date                          VARCHAR → TIMESTAMP
+                        (bsk_id, customer_id, service_id, prov_date) primary key
+                                                           → provision_id BIGSERIAL primary key
+                                                             + UNIQUE (customer_id, prov_date, service_id, bsk_id)
+                        plain table                        → PARTITION BY RANGE (prov_date), one partition
+                                                             per month (partitions.py); both keys gain prov_date
+
+Each table is converted in one transaction with a single table rewrite
+(ALTER TABLE ... ALTER COLUMN ... TYPE ... USING), so it is locked until that
+commits; partitioning ml_provision copies it into the new partitions once
+more. Provisions whose prov_date cannot be parsed, that have a NULL key
+column, or that duplicate another row under the new key are moved to
+sync_rejects (with the original values) instead of being dropped.
+
+A deploy step, for databases that still have the old column types (set up
+before this schema, or re-imported with pandas `to_sql`). Startup only checks
+pending_migrations() and logs an error if anything is left; the tables are
+never rewritten while the API serves traffic. Run it with the API stopped (or
+in a maintenance window) before starting the new version:
+
+    python -m backend.database.migrations               # convert what is pending
+    python -m backend.database.migrations --check       # list pending conversions only
+    python -m backend.database.migrations --benchmark   # time the regeneration queries before and after
+"""
+
+import time
+import logging
+import argparse
+from datetime import date
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from .connection import engine
+from .partitions import (
+    PARTITIONED_TABLE, PARTITION_KEY, PROVISION_PARTITIONS_AHEAD, is_partitioned, create_partition_sql,
+    month_start, add_months
+)
+
+logger = logging.getLogger(__name__)
+
+# column → target type (information_schema.columns.data_type) and the USING expression
+CITIZEN_COLUMNS = {
+    "district_id": ("bigint", "round(district_id::NUMERIC)::BIGINT"),
+    "sub_div_id": ("bigint", "round(sub_div_id::NUMERIC)::BIGINT"),
+    "gp_id": ("bigint", "round(gp_id::NUMERIC)::BIGINT"),
+    # Truncated, not rounded: 17.5 stays a child, 59.9 stays youth
+    "age": ("smallint", "trunc(age::NUMERIC)::SMALLINT"),
+    "gender": ("smallint", "ml_encode_attribute('gender', gender::VARCHAR)"),
+    "caste": ("smallint", "ml_encode_attribute('caste', caste::VARCHAR)"),
+    "religion": ("smallint", "ml_encode_attribute('religion', religion::VARCHAR)"),
+}
+CODED_COLUMNS = ["gender", "caste", "religion"]
+# Generated from age / religion - dropped for the conversion, re-added by ensure_aux_columns
+CITIZEN_GENERATED = ["age_group", "religion_group"]
+
+PROVISION_KEY = ["customer_id", "prov_date", "service_id", "bsk_id"]
+PROVISION_DATE_TYPE = "timestamp without time zone"
+
+# The source sends 'DD/MM/YYYY HH:MM:SS'; ISO strings (earlier imports) are accepted too
+PARSE_PROV_DATE_SQL = r"""
+CREATE OR REPLACE FUNCTION pg_temp.parse_prov_date(s TEXT) RETURNS TIMESTAMP LANGUAGE plpgsql AS $$
+BEGIN
+    IF s ~ '^\d{1,2}/\d{1,2}/\d{4}' THEN
+        RETURN to_timestamp(s, 'DD/MM/YYYY HH24:MI:SS')::TIMESTAMP;
+    ELSIF s ~ '^\d{4}-\d{2}-\d{2}' THEN
+        RETURN s::TIMESTAMP;
+    END IF;
+    RETURN NULL;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END
+$$
+"""
+
+
+def _column_types(conn, table: str) -> Dict[str, str]:
+    return dict(conn.execute(text("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = :table
+    """), {"table": table}).all())
+
+
+def _constraints(conn, table: str) -> Dict[str, str]:
+    """constraint name → contype for `table`."""
+    return dict(conn.execute(text("""
+        SELECT conname, contype FROM pg_constraint WHERE conrelid = CAST(:table AS regclass)
+    """), {"table": table}).all())
+
+
+def _move_to_rejects(conn, reason_sql: str, where: str) -> int:
+    """DELETE the matching provisions and keep them in sync_rejects. Returns how many were moved."""
+    return conn.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM ml_provision p WHERE {where}
+            RETURNING p.*
+        ), rejected AS (
+            INSERT INTO sync_rejects (table_name, reason, record)
+            SELECT 'ml_provision', {reason_sql}, to_jsonb(moved) - 'provision_id' FROM moved
+            RETURNING 1
+        )
+        SELECT count(*) FROM rejected
+    """)).scalar()
+
+
+def citizen_changes(conn) -> Dict[str, tuple]:
+    types = _column_types(conn, "ml_citizen_master")
+    return {c: spec for c, spec in CITIZEN_COLUMNS.items() if c in types and types[c] != spec[0]}
+
+
+def provision_pending(conn) -> bool:
+    types = _column_types(conn, "ml_provision")
+    return bool(types) and (types.get("prov_date") != PROVISION_DATE_TYPE or "provision_id" not in types
+                            or "uq_ml_provision_key" not in _constraints(conn, "ml_provision")
+                            or not is_partitioned(conn))
+
+
+def pending_migrations(bind=None) -> List[str]:
+    """Tables that still have the untyped layout."""
+    bind = bind or engine
+    with bind.connect() as conn:
+        pending = []
+        if citizen_changes(conn):
+            pending.append("ml_citizen_master")
+        if provision_pending(conn):
+            pending.append("ml_provision")
+        return pending
+
+
+def migrate_citizens(conn) -> Dict[str, object]:
+    changes = citizen_changes(conn)
+    if not changes:
+        return {}
+    types = _column_types(conn, "ml_citizen_master")
+
+    # Column types referenced by a trigger or a generated column cannot be changed;
+    # ensure_citizen_clusters / ensure_aux_columns put both back
+    conn.execute(text("DROP TRIGGER IF EXISTS ml_citizen_master_cluster_id ON ml_citizen_master"))
+    generated = [c for c in CITIZEN_GENERATED if c in types]
+    if generated:
+        conn.execute(text("ALTER TABLE ml_citizen_master " + ", ".join(f"DROP COLUMN {c}" for c in generated)))
+
+    # Register every label first (in sorted order): ml_encode_attribute in the rewrite only looks codes up
+    labels = {}
+    for column in CODED_COLUMNS:
+        if column in changes:
+            labels[column] = len(conn.execute(text(f"""
+                SELECT ml_register_attribute(:attribute, label)
+                FROM (SELECT DISTINCT {column}::VARCHAR AS label FROM ml_citizen_master
+                      WHERE {column} IS NOT NULL AND {column}::VARCHAR <> '' ORDER BY 1) l
+            """), {"attribute": column}).all())
+
+    conn.execute(text("ALTER TABLE ml_citizen_master " + ", ".join(
+        f"ALTER COLUMN {column} TYPE {target.upper()} USING {using}"
+        for column, (target, using) in changes.items()
+    )))
+    return {"columns": list(changes), "labels": labels}
+
+
+def migrate_provisions(conn) -> Dict[str, object]:
+    if not provision_pending(conn):
+        return {}
+    types = _column_types(conn, "ml_provision")
+    result = {}
+
+    alter = []
+    if types.get("prov_date") != PROVISION_DATE_TYPE:
+        conn.execute(text(PARSE_PROV_DATE_SQL))
+        result["unparseable"] = _move_to_rejects(
+            conn,
+            "CASE WHEN moved.bsk_id IS NULL OR moved.customer_id IS NULL OR moved.service_id IS NULL "
+            "OR moved.prov_date IS NULL THEN 'migration: null key column' "
+            "ELSE 'migration: unparseable prov_date' END",
+            "p.bsk_id IS NULL OR p.customer_id IS NULL OR p.service_id IS NULL "
+            "OR pg_temp.parse_prov_date(p.prov_date::TEXT) IS NULL"
+        )
+        alter.append("ALTER COLUMN prov_date TYPE TIMESTAMP USING pg_temp.parse_prov_date(prov_date::TEXT)")
+
+    # The old composite primary key is replaced by the surrogate one
+    for name, contype in _constraints(conn, "ml_provision").items():
+        if contype == "p" and "provision_id" not in types:
+            conn.execute(text(f'ALTER TABLE ml_provision DROP CONSTRAINT "{name}"'))
+    if "provision_id" not in types:
+        alter.append("ADD COLUMN provision_id BIGSERIAL")
+    if alter:
+        # One rewrite for the type change and the new column
+        conn.execute(text("ALTER TABLE ml_provision " + ", ".join(alter)))
+
+    constraints = _constraints(conn, "ml_provision")
+    if "uq_ml_provision_key" not in constraints:
+        key = ", ".join(PROVISION_KEY)
+        result["duplicates"] = _move_to_rejects(
+            conn, "'migration: duplicate key'",
+            f"""p.provision_id IN (
+                SELECT provision_id FROM (
+                    SELECT provision_id, row_number() OVER (PARTITION BY {key} ORDER BY provision_id) AS rn
+                    FROM ml_provision
+                ) d WHERE d.rn > 1
+            )"""
+        )
+        ddl = [f"ALTER COLUMN {c} SET NOT NULL" for c in PROVISION_KEY]
+        if not any(contype == "p" for contype in constraints.values()):
+            ddl.append("ADD CONSTRAINT ml_provision_pkey PRIMARY KEY (provision_id)")
+        ddl.append(f"ADD CONSTRAINT uq_ml_provision_key UNIQUE ({key})")
+        conn.execute(text("ALTER TABLE ml_provision " + ", ".join(ddl)))
+
+    if not is_partitioned(conn):
+        logger.info(f"🔧 Copying {PARTITIONED_TABLE} into monthly partitions...")
+        result.update(partition_provisions(conn))
+    return result
+
+
+def partition_provisions(conn) -> Dict[str, int]:
+    """
+    Copy the (typed) plain ml_provision into a monthly-partitioned table that
+    takes its place: same columns, defaults, provision_id sequence and extra
+    indexes. The primary and unique keys include prov_date, as every
+    partitioned key must. Holds an exclusive lock on ml_provision for the
+    whole copy: deploy step only (main() via ensure_typed_schema).
+    """
+    staging = f"_{PARTITIONED_TABLE}_partitioned"
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence(:t, 'provision_id')"), {"t": PARTITIONED_TABLE}).scalar()
+    # Indexes that are not behind a constraint (e.g. ix_ml_provision_ingested_at), recreated by definition
+    indexes = conn.execute(text("""
+        SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i
+        WHERE i.indrelid = CAST(:t AS regclass)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid)
+    """), {"t": PARTITIONED_TABLE}).scalars().all()
+
+    conn.execute(text(f"""
+        CREATE TABLE {staging} (LIKE {PARTITIONED_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE ({PARTITION_KEY})
+    """))
+    months = set(conn.execute(text(f"""
+        SELECT DISTINCT date_trunc('month', {PARTITION_KEY})::DATE FROM {PARTITIONED_TABLE}
+    """)).scalars().all())
+    this_month = month_start(date.today())
+    months.update(add_months(this_month, i) for i in range(PROVISION_PARTITIONS_AHEAD + 1))
+    for month in sorted(months):
+        conn.execute(text(create_partition_sql(month, parent=staging)))
+    rows = conn.execute(text(f"INSERT INTO {staging} SELECT * FROM {PARTITIONED_TABLE}")).rowcount
+
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {staging}.provision_id"))
+    conn.execute(text(f"DROP TABLE {PARTITIONED_TABLE}"))
+    conn.execute(text(f"ALTER TABLE {staging} RENAME TO {PARTITIONED_TABLE}"))
+    # Keys after the copy: one index build per partition instead of row-by-row maintenance
+    key = ", ".join(PROVISION_KEY)
+    conn.execute(text(f"""
+        ALTER TABLE {PARTITIONED_TABLE}
+            ADD CONSTRAINT ml_provision_pkey PRIMARY KEY (provision_id, {PARTITION_KEY}),
+            ADD CONSTRAINT uq_ml_provision_key UNIQUE ({key})
+    """))
+    for indexdef in indexes:
+        conn.execute(text(indexdef))
+    return {"partitions": len(months), "partitioned_rows": rows}
+
+
+MIGRATIONS = {
+    "ml_citizen_master": migrate_citizens,
+    "ml_provision": migrate_provisions,
+}
+
+
+def ensure_typed_schema(bind=None) -> Dict[str, dict]:
+    """
+    Convert every table in pending_migrations(), each in its own transaction.
+    Needs ml_attribute_code / sync_rejects and the attribute code functions
+    (ensure_aux_tables, ensure_attribute_codes). Returns what was done per table.
+    Only called by the CLI below (see the module docstring).
+    """
+    bind = bind or engine
+    done = {}
+    for table in pending_migrations(bind):
+        started = time.perf_counter()
+        logger.info(f"🔧 Migrating {table} (table is locked until this finishes)...")
+        with bind.begin() as conn:
+            done[table] = MIGRATIONS[table](conn)
+        with bind.begin() as conn:
+            # A column type change drops the column statistics
+            conn.execute(text(f"ANALYZE {table}"))
+        logger.info(f"✅ {table} migrated in {time.perf_counter() - started:.1f}s: {done[table]}")
+    return done
+
+
+# ------------------------------------------------------------------------------
+# CLI
+# ------------------------------------------------------------------------------
+
+def _time_history_lookups(db, customers: List[str]) -> float:
+    """Latest provision per citizen (the get_block_id_from_history query) for a sample of citizens."""
+    started = time.perf_counter()
+    for customer_id in customers:
+        db.execute(text("""
+            SELECT bsk_id FROM ml_provision WHERE customer_id = :id ORDER BY prov_date DESC LIMIT 1
+        """), {"id": customer_id}).all()
+    return time.perf_counter() - started
+
+
+def _benchmark(db, hi, repeat: int, customers: List[str]) -> Dict[str, object]:
+    from ..utils.regen_benchmark import measure
+    best, digest, rows = measure(db, hi, repeat)
+    best["history"] = min(_time_history_lookups(db, customers) for _ in range(repeat))
+    # A partitioned table's own size is 0: add up its partitions
+    sizes = {table: db.execute(text("""
+                SELECT COALESCE((SELECT SUM(pg_total_relation_size(relid)) FROM pg_partition_tree(CAST(:t AS regclass))),
+                                pg_total_relation_size(CAST(:t AS regclass)))
+             """), {"t": table}).scalar() for table in MIGRATIONS}
+    db.rollback()
+    return {"best": best, "digest": digest["separate"], "rows": rows, "sizes": sizes}
+
+
+def main():
+    from .connection import SessionLocal
+    from .schema import ensure_aux_tables, ensure_attribute_codes, ensure_aux_columns, ensure_citizen_clusters
+    from .regen_aggregates import ingest_watermark
+    from ..utils.regen_benchmark import log_timings
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only list the tables that still need converting")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time the regeneration queries before and after (logged to regeneration_log)")
+    parser.add_argument("--repeat", type=int, default=1, help="benchmark runs per query set (best is reported)")
+    parser.add_argument("--sample", type=int, default=500, help="citizens in the history lookup sample")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    pending = pending_migrations()
+    print("pending        " + (", ".join(pending) or "none"))
+    if args.check or not pending:
+        return 0
+
+    db = SessionLocal()
+    try:
+        if args.benchmark:
+            hi = ingest_watermark(db)
+            customers = db.execute(text("""
+                SELECT citizen_id FROM ml_citizen_master ORDER BY md5(citizen_id) LIMIT :n
+            """), {"n": args.sample}).scalars().all()
+            before = _benchmark(db, hi, args.repeat, customers)
+
+        ensure_aux_tables()
+        ensure_attribute_codes()
+        done = ensure_typed_schema()
+        ensure_aux_columns()
+        ensure_citizen_clusters()
+        for table, result in done.items():
+            print(f"{table:20s} {result}")
+
+        if args.benchmark:
+            after = _benchmark(db, hi, args.repeat, customers)
+            print(f"\n{'':20s} {'before':>10s} {'after':>10s}")
+            for name in before["best"]:
+                b, a = before["best"][name], after["best"][name]
+                print(f"{name:20s} {b:9.2f}s {a:9.2f}s   {b / a if a else float('inf'):5.2f}x")
+            for table in MIGRATIONS:
+                b, a = before["sizes"][table], after["sizes"][table]
+                print(f"{table:20s} {b / 2 ** 20:8.1f}MB {a / 2 ** 20:8.1f}MB   {b / a:5.2f}x")
+            changed = [t for t in before["digest"] if before["digest"][t] != after["digest"][t]]
+            moved = sum(v for result in done.values() for k, v in result.items() if k in ("unparseable", "duplicates"))
+            print("outputs        " + ("identical" if not changed else
+                                      f"differ in {', '.join(changed)} ({moved:,} provisions moved to sync_rejects)"))
+            for phase, result in ((":before", before), (":after", after)):
+                log_timings(db, hi, result["best"], {**result["rows"], "history": len(customers)},
+                            suffix=phase, triggered_by="migration")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
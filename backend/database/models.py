@@ -1,12 +1,52 @@
 # AUTO-GENERATED models.py from ACTUAL database schema
 # Generated: 2026-01-29 10:54 - FINAL CORRECTED VERSION
 # VERIFIED AGAINST POSTGRESQL DATABASE - MANUAL VERIFICATION
-from sqlalchemy import Column, Integer, String, Date, Boolean, TIMESTAMP, ForeignKey, BigInteger, Numeric, Float
+from sqlalchemy import Column, Integer, SmallInteger, String, Date, Boolean, TIMESTAMP, ForeignKey, BigInteger, Numeric, Float, UniqueConstraint, Computed, literal
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func  
+from sqlalchemy.types import TypeDecorator
 from .connection import Base
 
+# Fixed codes the SQL below relies on; every other label gets the next free code
+# of its attribute when it is first synced (ml_register_attribute, database/schema.py)
+SEEDED_ATTRIBUTE_CODES = [("religion", 1, "Hindu")]
+RELIGION_HINDU = 1
+
+class CodedLabel(TypeDecorator):
+    """
+    SMALLINT code in the table, label in Python: bound values are encoded and
+    selected columns decoded by the database (ml_attribute_code), so ORM / Core
+    code keeps working with 'M' / 'GEN' / 'Hindu'.
+
+    Encoding only looks codes up: a label without a code encodes to NULL (a
+    comparison with it matches nothing), so new labels must be registered
+    before they are written (register_attribute_labels, database/schema.py -
+    the sync loader does). Raw SQL sees the codes and has to go through
+    ml_encode_attribute / ml_decode_attribute itself (e.g. api/batch.py).
+    """
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, attribute: str):
+        super().__init__()
+        self.attribute = attribute
+
+    def bind_expression(self, bindvalue):
+        return func.ml_encode_attribute(literal(self.attribute), bindvalue, type_=SmallInteger)
+
+    def column_expression(self, col):
+        return func.ml_decode_attribute(literal(self.attribute), col, type_=String)
+
+# Demographic cluster attributes of a citizen - shared by the generated columns
+# below and the cluster_id trigger (database/schema.py), which sees NEW.age / NEW.religion
+def age_group_sql(age: str = "age") -> str:
+    return f"CASE WHEN {age} < 18 THEN 'child' WHEN {age} < 60 THEN 'youth' ELSE 'elderly' END"
+
+def religion_group_sql(religion: str = "religion") -> str:
+    return f"CASE WHEN {religion} = {RELIGION_HINDU} THEN 'Hindu' ELSE 'Minority' END"
+
 class CitizenMaster(Base):
-    """ml_citizen_master - 14 columns"""
+    """ml_citizen_master - 14 columns + derived cluster attributes + ingested_at (typed: see database/migrations.py)"""
     __tablename__ = "ml_citizen_master"
 
     citizen_id = Column(String, primary_key=True)
@@ -15,29 +55,57 @@ class CitizenMaster(Base):
     alt_phone = Column(Float)
     email = Column(String)
     guardian_name = Column(String)
-    district_id = Column(Float)
-    sub_div_id = Column(Float)
-    gp_id = Column(Float)
-    gender = Column(String)
+    district_id = Column(BigInteger)
+    sub_div_id = Column(BigInteger)
+    gp_id = Column(BigInteger)
+    gender = Column(CodedLabel("gender"))
     dob = Column(String)
-    age = Column(Float)
-    caste = Column(String)
-    religion = Column(String)
+    age = Column(SmallInteger)
+    caste = Column(CodedLabel("caste"))
+    religion = Column(CodedLabel("religion"))
+    # Derived - never synced: generated columns + ml_citizen_cluster id set by trigger on insert/update
+    age_group = Column(String, Computed(age_group_sql(), persisted=True))
+    religion_group = Column(String, Computed(religion_group_sql(), persisted=True))
+    cluster_id = Column(BigInteger, index=True, info={"derived": True})
+    # When the row was first synced (regen_aggregates: provisions are counted once their citizen is in)
+    ingested_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), index=True)
+
+class CitizenCluster(Base):
+    """ml_citizen_cluster - stable id per demographic cluster key (grouped_df 5-tuple)"""
+    __tablename__ = "ml_citizen_cluster"
+    __table_args__ = (UniqueConstraint('district_id', 'gender', 'caste', 'age_group', 'religion_group',
+                                       name='uq_ml_citizen_cluster_key'),)
+
+    cluster_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    district_id = Column(BigInteger, nullable=False)
+    gender = Column(String, nullable=False)
+    caste = Column(String, nullable=False)
+    age_group = Column(String, nullable=False)
+    religion_group = Column(String, nullable=False)
 
 class Provision(Base):
-    """ml_provision - 10 columns, NO provision_id"""
+    """ml_provision - 10 columns + ingested_at + surrogate provision_id, one partition per month (database/partitions.py)"""
     __tablename__ = "ml_provision"
+    # Natural key of a synced row; customer_id first so it also serves the latest-provisions lookups.
+    # Keys of a partitioned table must contain the partition key, prov_date
+    __table_args__ = (
+        UniqueConstraint('customer_id', 'prov_date', 'service_id', 'bsk_id', name='uq_ml_provision_key'),
+        {"postgresql_partition_by": "RANGE (prov_date)"},
+    )
 
-    # Composite primary key (no single ID column exists)
-    bsk_id = Column(BigInteger, primary_key=True)
-    customer_id = Column(String, primary_key=True)
-    service_id = Column(BigInteger, primary_key=True)
-    prov_date = Column(String, primary_key=True)
+    # Filled by the database (BIGSERIAL) - never synced; rows are merged on uq_ml_provision_key
+    provision_id = Column(BigInteger, primary_key=True, autoincrement=True, info={"derived": True})
+    bsk_id = Column(BigInteger, nullable=False)
+    customer_id = Column(String, nullable=False)
+    service_id = Column(BigInteger, nullable=False)
+    prov_date = Column(TIMESTAMP, primary_key=True)  # Source sends 'DD/MM/YYYY HH:MM:SS'
     bsk_name = Column(String)
     customer_name = Column(String)
     customer_phone = Column(BigInteger)
     service_name = Column(String)
     docket_no = Column(BigInteger)
+    # Set by the database on insert - incremental regeneration picks up rows by this
+    ingested_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), index=True)
 
 class BSKMaster(Base):
     """ml_bsk_master - 24 columns"""
@@ -185,6 +253,23 @@ class SyncMetadata(Base):
     created_at = Column(TIMESTAMP, server_default=func.now())
     updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
 
+class SyncCheckpoint(Base):
+    """sync_checkpoint - page-level progress of a paginated sync window (resume after crash/redeploy)"""
+    __tablename__ = "sync_checkpoint"
+    __table_args__ = (UniqueConstraint('table_name', 'window_start', 'window_end', name='uq_sync_checkpoint_window'),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    table_name = Column(String(100), index=True)  # External table name ('provision', 'citizen_master')
+    window_start = Column(Date)
+    window_end = Column(Date)
+    page_size = Column(Integer)  # Page numbers are only meaningful for the same page size
+    total_records = Column(BigInteger)  # From the meta call
+    last_committed_page = Column(Integer, default=0)
+    records_committed = Column(BigInteger, default=0)
+    status = Column(String(50))  # 'running', 'completed', 'failed', 'superseded' (window re-synced by a later run)
+    started_at = Column(TIMESTAMP, server_default=func.now())
+    updated_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
 class RegenerationLog(Base):
     """regeneration_log - for tracking static file regeneration history"""
     __tablename__ = "regeneration_log"
@@ -197,4 +282,88 @@ class RegenerationLog(Base):
     status = Column(String(50))  # 'success' or 'failed'
     error_message = Column(String(500))  # Error details if failed
     triggered_by = Column(String(50))  # 'scheduler', 'manual', 'admin'
+    mode = Column(String(20))  # 'full' or 'incremental'
+    watermark = Column(TIMESTAMP(timezone=True))  # ml_provision rows ingested before this are included
+    version = Column(BigInteger)  # regeneration_version that published this output
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+class RegenerationVersion(Base):
+    """regeneration_version - single-row pointer to the published generation of the output tables"""
+    __tablename__ = "regeneration_version"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # always 1
+    version = Column(BigInteger, nullable=False)  # bumped by every publish (regeneration or rollback)
+    published_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    tables = Column(String(500))  # Output tables replaced by that publish
+
+class AttributeCode(Base):
+    """ml_attribute_code - label of every SMALLINT code stored in a CodedLabel column"""
+    __tablename__ = "ml_attribute_code"
+    __table_args__ = (UniqueConstraint('attribute', 'label', name='uq_ml_attribute_code_label'),)
+
+    attribute = Column(String(20), primary_key=True)  # 'gender', 'caste', 'religion'
+    code = Column(SmallInteger, primary_key=True, autoincrement=False)
+    label = Column(String, nullable=False)
+
+class SyncReject(Base):
+    """sync_rejects - sync rows the bulk loader could not merge (kept for inspection/replay)"""
+    __tablename__ = "sync_rejects"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    table_name = Column(String(100), index=True)  # Target table (e.g. 'ml_provision')
+    reason = Column(String(200))  # 'conflict with existing row', 'duplicate key in page', ...
+    record = Column(JSONB)  # Sanitized record as it was staged
     created_at = Column(TIMESTAMP, server_default=func.now())
+
+# --- Incremental regeneration aggregates (see backend/database/regen_aggregates.py) ---
+
+class RegenCitizenService(Base):
+    """regen_citizen_services - distinct (citizen, service) pairs already counted for districts"""
+    __tablename__ = "regen_citizen_services"
+
+    customer_id = Column(String, primary_key=True)
+    service_id = Column(BigInteger, primary_key=True)
+
+class RegenDistrictCount(Base):
+    """regen_district_counts - distinct citizens per (district, service)"""
+    __tablename__ = "regen_district_counts"
+
+    district_id = Column(BigInteger, primary_key=True)
+    service_id = Column(BigInteger, primary_key=True)
+    service_name = Column(String)
+    citizen_count = Column(BigInteger)
+
+class RegenDistrictTotal(Base):
+    """regen_district_totals - distinct citizens with any provision per district"""
+    __tablename__ = "regen_district_totals"
+
+    district_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    citizen_count = Column(BigInteger)
+
+class RegenBlockCitizenService(Base):
+    """regen_block_citizen_services - distinct (block, service, citizen) triples already counted"""
+    __tablename__ = "regen_block_citizen_services"
+
+    block_id = Column(BigInteger, primary_key=True)
+    service_name = Column(String, primary_key=True)
+    customer_id = Column(String, primary_key=True)
+
+class RegenBlockCount(Base):
+    """regen_block_counts - distinct citizens per (block, service)"""
+    __tablename__ = "regen_block_counts"
+
+    block_id = Column(BigInteger, primary_key=True)
+    service_name = Column(String, primary_key=True)
+    citizen_count = Column(BigInteger)
+
+class RegenClusterCount(Base):
+    """regen_cluster_counts - provisions per (demographic cluster key, service); key = grouped_df 5-tuple"""
+    __tablename__ = "regen_cluster_counts"
+
+    district_id = Column(BigInteger, primary_key=True)
+    gender = Column(String, primary_key=True)
+    caste = Column(String, primary_key=True)
+    age_group = Column(String, primary_key=True)
+    religion_group = Column(String, primary_key=True)
+    service_id = Column(BigInteger, primary_key=True)
+    usage_count = Column(BigInteger)
@@ -0,0 +1,207 @@
+"""
+Monthly range partitions of ml_provision (PARTITION BY RANGE (prov_date)).
+
+One partition per calendar month, named ml_provision_pYYYYMM. There is no
+DEFAULT partition (it would stop ORDER BY prov_date from reading the newest
+partitions first, and every new partition would have to scan it), so a
+month must have its partition before its rows arrive:
+
+- the sync loader calls ensure_partitions_for() with every provision page,
+- startup and the weekly sync create the current and the next
+  PROVISION_PARTITIONS_AHEAD months, so the loader rarely has to.
+
+Converting a plain ml_provision copies every row, so it is only done by the
+migration CLI (python -m backend.database.migrations), never at startup.
+
+CREATE TABLE ... PARTITION OF locks ml_provision exclusively, so partitions
+are created in their own short transaction, never inside a page's.
+
+Old months leave with archive_partitions(): DETACH PARTITION CONCURRENTLY,
+then the table is moved to the PROVISION_ARCHIVE_SCHEMA schema (or dropped),
+with no DELETE and no long lock. The regen_* counters keep the archived
+history until the next full regeneration.
+
+    python -m backend.database.partitions                          # list partitions
+    python -m backend.database.partitions --archive-before 2023-01   # detach older months into the archive schema
+    python -m backend.database.partitions --archive-before 2023-01 --drop
+"""
+
+import os
+import re
+import logging
+import argparse
+from datetime import date, datetime
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import text
+
+from .connection import engine
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLE = "ml_provision"
+PARTITION_KEY = "prov_date"
+PROVISION_PARTITIONS_AHEAD = int(os.getenv("PROVISION_PARTITIONS_AHEAD", "2"))
+PROVISION_ARCHIVE_SCHEMA = os.getenv("PROVISION_ARCHIVE_SCHEMA", "archive")
+# 0 = keep every month; otherwise the weekly sync archives months older than this
+PROVISION_RETENTION_MONTHS = int(os.getenv("PROVISION_RETENTION_MONTHS", "0"))
+# A page waits at most this long for the lock to add a partition (then fails and is retried on resume)
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "30s")
+PARTITION_LOCK_ID = 7262002
+
+_LOWER_BOUND = re.compile(r"FROM \('(\d{4})-(\d{2})-01")
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARTITIONED_TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text("""
+        SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)
+    """), {"table": PARTITIONED_TABLE}).scalar() or False
+
+
+def list_partitions(conn) -> List[Tuple[str, date]]:
+    """(partition, first day of its month) for every attached partition, oldest first."""
+    rows = conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(:table)
+    """), {"table": PARTITIONED_TABLE}).all()
+    partitions = []
+    for name, bound in rows:
+        match = _LOWER_BOUND.search(bound or "")
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition_sql(month: date, parent: str = PARTITIONED_TABLE) -> str:
+    return (f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+
+
+def ensure_partitions(months: Iterable[date], bind=None) -> List[str]:
+    """Create the partitions of `months` that do not exist yet. Returns the partitions created."""
+    bind = bind or engine
+    wanted = {month_start(m) for m in months}
+    if not wanted:
+        return []
+    with bind.begin() as conn:
+        if not is_partitioned(conn):
+            return []
+        missing = sorted(wanted - {month for _, month in list_partitions(conn)})
+        if not missing:
+            return []
+        conn.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARTITION_LOCK_ID})
+        # Re-read under the lock: another worker may have added some meanwhile
+        missing = sorted(set(missing) - {month for _, month in list_partitions(conn)})
+        for month in missing:
+            conn.execute(text(create_partition_sql(month)))
+    if missing:
+        logger.info(f"✅ Created {PARTITIONED_TABLE} partitions: {', '.join(partition_name(m) for m in missing)}")
+    return [partition_name(m) for m in missing]
+
+
+def ensure_partitions_for(table, records: List[dict], bind=None) -> List[str]:
+    """ensure_partitions() for the months of a sanitized page (no-op for other tables)."""
+    if table.name != PARTITIONED_TABLE:
+        return []
+    return ensure_partitions(
+        {month_start(r[PARTITION_KEY]) for r in records if isinstance(r.get(PARTITION_KEY), datetime)}, bind
+    )
+
+
+def ensure_upcoming_partitions(bind=None, ahead: int = PROVISION_PARTITIONS_AHEAD) -> List[str]:
+    """This month's partition and the next `ahead` ones."""
+    this_month = month_start(date.today())
+    return ensure_partitions([add_months(this_month, i) for i in range(ahead + 1)], bind)
+
+
+def archive_partitions(before: date, bind=None, drop: bool = False) -> List[str]:
+    """
+    Detach every partition of a month before `before` and move it into the
+    archive schema (drop=True: drop it). Returns the partitions archived.
+    DETACH ... CONCURRENTLY cannot run in a transaction block: each statement commits on its own.
+    """
+    bind = bind or engine
+    archived = []
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not is_partitioned(conn):
+            return []
+        # An interrupted concurrent detach leaves the partition half-detached
+        for (name,) in conn.execute(text("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(:table) AND i.inhdetachpending
+        """), {"table": PARTITIONED_TABLE}).all():
+            conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name} FINALIZE"))
+
+        old = [name for name, month in list_partitions(conn) if month < month_start(before)]
+        if old and not drop:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {PROVISION_ARCHIVE_SCHEMA}"))
+        for name in old:
+            conn.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name} CONCURRENTLY"))
+            if drop:
+                conn.execute(text(f"DROP TABLE {name}"))
+            else:
+                conn.execute(text(f"ALTER TABLE {name} SET SCHEMA {PROVISION_ARCHIVE_SCHEMA}"))
+            archived.append(name)
+
+    if archived:
+        where = "dropped" if drop else f"moved to schema {PROVISION_ARCHIVE_SCHEMA}"
+        logger.info(f"🗄️  Detached {len(archived)} {PARTITIONED_TABLE} partitions ({where}): {', '.join(archived)}")
+    return archived
+
+
+def apply_retention(bind=None, months: int = PROVISION_RETENTION_MONTHS) -> List[str]:
+    """Archive the months older than the last `months` (PROVISION_RETENTION_MONTHS; 0 = keep all)."""
+    if months <= 0:
+        return []
+    return archive_partitions(add_months(month_start(date.today()), -months), bind)
+
+
+def _parse_month(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archive-before", type=_parse_month, metavar="YYYY-MM",
+                        help="detach the partitions of every month before this one")
+    parser.add_argument("--drop", action="store_true", help="drop the detached partitions instead of archiving them")
+    parser.add_argument("--ahead", type=int, default=None, help="also create this many future months")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.ahead is not None:
+        ensure_upcoming_partitions(ahead=args.ahead)
+    if args.archive_before:
+        archive_partitions(args.archive_before, drop=args.drop)
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            print(f"{PARTITIONED_TABLE} is not partitioned (python -m backend.database.migrations converts it)")
+            return 1
+        partitions = list_partitions(conn)
+        rows = dict(conn.execute(text(f"""
+            SELECT tableoid::regclass::text, count(*) FROM {PARTITIONED_TABLE} GROUP BY 1
+        """)).all())
+    for name, month in partitions:
+        print(f"{name:22s} {month:%Y-%m}   {rows.get(name, 0):>10,} rows")
+    print(f"{len(partitions)} partitions, {sum(rows.values()):,} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,498 @@
+"""
+Counter tables behind incremental regeneration of the ranking outputs.
+
+Each output is derived from a small aggregate that can be advanced by a
+window of newly ingested ml_provision rows (`ingested_at`):
+
+    district_top_services    regen_district_counts   distinct citizens per (district, service)
+                             regen_district_totals   distinct citizens per district
+                             regen_citizen_services  (citizen, service) pairs already counted
+    block_wise_top_services  regen_block_counts      distinct citizens per (block, service_name)
+                             regen_block_citizen_services  (block, service_name, citizen) already counted
+    cluster_service_map      regen_cluster_counts    provisions per (grouped_df 5-tuple, service)
+
+apply_*_window() folds a window into the counters and returns the partitions
+whose counts changed; rank_*() ranks only those partitions into the output's
+staging table and carries the other partitions over from the live table (or
+ranks all of them after a full rebuild, i.e. reset + window from the beginning).
+
+A full rebuild of all outputs at once (type=all) can instead seed every counter
+from one pass over the provision/citizen join (build_scan_aggregate +
+seed_aggregates_from_scan) rather than one scan per output family.
+
+Demographic clusters are the stable ml_citizen_cluster ids that the
+ml_citizen_master trigger keeps in ml_citizen_master.cluster_id (see schema.py),
+so cluster counting is a plain GROUP BY cluster_id and grouped_df keeps its ids
+from one generation to the next.
+
+A provision is counted for its citizen's district / cluster in the window in
+which the later of the two arrived (ml_provision.ingested_at and
+ml_citizen_master.ingested_at; NULL = before either column existed). A
+provision synced before its citizen is therefore held back, and counted by the
+run that sees the citizen arrive.
+
+Citizens are attributed with their attributes at the time their provisions are
+counted, and a BSK to the block it belongs to at that time: later district
+moves or age_group drift are not re-attributed by the incremental path. That
+is what the periodic full rebuild is for (REGENERATION_FULL_EVERY_DAYS in
+api/generate.py), which recounts everything with current attributes.
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .models import RegenerationLog
+
+logger = logging.getLogger(__name__)
+
+DISTRICT_AGGREGATES = ["regen_citizen_services", "regen_district_counts", "regen_district_totals"]
+BLOCK_AGGREGATES = ["regen_block_citizen_services", "regen_block_counts"]
+CLUSTER_AGGREGATES = ["regen_cluster_counts"]
+
+
+# ------------------------------------------------------------------------------
+# Watermarks
+# ------------------------------------------------------------------------------
+
+def ingest_watermark(db: Session) -> datetime:
+    """
+    Upper bound for this run's window: rows with ingested_at below it are all committed.
+
+    ingested_at defaults to the inserting transaction's start time, so a row that
+    is not visible yet belongs to a transaction that is still open - the bound is
+    held back to the oldest open transaction (rows past it go to the next run).
+    """
+    return db.execute(text("""
+        SELECT LEAST(now(), COALESCE(MIN(xact_start), now()))
+        FROM pg_stat_activity
+        WHERE datname = current_database()
+          AND backend_type = 'client backend'
+          AND xact_start IS NOT NULL
+          AND pid <> pg_backend_pid()
+    """)).scalar()
+
+
+def last_watermark(db: Session, table_name: str) -> Optional[datetime]:
+    """
+    Watermark of the last successful regeneration of `table_name`.
+    None (= full rebuild needed) if there is none, or if the counters may be
+    ahead of the published output: it was rolled back since, or a later run
+    advanced the counters but its generation was never published (staged /
+    discarded).
+    """
+    last = db.query(RegenerationLog.status, RegenerationLog.watermark).filter(
+        RegenerationLog.table_name == table_name,
+        RegenerationLog.status.in_(["success", "rolled_back", "staged", "discarded"])
+    ).order_by(RegenerationLog.id.desc()).first()
+    if last is None or last.status != "success":
+        return None
+    return last.watermark
+
+
+def _window(lo: Optional[datetime]) -> str:
+    """ml_provision p filter for [lo, hi); lo=None means all history up to hi. Parameters: _window_params()."""
+    if lo is None:
+        return "(p.ingested_at < :hi OR p.ingested_at IS NULL)"
+    # The prov_date range limits the scan to the monthly partitions holding the window's rows
+    return "p.ingested_at >= :lo AND p.ingested_at < :hi AND p.prov_date BETWEEN :date_lo AND :date_hi"
+
+
+def _window_params(db: Session, lo: Optional[datetime], hi: datetime) -> Dict[str, Optional[datetime]]:
+    """
+    Bind parameters for _window(lo). ml_provision is partitioned on prov_date,
+    not ingested_at, so the window's prov_date range is looked up first (one
+    ingested_at index probe per partition) and passed as a prunable bound.
+    """
+    params = {"lo": lo, "hi": hi}
+    if lo is not None:
+        params["date_lo"], params["date_hi"] = db.execute(text("""
+            SELECT MIN(p.prov_date), MAX(p.prov_date) FROM ml_provision p
+            WHERE p.ingested_at >= :lo AND p.ingested_at < :hi
+        """), params).one()
+    return params
+
+
+def last_full_rebuild(db: Session, table_name: str) -> Optional[datetime]:
+    """When `table_name` was last published by a full rebuild (None if never)."""
+    return db.query(RegenerationLog.regeneration_timestamp).filter(
+        RegenerationLog.table_name == table_name,
+        RegenerationLog.status == "success",
+        RegenerationLog.mode == "full"
+    ).order_by(RegenerationLog.id.desc()).limit(1).scalar()
+
+
+def _citizen_window(lo: Optional[datetime]) -> str:
+    """
+    Provisions joined to their citizens, for the pairs that become countable in [lo, hi):
+    the provision arrived in the window (its citizen already there), or the citizen
+    arrived in the window (its provisions already there). Columns: customer_id,
+    service_id, service_name, district_id, cluster_id. Parameters: _window_params().
+    """
+    columns = "p.customer_id, p.service_id, p.service_name, c.district_id, c.cluster_id"
+    citizen_known = "(c.ingested_at < :hi OR c.ingested_at IS NULL)"
+    if lo is None:
+        return f"""
+            SELECT {columns} FROM ml_provision p
+            JOIN ml_citizen_master c ON c.citizen_id = p.customer_id
+            WHERE {_window(None)} AND {citizen_known}"""
+    return f"""
+            SELECT {columns} FROM ml_provision p
+            JOIN ml_citizen_master c ON c.citizen_id = p.customer_id
+            WHERE {_window(lo)} AND {citizen_known}
+            UNION ALL
+            SELECT {columns} FROM ml_citizen_master c
+            JOIN ml_provision p ON p.customer_id = c.citizen_id
+            WHERE c.ingested_at >= :lo AND c.ingested_at < :hi
+              AND (p.ingested_at < :lo OR p.ingested_at IS NULL)"""
+
+
+def reset_aggregates(db: Session, tables: Sequence[str]):
+    db.execute(text(f"TRUNCATE TABLE {', '.join(tables)}"))
+
+
+def carry_over(db: Session, source: str, target: str, key_column: str, changed: List) -> int:
+    """Copy the rows of every partition not in `changed` from the live output into its staging table."""
+    return db.execute(text(
+        f"INSERT INTO {target} SELECT * FROM {source} WHERE NOT ({key_column} = ANY(:changed))"
+    ), {"changed": list(changed)}).rowcount
+
+
+# ------------------------------------------------------------------------------
+# District: distinct citizens per (district, service) + per district
+# ------------------------------------------------------------------------------
+
+def apply_district_window(db: Session, lo: Optional[datetime], hi: datetime) -> List[int]:
+    """Count the window's new (citizen, service) pairs. Returns the district_ids whose counts changed."""
+    rows = db.execute(text(f"""
+        WITH window_rows AS (
+            SELECT w.customer_id, w.service_id, w.service_name
+            FROM ({_citizen_window(lo)}
+            ) w
+            WHERE w.district_id IS NOT NULL AND w.service_id IS NOT NULL
+        ), names AS (
+            SELECT service_id, MAX(service_name) AS service_name FROM window_rows GROUP BY service_id
+        ), new_pairs AS (
+            INSERT INTO regen_citizen_services (customer_id, service_id)
+            SELECT DISTINCT customer_id, service_id FROM window_rows
+            ON CONFLICT DO NOTHING
+            RETURNING customer_id, service_id
+        ), new_citizens AS (
+            -- Reads the pair table as it was before this statement: citizens with no earlier pair
+            SELECT DISTINCT n.customer_id FROM new_pairs n
+            WHERE NOT EXISTS (SELECT 1 FROM regen_citizen_services r WHERE r.customer_id = n.customer_id)
+        ), counts AS (
+            INSERT INTO regen_district_counts AS k (district_id, service_id, service_name, citizen_count)
+            SELECT c.district_id, n.service_id, MAX(nm.service_name), COUNT(*)
+            FROM new_pairs n
+            JOIN ml_citizen_master c ON c.citizen_id = n.customer_id
+            JOIN names nm ON nm.service_id = n.service_id
+            GROUP BY c.district_id, n.service_id
+            ON CONFLICT (district_id, service_id) DO UPDATE
+                SET citizen_count = k.citizen_count + excluded.citizen_count,
+                    service_name = excluded.service_name
+            RETURNING k.district_id
+        ), totals AS (
+            INSERT INTO regen_district_totals AS t (district_id, citizen_count)
+            SELECT c.district_id, COUNT(*)
+            FROM new_citizens n
+            JOIN ml_citizen_master c ON c.citizen_id = n.customer_id
+            GROUP BY c.district_id
+            ON CONFLICT (district_id) DO UPDATE SET citizen_count = t.citizen_count + excluded.citizen_count
+            RETURNING t.district_id
+        )
+        SELECT district_id FROM counts UNION SELECT district_id FROM totals
+    """), _window_params(db, lo, hi)).scalars().all()
+    return sorted(rows)
+
+
+def rank_districts(db: Session, target: str, district_ids: Optional[List[int]] = None,
+                   carry_from: Optional[str] = None) -> int:
+    """
+    Write district_top_services rows into `target` (an empty staging table):
+    every district, or only `district_ids` plus the unchanged districts copied
+    from `carry_from`. Returns the rows ranked.
+    """
+    if district_ids is None:
+        scope, params = "", {}
+    else:
+        carry_over(db, carry_from, target, "district_id", district_ids)
+        if not district_ids:
+            return 0
+        scope, params = "WHERE k.district_id = ANY(:ids)", {"ids": district_ids}
+
+    return db.execute(text(f"""
+        INSERT INTO {target} (district_id, district_name, service_id, service_name, unique_citizen_count, citizen_percentage, rank_in_district)
+        SELECT
+            k.district_id,
+            d.district_name,
+            k.service_id,
+            k.service_name,
+            k.citizen_count,
+            COALESCE(ROUND((k.citizen_count::DECIMAL / NULLIF(t.citizen_count, 0)) * 100, 2), 0),
+            RANK() OVER (PARTITION BY k.district_id ORDER BY k.citizen_count DESC)
+        FROM regen_district_counts k
+        JOIN ml_district d ON d.district_id = k.district_id
+        JOIN regen_district_totals t ON t.district_id = k.district_id
+        {scope}
+    """), params).rowcount
+
+
+# ------------------------------------------------------------------------------
+# Block: distinct citizens per (block of the BSK, service_name)
+# ------------------------------------------------------------------------------
+
+def apply_block_window(db: Session, lo: Optional[datetime], hi: datetime) -> List[int]:
+    """Count the window's new (block, service, citizen) triples. Returns the block_ids whose counts changed."""
+    rows = db.execute(text(f"""
+        WITH new_triples AS (
+            INSERT INTO regen_block_citizen_services (block_id, service_name, customer_id)
+            SELECT DISTINCT b.block_mun_id, p.service_name, p.customer_id
+            FROM ml_provision p
+            JOIN ml_bsk_master b ON p.bsk_id = b.bsk_id
+            WHERE {_window(lo)}
+              AND b.block_mun_id IS NOT NULL AND p.service_name IS NOT NULL AND p.customer_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+            RETURNING block_id, service_name
+        ), counts AS (
+            INSERT INTO regen_block_counts AS k (block_id, service_name, citizen_count)
+            SELECT block_id, service_name, COUNT(*) FROM new_triples GROUP BY block_id, service_name
+            ON CONFLICT (block_id, service_name) DO UPDATE SET citizen_count = k.citizen_count + excluded.citizen_count
+            RETURNING k.block_id
+        )
+        SELECT DISTINCT block_id FROM counts
+    """), _window_params(db, lo, hi)).scalars().all()
+    return sorted(rows)
+
+
+def rank_blocks(db: Session, target: str, block_ids: Optional[List[int]] = None,
+                carry_from: Optional[str] = None) -> int:
+    """Write block_wise_top_services rows into `target` (see rank_districts). Returns the rows ranked."""
+    if block_ids is None:
+        scope, names_scope, params = "", "", {}
+    else:
+        carry_over(db, carry_from, target, "block_id", block_ids)
+        if not block_ids:
+            return 0
+        scope, names_scope, params = "WHERE k.block_id = ANY(:ids)", "AND block_mun_id = ANY(:ids)", {"ids": block_ids}
+
+    return db.execute(text(f"""
+        INSERT INTO {target} (block_id, service_name, block_name, rank_in_block)
+        WITH block_names AS (
+            SELECT block_mun_id AS block_id, MAX(block_municipalty_name) AS block_name
+            FROM ml_bsk_master
+            WHERE block_mun_id IS NOT NULL {names_scope}
+            GROUP BY block_mun_id
+        )
+        SELECT
+            k.block_id,
+            k.service_name,
+            n.block_name,
+            RANK() OVER (PARTITION BY k.block_id ORDER BY k.citizen_count DESC)
+        FROM regen_block_counts k
+        LEFT JOIN block_names n ON n.block_id = k.block_id
+        {scope}
+    """), params).rowcount
+
+
+# ------------------------------------------------------------------------------
+# Demographic clusters: provisions per (grouped_df 5-tuple, service)
+# ------------------------------------------------------------------------------
+
+def apply_cluster_window(db: Session, lo: Optional[datetime], hi: datetime) -> List[int]:
+    """
+    Add the window's provisions to the cluster counters. Returns the cluster_ids
+    (ml_citizen_cluster) whose counts changed. Citizens without a cluster_id
+    (NULL district/gender/caste) belong to no cluster.
+    """
+    rows = db.execute(text(f"""
+        WITH window_counts AS (
+            SELECT w.cluster_id, w.service_id, COUNT(*) AS usage_count
+            FROM ({_citizen_window(lo)}
+            ) w
+            WHERE w.cluster_id IS NOT NULL AND w.service_id IS NOT NULL
+            GROUP BY w.cluster_id, w.service_id
+        ), counts AS (
+            INSERT INTO regen_cluster_counts AS k (district_id, gender, caste, age_group, religion_group, service_id, usage_count)
+            SELECT g.district_id, g.gender, g.caste, g.age_group, g.religion_group, w.service_id, w.usage_count
+            FROM window_counts w
+            JOIN ml_citizen_cluster g ON g.cluster_id = w.cluster_id
+            ON CONFLICT (district_id, gender, caste, age_group, religion_group, service_id)
+                DO UPDATE SET usage_count = k.usage_count + excluded.usage_count
+        )
+        SELECT DISTINCT cluster_id FROM window_counts
+    """), _window_params(db, lo, hi)).scalars().all()
+    return sorted(rows)
+
+
+def insert_clusters(db: Session, target: str) -> int:
+    """Write grouped_df (every ml_citizen_cluster held by a citizen) into `target`. Returns the clusters."""
+    return db.execute(text(f"""
+        INSERT INTO {target} (cluster_id, district_id, gender, caste, age_group, religion_group)
+        SELECT g.cluster_id, g.district_id, g.gender, g.caste, g.age_group, g.religion_group
+        FROM ml_citizen_cluster g
+        WHERE EXISTS (SELECT 1 FROM ml_citizen_master c WHERE c.cluster_id = g.cluster_id)
+    """)).rowcount
+
+
+def clusters_match_registry(db: Session, grouped: str = "grouped_df") -> bool:
+    """
+    Whether every cluster of `grouped` has its ml_citizen_cluster id. False for a
+    grouped_df numbered before the registry existed (e.g. imported from CSV) -
+    it has to be rebuilt in full before clusters can be added to it.
+    """
+    return not db.execute(text(f"""
+        SELECT EXISTS (
+            SELECT 1 FROM {grouped} g
+            LEFT JOIN ml_citizen_cluster k ON k.cluster_id = g.cluster_id
+            WHERE (k.district_id, k.gender, k.caste, k.age_group, k.religion_group)
+                  IS DISTINCT FROM (g.district_id, g.gender, g.caste, g.age_group, g.religion_group)
+        )
+    """)).scalar()
+
+
+def add_missing_clusters(db: Session, target: str, cluster_ids: List[int]) -> int:
+    """Append the ml_citizen_cluster rows of `cluster_ids` that `target` (grouped_df) does not have yet."""
+    if not cluster_ids:
+        return 0
+    return db.execute(text(f"""
+        INSERT INTO {target} (cluster_id, district_id, gender, caste, age_group, religion_group)
+        SELECT g.cluster_id, g.district_id, g.gender, g.caste, g.age_group, g.religion_group
+        FROM ml_citizen_cluster g
+        WHERE g.cluster_id = ANY(:ids)
+          AND NOT EXISTS (SELECT 1 FROM {target} t WHERE t.cluster_id = g.cluster_id)
+    """), {"ids": cluster_ids}).rowcount
+
+
+def rank_clusters(db: Session, target: str, grouped: str, cluster_ids: Optional[List[int]] = None,
+                  carry_from: Optional[str] = None) -> int:
+    """
+    Write cluster_service_map rows into `target` for the clusters of `grouped`
+    (the grouped_df generation being built): all of them, or `cluster_ids`
+    plus the unchanged clusters copied from `carry_from`. Returns the rows ranked.
+    """
+    if cluster_ids is None:
+        scope, params = "", {}
+    else:
+        carry_over(db, carry_from, target, "cluster_id", cluster_ids)
+        if not cluster_ids:
+            return 0
+        scope, params = "WHERE g.cluster_id = ANY(:ids)", {"ids": cluster_ids}
+
+    return db.execute(text(f"""
+        INSERT INTO {target} (cluster_id, service_id, rank)
+        SELECT
+            g.cluster_id,
+            k.service_id,
+            RANK() OVER (PARTITION BY g.cluster_id ORDER BY k.usage_count DESC)
+        FROM {grouped} g
+        JOIN regen_cluster_counts k
+          ON k.district_id = g.district_id AND k.gender = g.gender AND k.caste = g.caste
+         AND k.age_group = g.age_group AND k.religion_group = g.religion_group
+        {scope}
+    """), params).rowcount
+
+# ------------------------------------------------------------------------------
+# Single scan (type=all, full): every counter seeded from one provision ⟗ citizen pass
+# ------------------------------------------------------------------------------
+
+SCAN_TABLE = "_regen_scan"
+
+
+def build_scan_aggregate(db: Session, hi: datetime) -> int:
+    """
+    One pass over ml_provision (up to `hi`) FULL JOIN ml_citizen_master, with the
+    block of each BSK, into the temp table SCAN_TABLE: one row per
+    (citizen, district + cluster_id, block, service) with its provision count.
+
+    Keeping the citizen in the key is what lets distinct-citizen counts be taken
+    per district and per block from the same rows. Citizens without provisions
+    are kept (service NULL, 0 provisions) so grouped_df can be derived from it
+    too, and provisions of citizens not in ml_citizen_master (no district or
+    cluster) still count for their block. Citizens that arrived after `hi` are
+    left to the next window, like in _citizen_window(). Lives until the end of
+    the transaction.
+    Returns the number of aggregate rows.
+    """
+    db.execute(text(f"DROP TABLE IF EXISTS {SCAN_TABLE}"))
+    return db.execute(text(f"""
+        CREATE TEMP TABLE {SCAN_TABLE} ON COMMIT DROP AS
+        SELECT
+            COALESCE(p.customer_id, c.citizen_id) AS customer_id,
+            c.district_id AS district_id,
+            c.cluster_id,
+            b.block_mun_id AS block_id,
+            p.service_id,
+            p.service_name,
+            COUNT(p.customer_id) AS provisions
+        FROM (
+            SELECT p.customer_id, p.bsk_id, p.service_id, p.service_name
+            FROM ml_provision p
+            WHERE {_window(None)} AND p.customer_id IS NOT NULL
+        ) p
+        FULL JOIN (
+            SELECT c.citizen_id, c.district_id, c.cluster_id FROM ml_citizen_master c
+            WHERE c.ingested_at < :hi OR c.ingested_at IS NULL
+        ) c ON c.citizen_id = p.customer_id
+        LEFT JOIN ml_bsk_master b ON b.bsk_id = p.bsk_id
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """), {"hi": hi}).rowcount
+
+
+def seed_aggregates_from_scan(db: Session) -> Dict[str, int]:
+    """
+    Fill every (reset) counter table from SCAN_TABLE with the same filters the
+    apply_*_window() functions use. Returns rows written per counter table.
+    """
+    statements = {
+        "regen_citizen_services": f"""
+            INSERT INTO regen_citizen_services (customer_id, service_id)
+            SELECT DISTINCT customer_id, service_id FROM {SCAN_TABLE}
+            WHERE district_id IS NOT NULL AND service_id IS NOT NULL
+        """,
+        "regen_district_counts": f"""
+            INSERT INTO regen_district_counts (district_id, service_id, service_name, citizen_count)
+            SELECT district_id, service_id, MAX(service_name), COUNT(DISTINCT customer_id) FROM {SCAN_TABLE}
+            WHERE district_id IS NOT NULL AND service_id IS NOT NULL
+            GROUP BY district_id, service_id
+        """,
+        "regen_district_totals": f"""
+            INSERT INTO regen_district_totals (district_id, citizen_count)
+            SELECT district_id, COUNT(DISTINCT customer_id) FROM {SCAN_TABLE}
+            WHERE district_id IS NOT NULL AND service_id IS NOT NULL
+            GROUP BY district_id
+        """,
+        "regen_block_citizen_services": f"""
+            INSERT INTO regen_block_citizen_services (block_id, service_name, customer_id)
+            SELECT DISTINCT block_id, service_name, customer_id FROM {SCAN_TABLE}
+            WHERE block_id IS NOT NULL AND service_name IS NOT NULL
+        """,
+        "regen_block_counts": f"""
+            INSERT INTO regen_block_counts (block_id, service_name, citizen_count)
+            SELECT block_id, service_name, COUNT(DISTINCT customer_id) FROM {SCAN_TABLE}
+            WHERE block_id IS NOT NULL AND service_name IS NOT NULL
+            GROUP BY block_id, service_name
+        """,
+        "regen_cluster_counts": f"""
+            INSERT INTO regen_cluster_counts (district_id, gender, caste, age_group, religion_group, service_id, usage_count)
+            SELECT g.district_id, g.gender, g.caste, g.age_group, g.religion_group, s.service_id, SUM(s.provisions)
+            FROM {SCAN_TABLE} s
+            JOIN ml_citizen_cluster g ON g.cluster_id = s.cluster_id
+            WHERE s.service_id IS NOT NULL
+            GROUP BY g.cluster_id, s.service_id
+        """,
+    }
+    return {table: db.execute(text(sql)).rowcount for table, sql in statements.items()}
+
+
+def insert_clusters_from_scan(db: Session, target: str) -> int:
+    """insert_clusters() from SCAN_TABLE instead of ml_citizen_master. Returns the clusters."""
+    return db.execute(text(f"""
+        INSERT INTO {target} (cluster_id, district_id, gender, caste, age_group, religion_group)
+        SELECT g.cluster_id, g.district_id, g.gender, g.caste, g.age_group, g.religion_group
+        FROM ml_citizen_cluster g
+        WHERE g.cluster_id IN (SELECT cluster_id FROM {SCAN_TABLE})
+    """)).rowcount
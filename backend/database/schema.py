@@ -0,0 +1,274 @@
+"""
+Auxiliary tables owned by the backend itself (not part of the imported dataset).
+
+setup_database_complete.py creates every model on a fresh database; this module
+only makes sure tables and columns added later exist on databases set up before
+them (or whose dataset tables were re-imported with pandas `to_sql`), plus
+the SQL functions behind the SMALLINT attribute codes and the trigger that
+maintains ml_citizen_master.cluster_id. Column type changes of existing
+tables live in migrations.py.
+Called once at startup from the lock-guarded DB verification.
+"""
+
+import logging
+from typing import List
+
+from sqlalchemy import inspect, text
+
+from .connection import engine, Base
+from .models import (
+    SyncReject, SyncCheckpoint, RegenCitizenService, RegenDistrictCount, RegenDistrictTotal,
+    RegenBlockCitizenService, RegenBlockCount, RegenClusterCount, CitizenCluster, RegenerationVersion,
+    AttributeCode, CodedLabel, SEEDED_ATTRIBUTE_CODES, age_group_sql, religion_group_sql
+)
+
+logger = logging.getLogger(__name__)
+
+AUX_TABLES = [
+    SyncReject.__table__,
+    SyncCheckpoint.__table__,
+    RegenCitizenService.__table__,
+    RegenDistrictCount.__table__,
+    RegenDistrictTotal.__table__,
+    RegenBlockCitizenService.__table__,
+    RegenBlockCount.__table__,
+    RegenClusterCount.__table__,
+    CitizenCluster.__table__,
+    RegenerationVersion.__table__,
+    AttributeCode.__table__,
+]
+
+# (table, column, DDL) for columns added to existing tables
+AUX_COLUMNS = [
+    ("ml_provision", "ingested_at", "TIMESTAMP WITH TIME ZONE DEFAULT now()"),
+    ("regeneration_log", "mode", "VARCHAR(20)"),
+    ("regeneration_log", "watermark", "TIMESTAMP WITH TIME ZONE"),
+    ("regeneration_log", "version", "BIGINT"),
+    # Generated columns rewrite ml_citizen_master once when added
+    ("ml_citizen_master", "age_group", f"VARCHAR GENERATED ALWAYS AS ({age_group_sql()}) STORED"),
+    ("ml_citizen_master", "religion_group", f"VARCHAR GENERATED ALWAYS AS ({religion_group_sql()}) STORED"),
+    ("ml_citizen_master", "cluster_id", "BIGINT"),
+    # Existing citizens keep NULL (= arrived before any regeneration window); only new rows get now()
+    ("ml_citizen_master", "ingested_at", "TIMESTAMP WITH TIME ZONE, ALTER COLUMN ingested_at SET DEFAULT now()"),
+]
+
+# (index, table, columns) - built CONCURRENTLY so writers are not blocked on large tables
+AUX_INDEXES = [
+    ("ix_ml_provision_ingested_at", "ml_provision", "ingested_at"),
+    ("ix_ml_citizen_master_cluster_id", "ml_citizen_master", "cluster_id"),
+    ("ix_ml_citizen_master_ingested_at", "ml_citizen_master", "ingested_at"),
+]
+
+# CodedLabel columns (models.py) call the first two: label → SMALLINT code (lookup only, NULL for a
+# label without a code) and code → label. Both are STABLE, so a comparison with a constant label is
+# evaluated once and can use an index. Labels get their code before they are written, through
+# ml_register_attribute (register_attribute_labels on the sync path, the typed-schema migration).
+ATTRIBUTE_CODE_FUNCTIONS_SQL = [
+    """
+CREATE OR REPLACE FUNCTION ml_decode_attribute(attr VARCHAR, c SMALLINT) RETURNS VARCHAR
+LANGUAGE sql STABLE AS $$
+    SELECT label FROM ml_attribute_code WHERE attribute = attr AND code = c
+$$
+""",
+    """
+CREATE OR REPLACE FUNCTION ml_encode_attribute(attr VARCHAR, lbl VARCHAR) RETURNS SMALLINT
+LANGUAGE sql STABLE AS $$
+    SELECT code FROM ml_attribute_code WHERE attribute = attr AND label = lbl
+$$
+""",
+    """
+CREATE OR REPLACE FUNCTION ml_register_attribute(attr VARCHAR, lbl VARCHAR) RETURNS SMALLINT
+LANGUAGE plpgsql AS $$
+DECLARE
+    c SMALLINT;
+BEGIN
+    IF lbl IS NULL OR lbl = '' THEN
+        RETURN NULL;
+    END IF;
+    LOOP
+        SELECT code INTO c FROM ml_attribute_code WHERE attribute = attr AND label = lbl;
+        EXIT WHEN c IS NOT NULL;
+        -- A concurrent allocation of the same code (or label) makes this a no-op: look again
+        INSERT INTO ml_attribute_code (attribute, code, label)
+        SELECT attr, COALESCE(MAX(code), 0) + 1, lbl FROM ml_attribute_code WHERE attribute = attr
+        ON CONFLICT DO NOTHING
+        RETURNING code INTO c;
+        EXIT WHEN c IS NOT NULL;
+    END LOOP;
+    RETURN c;
+END
+$$
+""",
+]
+
+CLUSTER_TRIGGER = "ml_citizen_master_cluster_id"
+
+# A BEFORE trigger runs before generated columns are computed, so the key is built from NEW.age / NEW.religion
+_NEW_CLUSTER_KEY = (f"NEW.district_id, ml_decode_attribute('gender', NEW.gender), "
+                    f"ml_decode_attribute('caste', NEW.caste), "
+                    f"{age_group_sql('NEW.age')}, {religion_group_sql('NEW.religion')}")
+_LOOKUP_CLUSTER = f"""
+        SELECT k.cluster_id INTO NEW.cluster_id FROM ml_citizen_cluster k
+        WHERE (k.district_id, k.gender, k.caste, k.age_group, k.religion_group) = ({_NEW_CLUSTER_KEY});"""
+
+CLUSTER_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION ml_citizen_assign_cluster() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    -- No district/gender/caste: the citizen belongs to no cluster
+    IF NEW.district_id IS NULL OR NEW.gender IS NULL OR NEW.caste IS NULL THEN
+        NEW.cluster_id := NULL;
+        RETURN NEW;
+    END IF;
+    {_LOOKUP_CLUSTER}
+    IF NEW.cluster_id IS NULL THEN
+        INSERT INTO ml_citizen_cluster (district_id, gender, caste, age_group, religion_group)
+        VALUES ({_NEW_CLUSTER_KEY})
+        ON CONFLICT ON CONSTRAINT uq_ml_citizen_cluster_key DO NOTHING
+        RETURNING cluster_id INTO NEW.cluster_id;
+        IF NEW.cluster_id IS NULL THEN
+            -- Added by a concurrent transaction in the meantime
+            {_LOOKUP_CLUSTER}
+        END IF;
+    END IF;
+    RETURN NEW;
+END
+$$
+"""
+
+CLUSTER_TRIGGER_SQL = f"""
+CREATE TRIGGER {CLUSTER_TRIGGER}
+BEFORE INSERT OR UPDATE OF district_id, gender, caste, age, religion ON ml_citizen_master
+FOR EACH ROW EXECUTE FUNCTION ml_citizen_assign_cluster()
+"""
+
+
+def ensure_aux_tables(bind=None):
+    """CREATE TABLE IF NOT EXISTS for every auxiliary table. Returns the names that were created."""
+    bind = bind or engine
+    existing = set(inspect(bind).get_table_names())
+    missing = [t for t in AUX_TABLES if t.name not in existing]
+    if missing:
+        Base.metadata.create_all(bind, tables=missing, checkfirst=True)
+        logger.info(f"✅ Created auxiliary tables: {', '.join(t.name for t in missing)}")
+    return [t.name for t in missing]
+
+
+def ensure_aux_columns(bind=None):
+    """Add missing AUX_COLUMNS / AUX_INDEXES. Returns the 'table.column' / index names that were added."""
+    bind = bind or engine
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    added = []
+
+    with bind.begin() as conn:
+        for table, column, ddl in AUX_COLUMNS:
+            if table not in tables:
+                continue
+            if column not in {c["name"] for c in inspector.get_columns(table)}:
+                # Only ALTER when missing: ALTER TABLE takes an exclusive lock even for IF NOT EXISTS
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {ddl}"))
+                added.append(f"{table}.{column}")
+
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for index, table, columns in AUX_INDEXES:
+            if table not in tables:
+                continue
+            if index not in {i["name"] for i in inspect(conn).get_indexes(table)}:
+                # A partitioned table (ml_provision) cannot build an index CONCURRENTLY
+                partitioned = conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = CAST(:t AS regclass)"),
+                                           {"t": table}).scalar()
+                concurrently = "" if partitioned else "CONCURRENTLY "
+                conn.execute(text(f"CREATE INDEX {concurrently}IF NOT EXISTS {index} ON {table} ({columns})"))
+                added.append(index)
+
+    if added:
+        logger.info(f"✅ Added auxiliary columns/indexes: {', '.join(added)}")
+    return added
+
+
+def ensure_attribute_codes(bind=None):
+    """(Re)create the attribute code functions and the fixed codes (SEEDED_ATTRIBUTE_CODES)."""
+    bind = bind or engine
+    with bind.begin() as conn:
+        for sql in ATTRIBUTE_CODE_FUNCTIONS_SQL:
+            conn.execute(text(sql))
+        conn.execute(text("""
+            INSERT INTO ml_attribute_code (attribute, code, label) VALUES (:attribute, :code, :label)
+            ON CONFLICT DO NOTHING
+        """), [{"attribute": a, "code": c, "label": l} for a, c, l in SEEDED_ATTRIBUTE_CODES])
+
+
+def register_attribute_labels(db, table, records: List[dict]) -> int:
+    """
+    Give every label in the CodedLabel columns of `records` a code (the next
+    free one of its attribute) if it has none yet, so the write that follows
+    can encode it. Runs in the caller's transaction. Returns the labels added.
+    """
+    pairs = sorted({
+        (column.type.attribute, str(r[column.name]))
+        for column in table.columns if isinstance(column.type, CodedLabel)
+        for r in records if r.get(column.name) not in (None, "")
+    })
+    if not pairs:
+        return 0
+    added = db.execute(text("""
+        SELECT count(ml_register_attribute(t.attribute, t.label))
+        FROM unnest(CAST(:attributes AS VARCHAR[]), CAST(:labels AS VARCHAR[])) AS t(attribute, label)
+        WHERE NOT EXISTS (SELECT 1 FROM ml_attribute_code k WHERE k.attribute = t.attribute AND k.label = t.label)
+    """), {"attributes": [a for a, _ in pairs], "labels": [l for _, l in pairs]}).scalar()
+    if added:
+        logger.info(f"🏷️  Registered {added} new {table.name} attribute labels")
+    return added
+
+
+def backfill_citizen_clusters(conn) -> int:
+    """Register every cluster key held by a citizen and set cluster_id where it is missing or stale. Returns rows updated."""
+    # district_id and the gender/caste labels of each citizen (no label = no cluster)
+    labelled = """
+        ml_citizen_master c
+        JOIN ml_attribute_code g ON g.attribute = 'gender' AND g.code = c.gender
+        JOIN ml_attribute_code ca ON ca.attribute = 'caste' AND ca.code = c.caste
+    """
+    conn.execute(text(f"""
+        INSERT INTO ml_citizen_cluster (district_id, gender, caste, age_group, religion_group)
+        SELECT DISTINCT c.district_id, g.label, ca.label, c.age_group, c.religion_group
+        FROM {labelled}
+        WHERE c.district_id IS NOT NULL
+        ORDER BY 1, 2, 3, 4, 5
+        ON CONFLICT ON CONSTRAINT uq_ml_citizen_cluster_key DO NOTHING
+    """))
+    return conn.execute(text(f"""
+        UPDATE ml_citizen_master t SET cluster_id = k.cluster_id
+        FROM {labelled}
+        JOIN ml_citizen_cluster k
+          ON k.district_id = c.district_id AND k.gender = g.label AND k.caste = ca.label
+         AND k.age_group = c.age_group AND k.religion_group = c.religion_group
+        WHERE t.citizen_id = c.citizen_id AND t.cluster_id IS DISTINCT FROM k.cluster_id
+    """)).rowcount
+
+
+def ensure_citizen_clusters(bind=None) -> bool:
+    """
+    Install the trigger that keeps ml_citizen_master.cluster_id current as
+    citizens are synced, and backfill the citizens written before it existed
+    (new database, or ml_citizen_master re-imported with pandas `to_sql`).
+    Returns True if the trigger was (re)installed.
+    """
+    bind = bind or engine
+    if "ml_citizen_master" not in set(inspect(bind).get_table_names()):
+        return False
+
+    with bind.begin() as conn:
+        # Keep the function body in step with the code on every start
+        conn.execute(text(CLUSTER_FUNCTION_SQL))
+        installed = conn.execute(text("""
+            SELECT 1 FROM pg_trigger WHERE tgrelid = 'ml_citizen_master'::regclass AND tgname = :name
+        """), {"name": CLUSTER_TRIGGER}).scalar()
+        if installed:
+            return False
+        # The trigger's lock keeps writers out until the backfill commits - no citizen is missed
+        conn.execute(text(CLUSTER_TRIGGER_SQL))
+        updated = backfill_citizen_clusters(conn)
+
+    logger.info(f"✅ Installed {CLUSTER_TRIGGER} trigger, cluster_id backfilled for {updated:,} citizens")
+    return True
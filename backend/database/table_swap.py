@@ -0,0 +1,257 @@
+"""
+Shadow-table loads with an atomic rename swap.
+
+Instead of DELETE + re-INSERT on the live table (readers wait on row locks or
+see a half-loaded table for the whole load), data is written to
+`<table>_staging`:
+
+    1. create_shadow_table   CREATE TABLE <t>_staging (LIKE <t>), primary key /
+                             unique constraints only, so ON CONFLICT dedupe works
+    2. (caller bulk-loads the shadow table and commits)
+    3. build_shadow_indexes  secondary indexes, built once on the full table
+    4. swap_in               one short transaction: LOCK, DROP <t>,
+                             RENAME <t>_staging → <t>, restore index names
+
+swap_in_transaction does step 4 for several tables inside a longer transaction
+(the caller commits right after), optionally keeping each replaced table as
+`<t>_prev`; restore_previous exchanges a table with its `_prev` copy.
+
+Readers only ever wait for step 4 (milliseconds). The swap takes its lock with
+a lock_timeout and retries, so a long-running reader delays the refresh
+instead of queueing every new reader behind it.
+"""
+
+import os
+import re
+import time
+import logging
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import MetaData, Table, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+STAGING_SUFFIX = "_staging"
+PREVIOUS_SUFFIX = "_prev"
+_PARKED_SUFFIX = "_parked"
+SWAP_LOCK_TIMEOUT = os.getenv("TABLE_SWAP_LOCK_TIMEOUT", "5s")
+SWAP_RETRIES = int(os.getenv("TABLE_SWAP_RETRIES", "5"))
+# SQLSTATE lock_not_available (lock_timeout expired)
+_LOCK_NOT_AVAILABLE = "55P03"
+
+_INDEX_DEF = re.compile(r"^(CREATE (?:UNIQUE )?INDEX) \S+ ON (?:ONLY )?\S+ ")
+
+
+class IndexInfo(NamedTuple):
+    name: str
+    definition: str                   # pg_get_indexdef
+    constraint: Optional[str]         # pg_get_constraintdef for PRIMARY KEY / UNIQUE / EXCLUDE indexes
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def shadow_index_name(name: str, suffix: str = STAGING_SUFFIX) -> str:
+    return f"{name}{suffix}"
+
+
+def table_indexes(db: Session, table_name: str) -> List[IndexInfo]:
+    rows = db.execute(text("""
+        SELECT i.relname, pg_get_indexdef(i.oid), pg_get_constraintdef(c.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        LEFT JOIN pg_constraint c ON c.conindid = x.indexrelid AND c.conrelid = x.indrelid
+        WHERE x.indrelid = CAST(:table AS regclass)
+        ORDER BY c.oid IS NULL, i.relname
+    """), {"table": _quote(table_name)}).all()
+    return [IndexInfo(*r) for r in rows]
+
+
+def _owned_sequences(db: Session, table_name: str) -> List[tuple]:
+    """(column, sequence) for serial columns - the sequence would be dropped with the old table."""
+    rows = db.execute(text("""
+        SELECT a.attname, pg_get_serial_sequence(:table, a.attname)
+        FROM pg_attribute a
+        WHERE a.attrelid = CAST(:table AS regclass) AND a.attnum > 0 AND NOT a.attisdropped
+    """), {"table": _quote(table_name)}).all()
+    return [(col, seq) for col, seq in rows if seq]
+
+
+def create_shadow_table(db: Session, table, suffix: str = STAGING_SUFFIX) -> Table:
+    """
+    (Re)create `<table><suffix>` with the live table's columns, defaults and
+    key constraints. Returns a Table bound to the shadow name for inserts.
+    """
+    shadow = f"{table.name}{suffix}"
+    db.execute(text(f"DROP TABLE IF EXISTS {_quote(shadow)}"))
+    db.execute(text(
+        f"CREATE TABLE {_quote(shadow)} (LIKE {_quote(table.name)} "
+        f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY)"
+    ))
+    for index in table_indexes(db, table.name):
+        if index.constraint:
+            db.execute(text(
+                f"ALTER TABLE {_quote(shadow)} ADD CONSTRAINT "
+                f"{_quote(shadow_index_name(index.name, suffix))} {index.constraint}"
+            ))
+    return table.to_metadata(MetaData(), name=shadow)
+
+
+def build_shadow_indexes(db: Session, table, shadow: Table, suffix: str = STAGING_SUFFIX) -> int:
+    """Create the live table's secondary indexes on the loaded shadow table. Returns how many."""
+    built = 0
+    for index in table_indexes(db, table.name):
+        if index.constraint:
+            continue
+        definition, n = _INDEX_DEF.subn(
+            lambda m: f"{m.group(1)} {_quote(shadow_index_name(index.name, suffix))} ON {_quote(shadow.name)} ",
+            index.definition
+        )
+        if not n:
+            raise ValueError(f"Unrecognised index definition for {index.name}: {index.definition}")
+        db.execute(text(definition))
+        built += 1
+    return built
+
+
+def drop_shadow_table(db: Session, shadow_name: str):
+    db.execute(text(f"DROP TABLE IF EXISTS {_quote(shadow_name)}"))
+
+
+def _table_exists(db: Session, table_name: str) -> bool:
+    return db.execute(text("SELECT to_regclass(:table) IS NOT NULL"), {"table": _quote(table_name)}).scalar()
+
+
+def _adopt_sequences(db: Session, from_table: str, to_table: str):
+    """Re-own serial sequences before `from_table` is dropped (they would be dropped with it)."""
+    for column, sequence in _owned_sequences(db, from_table):
+        db.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {_quote(to_table)}.{_quote(column)}"))
+
+
+def _rename_table(db: Session, old: str, new: str, indexes: List[IndexInfo], old_suffix: str, new_suffix: str):
+    """Rename a table and its indexes from `<index><old_suffix>` to `<index><new_suffix>` (suffix '' = live name)."""
+    db.execute(text(f"ALTER TABLE {_quote(old)} RENAME TO {_quote(new)}"))
+    # Renaming a constraint's index renames the constraint too
+    for index in indexes:
+        db.execute(text(
+            f"ALTER INDEX IF EXISTS {_quote(index.name + old_suffix)} RENAME TO {_quote(index.name + new_suffix)}"
+        ))
+
+
+def _swap(db: Session, table_name: str, shadow_name: str, suffix: str, previous_suffix: Optional[str] = None):
+    indexes = table_indexes(db, table_name)
+    if previous_suffix:
+        previous = f"{table_name}{previous_suffix}"
+        if _table_exists(db, previous):
+            _adopt_sequences(db, previous, shadow_name)
+            db.execute(text(f"DROP TABLE {_quote(previous)}"))
+        _adopt_sequences(db, table_name, shadow_name)
+        _rename_table(db, table_name, previous, indexes, "", previous_suffix)
+    else:
+        _adopt_sequences(db, table_name, shadow_name)
+        db.execute(text(f"DROP TABLE {_quote(table_name)}"))
+    _rename_table(db, shadow_name, table_name, indexes, suffix, "")
+
+
+def _lock(db: Session, table_names: List[str]):
+    db.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+    db.execute(text(f"LOCK TABLE {', '.join(_quote(t) for t in table_names)} IN ACCESS EXCLUSIVE MODE"))
+
+
+def _is_lock_timeout(e: OperationalError) -> bool:
+    return getattr(e.orig, "pgcode", None) == _LOCK_NOT_AVAILABLE
+
+
+def swap_in(db: Session, table, shadow: Table, suffix: str = STAGING_SUFFIX):
+    """
+    Replace the live table with the (committed, indexed) shadow table in one
+    short transaction. Retries when the exclusive lock is not granted within
+    SWAP_LOCK_TIMEOUT; commits on success.
+    """
+    for attempt in range(1, SWAP_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            _lock(db, [table.name])
+            _swap(db, table.name, shadow.name, suffix)
+            db.commit()
+            logger.info(f"   🔀 Swapped {shadow.name} → {table.name} "
+                        f"({(time.perf_counter() - started) * 1000:.0f} ms under lock)")
+            return
+        except OperationalError as e:
+            db.rollback()
+            if not _is_lock_timeout(e) or attempt == SWAP_RETRIES:
+                raise
+            logger.warning(f"⚠️  {table.name} busy (lock wait > {SWAP_LOCK_TIMEOUT}), "
+                           f"swap retry {attempt}/{SWAP_RETRIES - 1}...")
+            time.sleep(attempt)
+        except Exception:
+            db.rollback()
+            raise
+
+
+def _in_savepoint_with_retries(db: Session, table_names: List[str], work, label: str):
+    """Lock `table_names` and run `work()` in a SAVEPOINT of the caller's transaction, retrying on lock timeout."""
+    for attempt in range(1, SWAP_RETRIES + 1):
+        savepoint = db.begin_nested()
+        try:
+            _lock(db, table_names)
+            work()
+            savepoint.commit()
+            return
+        except OperationalError as e:
+            savepoint.rollback()
+            if not _is_lock_timeout(e) or attempt == SWAP_RETRIES:
+                raise
+            logger.warning(f"⚠️  {', '.join(table_names)} busy (lock wait > {SWAP_LOCK_TIMEOUT}), "
+                           f"{label} retry {attempt}/{SWAP_RETRIES - 1}...")
+            time.sleep(attempt)
+        except Exception:
+            savepoint.rollback()
+            raise
+
+
+def swap_in_transaction(db: Session, swaps: List[Tuple[str, str]], suffix: str = STAGING_SUFFIX,
+                        previous_suffix: Optional[str] = PREVIOUS_SUFFIX):
+    """
+    Swap several (live, shadow) pairs inside the caller's transaction, which must
+    commit right after - the exclusive locks are held until then. With
+    `previous_suffix`, each replaced table is kept as `<table><previous_suffix>`
+    (replacing the one kept before) instead of being dropped.
+    """
+    if not swaps:
+        return
+    tables = [live for live, _ in swaps]
+
+    def work():
+        for live, shadow in swaps:
+            _swap(db, live, shadow, suffix, previous_suffix)
+
+    _in_savepoint_with_retries(db, tables, work, "swap")
+    logger.info(f"   🔀 Swapped in {', '.join(tables)}"
+                + (f" (previous kept as *{previous_suffix})" if previous_suffix else ""))
+
+
+def restore_previous(db: Session, table_names: List[str], previous_suffix: str = PREVIOUS_SUFFIX) -> List[str]:
+    """
+    Exchange each live table with its `<table><previous_suffix>` copy inside the
+    caller's transaction (caller commits). The replaced generation becomes the
+    new previous one, so a second call rolls forward again. Returns the tables
+    that had a previous copy.
+    """
+    pairs = [(t, f"{t}{previous_suffix}") for t in table_names if _table_exists(db, f"{t}{previous_suffix}")]
+    if not pairs:
+        return []
+
+    def work():
+        for live, previous in pairs:
+            indexes = table_indexes(db, live)
+            parked = f"{live}{_PARKED_SUFFIX}"
+            _rename_table(db, live, parked, indexes, "", _PARKED_SUFFIX)
+            _rename_table(db, previous, live, indexes, previous_suffix, "")
+            _rename_table(db, parked, previous, indexes, _PARKED_SUFFIX, previous_suffix)
+
+    _in_savepoint_with_retries(db, [live for live, _ in pairs] + [prev for _, prev in pairs], work, "restore")
+    return [live for live, _ in pairs]
@@ -69,13 +69,21 @@ def compute_similarity_matrix(embeddings: np.ndarray) -> np.ndarray:
 
 
 def save_similarity_matrix(sim_mat: np.ndarray, ids: pd.Series, output_path: str) -> None:
-    """Save the similarity matrix as a CSV with service_id labels."""
-    sim_df = pd.DataFrame(sim_mat, index=ids, columns=ids)
-    sim_df["service_id"] = sim_df["service_id"].astype(int)
-
-    sim_df.to_csv(output_path)
+    """
+    Save the similarity matrix as a CSV with service_id labels, plus the float32
+    .npy + .ids.npy copy that the API memory-maps (see inference/similarity_store.py).
+    """
+    # Same layout as data/openai_similarity_matrix.csv: service_id first, positional columns
+    sim_df = pd.DataFrame(sim_mat)
+    sim_df.insert(0, "service_id", ids.astype(int).values)
+
+    sim_df.to_csv(output_path, index=False)
     print(f"Saved similarity matrix to {output_path}")
 
+    from backend.inference.similarity_store import save_similarity_npy
+    npy_path = save_similarity_npy(sim_mat, ids.astype(int).values, output_path)
+    print(f"Saved memory-mappable similarity matrix to {npy_path}")
+
 
 def main():
     # Load environment variables from .env
@@ -122,4 +130,7 @@ def main():
     save_similarity_matrix(sim_mat, df["service_id"], args.sim_output)
 
 if __name__ == "__main__":
+    # Run as a script (python backend/helpers/content_helper.py ...): make `backend` importable
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
     main()
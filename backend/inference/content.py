@@ -105,6 +105,101 @@ def find_similar_services_from_csv(data_csv_path, similarity_matrix_csv_path, se
 
     return unique_similar_service_names
 
+# ──────────────────────────────────────────────────────────────────────────────
+# Preloaded top-K similarity index (request path)
+# ──────────────────────────────────────────────────────────────────────────────
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+SIMILARITY_MATRIX_PATH = os.getenv("SIMILARITY_MATRIX_PATH", os.path.join(DATA_DIR, "openai_similarity_matrix.csv"))
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "20"))
+
+# Rows processed per argpartition call, keeps peak memory flat for large matrices
+_TOPK_CHUNK_ROWS = 1024
+
+
+def load_similarity_matrix(path=SIMILARITY_MATRIX_PATH):
+    """
+    Load the similarity matrix as (service_ids, matrix).
+    Row i / column i both belong to service_ids[i] (the CSV header is positional).
+    Prefers the memory-mapped .npy copy when it is at least as new as the CSV.
+    """
+    from .similarity_store import has_fresh_npy, open_similarity_npy, read_similarity_csv
+
+    if has_fresh_npy(path):
+        service_ids, matrix = open_similarity_npy(path)
+    else:
+        service_ids, matrix = read_similarity_csv(path)
+    if matrix.shape != (len(service_ids), len(service_ids)):
+        raise ValueError(f"Similarity matrix shape {matrix.shape} does not match {len(service_ids)} service ids")
+    return service_ids, matrix
+
+
+class SimilarityIndex:
+    """
+    Top-K neighbours of every service, computed once at load time.
+    neighbours: int32 [n, K] row positions, scores: float32 [n, K], both best-first.
+    """
+
+    def __init__(self, service_ids, matrix, service_names=None, k=SIMILARITY_TOP_K):
+        from .filters import block_service_filter
+
+        n = len(service_ids)
+        k = max(0, min(k, n - 1))
+        self.service_ids = np.asarray(service_ids, dtype=np.int64)
+        self.position = {int(sid): i for i, sid in enumerate(self.service_ids)}
+        self.neighbours = np.empty((n, k), dtype=np.int32)
+        self.scores = np.empty((n, k), dtype=np.float32)
+
+        for start in range(0, n, _TOPK_CHUNK_ROWS):
+            stop = min(start + _TOPK_CHUNK_ROWS, n)
+            block = np.array(matrix[start:stop], dtype=np.float32)  # copy: never mutate a memmap
+            # The service itself is never its own neighbour
+            block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+            part = np.argpartition(-block, k - 1, axis=1)[:, :k] if 0 < k < n else np.argsort(-block, axis=1)[:, :k]
+            part_scores = np.take_along_axis(block, part, axis=1)
+            order = np.argsort(-part_scores, axis=1, kind='stable')
+            self.neighbours[start:stop] = np.take_along_axis(part, order, axis=1)
+            self.scores[start:stop] = np.take_along_axis(part_scores, order, axis=1)
+
+        names = service_names or {}
+        self.names = [names.get(int(sid)) for sid in self.service_ids]
+        # block_service_filter precomputed per position for both caste variants
+        self.allowed_other = np.array([block_service_filter(nm, "") for nm in self.names], dtype=bool)
+        self.allowed_general = np.array([block_service_filter(nm, "General") for nm in self.names], dtype=bool)
+
+    def __len__(self):
+        return len(self.service_ids)
+
+    def similar(self, target_ids, caste, limit=5):
+        """
+        Neighbours for all targets in one pass: gather [t, K] rows, drop the targets
+        themselves and filtered services, keep the best `limit` per target.
+        Returns {target service name: [similar service names]}.
+        """
+        from .filters import is_general_caste
+
+        rows = np.fromiter((self.position.get(int(sid), -1) for sid in target_ids), dtype=np.int64)
+        rows = rows[rows >= 0]
+        if not len(rows) or not self.neighbours.shape[1]:
+            return {}
+
+        nb = self.neighbours[rows]
+        allowed = self.allowed_general if is_general_caste(caste) else self.allowed_other
+        valid = allowed[nb] & ~np.isin(nb, rows) & np.isfinite(self.scores[rows])
+        keep = valid & (np.cumsum(valid, axis=1) <= limit)
+
+        results = {}
+        for row, nb_row, keep_row in zip(rows, nb, keep):
+            source = self.names[row]
+            if not source:
+                continue
+            merged = results.setdefault(source, [])
+            for pos in nb_row[keep_row]:
+                name = self.names[pos]
+                if name not in merged:
+                    merged.append(name)
+        return results
+
+
 # Example usage (optional, for testing the function)
 # data_file = "../data/service_with_domains.csv"
 # similarity_file = "../data/openai_similarity_matrix.csv"
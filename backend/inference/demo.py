@@ -1,6 +1,8 @@
 import pandas as pd
 import os
 
+from ..utils.static_lists import static_lists
+
 def recommend_services_2(citizen_id, df, grouped_df, cluster_service_map, service_id_to_name, service_df, top_n=5, citizen_master=None, searched_service_name=None):
     """
     Robust demographic recommendations that handle numpy/pandas import issues
@@ -100,11 +102,9 @@ def recommend_services_2(citizen_id, df, grouped_df, cluster_service_map, servic
             data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
             under18_csv_path = os.path.join(data_dir, "under18_top_services.csv")
             
-            if os.path.exists(under18_csv_path):
-                under18_df = pd.read_csv(under18_csv_path)
-                
-                # Get the service names from the CSV
-                available_services = under18_df['service_name'].tolist()
+            # Get the service names from the CSV (cached until the file changes)
+            available_services = static_lists.get(under18_csv_path)
+            if available_services is not None:
                 
                 # Apply filters
                 filtered_services = []
@@ -138,11 +138,9 @@ def recommend_services_2(citizen_id, df, grouped_df, cluster_service_map, servic
             data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
             above60_csv_path = os.path.join(data_dir, "above60_top_services.csv")
             
-            if os.path.exists(above60_csv_path):
-                above60_df = pd.read_csv(above60_csv_path)
-                
-                # Get the service names from the CSV
-                available_services = above60_df['service_name'].tolist()
+            # Get the service names from the CSV (cached until the file changes)
+            available_services = static_lists.get(above60_csv_path)
+            if available_services is not None:
                 
                 # Apply filters
                 filtered_services = []
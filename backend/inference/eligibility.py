@@ -0,0 +1,234 @@
+"""
+Eligibility engine for service recommendations.
+
+`rule_allows` is the single source of truth for the per-rule logic used by
+check_eligibility. `EligibilityMatrix` compiles every services_eligibility row
+into bit flags plus min/max age arrays, so a whole candidate set is filtered
+in one vectorized pass instead of one query per candidate.
+
+Parity check (every demographic combination vs. check_eligibility's logic):
+    python -m backend.inference.eligibility
+    python -m backend.inference.eligibility --csv data/services.csv
+The same comparison runs DB-free over synthetic rules in tests/test_eligibility.py.
+"""
+
+import math
+import itertools
+from typing import Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..database.models import ServiceEligibility
+
+# Bit positions in EligibilityMatrix.flags
+SC = 1 << 0
+ST = 1 << 1
+OBC_A = 1 << 2
+OBC_B = 1 << 3
+FEMALE = 1 << 4
+MINORITY = 1 << 5
+FOR_ALL = 1 << 6
+CASTE_SPECIFIC = SC | ST | OBC_A | OBC_B
+
+_FLAG_COLUMNS = (
+    ("is_sc", SC), ("is_st", ST), ("is_obc_a", OBC_A), ("is_obc_b", OBC_B),
+    ("is_female", FEMALE), ("is_minority", MINORITY), ("for_all", FOR_ALL),
+)
+_CASTE_FLAGS = {"SC": SC, "ST": ST, "OBC-A": OBC_A, "OBC-B": OBC_B}
+
+
+def find_eligibility_rule(db: Session, service_name: str):
+    """Case-insensitive services_eligibility lookup by name (Streamlit used names, not ids)."""
+    return db.query(ServiceEligibility).filter(
+        func.lower(ServiceEligibility.service_name) == func.lower(service_name)
+    ).order_by(ServiceEligibility.service_id, ServiceEligibility.service_name).first()
+
+
+def rule_allows(rule, age, gender: str, caste: str, religion: str) -> bool:
+    """Apply one services_eligibility rule to a citizen. No rule means allowed."""
+    if not rule:
+        return True # Default to allow if no specific rules found
+
+    # 1. Age Check
+    if rule.min_age is not None and age < rule.min_age: return False
+    if rule.max_age is not None and age > rule.max_age: return False
+
+    # 2. Universal Check
+    if rule.for_all: return True
+
+    # 3. Caste Check
+    if caste == 'SC' and not rule.is_sc: return False
+    if caste == 'ST' and not rule.is_st: return False
+    if caste == 'OBC-A' and not rule.is_obc_a: return False
+    if caste == 'OBC-B' and not rule.is_obc_b: return False
+    if caste == 'General':
+        # General cannot take caste-specific schemes
+        if rule.is_sc or rule.is_st or rule.is_obc_a or rule.is_obc_b: return False
+
+    # 4. Gender Check
+    # Streamlit Logic: if user=Male and is_female=1 -> False.
+    if gender == 'Female' and not rule.is_female: return False
+    if gender == 'Male' and rule.is_female: return False
+
+    # 5. Religion Check
+    # Schemes are either for Minority or Not (Hindu).
+    is_minority = religion not in ['Hindu']
+    if not is_minority and rule.is_minority: return False # Hindu user, Minority scheme
+    if is_minority and not rule.is_minority: return False
+
+    return True
+
+
+def _age_bound(value) -> float:
+    # None means "no bound"; NaN compares False both ways, exactly like the skipped check
+    return math.nan if value is None else float(value)
+
+
+class EligibilityMatrix:
+    """Columnar, read-only copy of services_eligibility."""
+
+    def __init__(self, rules: Iterable):
+        self.index = {}
+        flags, min_age, max_age = [], [], []
+        for rule in rules:
+            key = (rule.service_name or "").lower()
+            if key in self.index:
+                continue  # first row wins, like .first()
+            self.index[key] = len(flags)
+            bits = 0
+            for column, bit in _FLAG_COLUMNS:
+                # Python truthiness on purpose: matches `if rule.is_sc` (NaN is truthy too)
+                if getattr(rule, column, None):
+                    bits |= bit
+            flags.append(bits)
+            min_age.append(_age_bound(rule.min_age))
+            max_age.append(_age_bound(rule.max_age))
+
+        self.flags = np.asarray(flags, dtype=np.uint8)
+        self.min_age = np.asarray(min_age, dtype=np.float64)
+        self.max_age = np.asarray(max_age, dtype=np.float64)
+
+    @classmethod
+    def from_db(cls, db: Session) -> "EligibilityMatrix":
+        rules = db.query(ServiceEligibility).order_by(
+            ServiceEligibility.service_id, ServiceEligibility.service_name
+        ).all()
+        return cls(rules)
+
+    def __len__(self):
+        return len(self.flags)
+
+    def allowed_mask(self, age, gender: str, caste: str, religion: str) -> np.ndarray:
+        """Boolean array over ALL rules for one (age, gender, caste, religion)."""
+        f = self.flags
+        with np.errstate(invalid="ignore"):
+            ok = ~(age < self.min_age) & ~(age > self.max_age)
+
+        if caste in _CASTE_FLAGS:
+            demo = (f & _CASTE_FLAGS[caste]) != 0
+        elif caste == 'General':
+            demo = (f & CASTE_SPECIFIC) == 0
+        else:
+            demo = np.ones(len(f), dtype=bool)
+
+        if gender == 'Female':
+            demo &= (f & FEMALE) != 0
+        elif gender == 'Male':
+            demo &= (f & FEMALE) == 0
+
+        is_minority = religion not in ['Hindu']
+        demo &= ((f & MINORITY) != 0) == is_minority
+
+        return ok & (((f & FOR_ALL) != 0) | demo)
+
+    def filter(self, service_names: List[str], age, gender: str, caste: str, religion: str) -> List[str]:
+        """Keep the eligible names, preserving input order. Unknown names are allowed."""
+        if not service_names:
+            return []
+        if not len(self.flags):
+            return list(service_names)
+
+        idx = np.fromiter(
+            (self.index.get(name.lower() if name else "", -1) for name in service_names),
+            dtype=np.int64, count=len(service_names)
+        )
+        allowed = self.allowed_mask(age, gender, caste, religion)
+        keep = np.where(idx < 0, True, allowed[idx])
+        return [name for name, k in zip(service_names, keep) if k]
+
+
+def verify_parity(rules_by_name, matrix: EligibilityMatrix, ages: Optional[Iterable[int]] = None) -> int:
+    """
+    Compare matrix.filter against rule_allows over every demographic combination.
+    `rules_by_name` maps each service name to the rule check_eligibility would pick.
+    Returns the number of mismatches (0 means exact parity).
+    """
+    names = list(rules_by_name)
+    if ages is None:
+        bounds = {int(b) for b in np.concatenate([matrix.min_age, matrix.max_age]) if not math.isnan(b)}
+        ages = sorted(set(range(0, 101)) | {b + d for b in bounds for d in (-1, 0, 1)})
+    genders = ['Male', 'Female', 'Other']
+    castes = ['General', 'SC', 'ST', 'OBC-A', 'OBC-B', 'Other']
+    religions = ['Hindu', 'Muslim', 'Christian', 'Other']
+
+    mismatches = 0
+    combos = 0
+    for age, gender, caste, religion in itertools.product(ages, genders, castes, religions):
+        combos += 1
+        expected = [n for n in names if rule_allows(rules_by_name[n], age, gender, caste, religion)]
+        actual = matrix.filter(names, age, gender, caste, religion)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"❌ Mismatch age={age} gender={gender} caste={caste} religion={religion}: "
+                      f"only_expected={set(expected) - set(actual)} only_actual={set(actual) - set(expected)}")
+    print(f"Checked {combos:,} combinations × {len(names)} services: {mismatches} mismatches")
+    return mismatches
+
+
+def _rules_from_csv(csv_path: str):
+    """Build rules the same way setup_database_complete.create_services_eligibility does."""
+    import pandas as pd
+    from types import SimpleNamespace
+
+    df = pd.read_csv(csv_path, encoding='latin1')
+    if 'for_all' not in df.columns:
+        df['for_all'] = ((df.get('is_sc', 0) == 0) & (df.get('is_st', 0) == 0) &
+                         (df.get('is_obc_a', 0) == 0) & (df.get('is_obc_b', 0) == 0) &
+                         (df.get('is_female', 0) == 0) & (df.get('is_minority', 0) == 0)).astype(int)
+    df = df.astype(object).where(df.notna(), None)
+    return [SimpleNamespace(**row) for row in df.to_dict('records')]
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check EligibilityMatrix parity with check_eligibility.")
+    parser.add_argument("--csv", help="Build rules from a services CSV instead of the database")
+    args = parser.parse_args()
+
+    if args.csv:
+        rules = _rules_from_csv(args.csv)
+        matrix = EligibilityMatrix(rules)
+        # check_eligibility matches case-insensitively and takes the first row
+        first = {}
+        for rule in rules:
+            first.setdefault((rule.service_name or "").lower(), rule)
+        rules_by_name = {rule.service_name: first[(rule.service_name or "").lower()] for rule in rules}
+    else:
+        from ..database.connection import SessionLocal
+        db = SessionLocal()
+        try:
+            matrix = EligibilityMatrix.from_db(db)
+            names = [n for (n,) in db.query(ServiceEligibility.service_name).distinct()]
+            rules_by_name = {n: find_eligibility_rule(db, n) for n in names}
+        finally:
+            db.close()
+
+    raise SystemExit(1 if verify_parity(rules_by_name, matrix) else 0)
+
+
+if __name__ == "__main__":
+    main()
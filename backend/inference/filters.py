@@ -0,0 +1,19 @@
+"""
+Shared service-name filters used by every recommendation engine.
+"""
+
+
+def is_general_caste(caste: str) -> bool:
+    return bool(caste) and caste.lower() == "general"
+
+
+def block_service_filter(service_name: str, caste: str) -> bool:
+    """Filter out birth/death and caste-specific services for General."""
+    if not service_name:
+        return False
+    s = service_name.lower()
+    if "birth" in s or "death" in s:
+        return False
+    if is_general_caste(caste) and "caste" in s:
+        return False
+    return True
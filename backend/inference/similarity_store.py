@@ -0,0 +1,89 @@
+"""
+Binary, memory-mapped storage for the OpenAI similarity matrix.
+
+    openai_similarity_matrix.npy      float32 [n, n]  (row/column i = service_ids[i])
+    openai_similarity_matrix.ids.npy  int64   [n]     sidecar service_id index
+
+The matrix is opened with mmap_mode='r', so every Gunicorn worker maps the same
+page-cache pages instead of parsing (and copying) the CSV text.
+
+Convert an existing CSV:
+    python -m backend.inference.similarity_store data/openai_similarity_matrix.csv
+"""
+
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+def npy_paths(base_path):
+    """Return (matrix_path, ids_path) for a .csv or .npy base path."""
+    root, _ = os.path.splitext(base_path)
+    return f"{root}.npy", f"{root}.ids.npy"
+
+
+def _atomic_save(path, array):
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def save_similarity_npy(matrix, service_ids, base_path):
+    """Write the float32 matrix and its int64 service_id sidecar. Ids first, matrix last (readers key off the matrix)."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    service_ids = np.asarray(service_ids, dtype=np.int64)
+    if matrix.shape != (len(service_ids), len(service_ids)):
+        raise ValueError(f"Similarity matrix shape {matrix.shape} does not match {len(service_ids)} service ids")
+    matrix_path, ids_path = npy_paths(base_path)
+    _atomic_save(ids_path, service_ids)
+    _atomic_save(matrix_path, matrix)
+    return matrix_path
+
+
+def open_similarity_npy(base_path):
+    """Return (service_ids, matrix) with the matrix memory-mapped read-only."""
+    matrix_path, ids_path = npy_paths(base_path)
+    service_ids = np.load(ids_path)
+    matrix = np.load(matrix_path, mmap_mode='r')
+    if matrix.shape != (len(service_ids), len(service_ids)):
+        raise ValueError(f"{matrix_path} shape {matrix.shape} does not match {len(service_ids)} service ids")
+    return service_ids, matrix
+
+
+def has_fresh_npy(csv_path):
+    """True if the binary copy exists and is not older than the CSV (if there is one)."""
+    matrix_path, ids_path = npy_paths(csv_path)
+    if not (os.path.exists(matrix_path) and os.path.exists(ids_path)):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return os.path.getmtime(matrix_path) >= os.path.getmtime(csv_path)
+
+
+def read_similarity_csv(csv_path):
+    """Parse the CSV format (first column service_id, positional columns)."""
+    df = pd.read_csv(csv_path)
+    service_ids = df['service_id'].to_numpy(dtype=np.int64)
+    matrix = df.drop(columns=['service_id']).to_numpy(dtype=np.float32)
+    return service_ids, matrix
+
+
+def convert_csv_to_npy(csv_path):
+    service_ids, matrix = read_similarity_csv(csv_path)
+    return save_similarity_npy(matrix, service_ids, csv_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the similarity matrix CSV to the memory-mapped .npy format.")
+    parser.add_argument("csv_path", help="Path to openai_similarity_matrix.csv")
+    args = parser.parse_args()
+
+    matrix_path = convert_csv_to_npy(args.csv_path)
+    service_ids, matrix = open_similarity_npy(args.csv_path)
+    print(f"Saved {matrix.shape[0]}x{matrix.shape[1]} float32 matrix to {matrix_path}")
+
+
+if __name__ == "__main__":
+    main()
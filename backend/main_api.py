@@ -1,8 +1,13 @@
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from .api import sync, generate, recommend
-from .database.connection import engine
+from .api import sync, generate, recommend, batch
+from .database.connection import engine, async_engine
+from .database.schema import ensure_aux_tables, ensure_attribute_codes, ensure_aux_columns, ensure_citizen_clusters
+from .database.migrations import pending_migrations
+from .database.partitions import ensure_upcoming_partitions
 from .scheduler import start_scheduler, shutdown_scheduler
+from .cache import warm_caches
 from sqlalchemy import text, inspect
 import uvicorn
 import os
@@ -78,6 +83,24 @@ async def verify_database():
             conn.execute(text("SELECT 1"))
         logger.info("✅ PostgreSQL connection successful")
         
+        # Backend-owned tables/columns added after initial setup (e.g. sync_rejects, ml_provision.ingested_at)
+        ensure_aux_tables(engine)
+        ensure_attribute_codes(engine)
+        # Untyped dataset tables (old setup / pandas re-import) are converted by a deploy step,
+        # never here: the rewrite locks the tables for minutes while other workers serve traffic
+        pending = pending_migrations(engine)
+        if pending:
+            logger.error("!" * 70)
+            logger.error(f"❌ SCHEMA MIGRATION PENDING: {', '.join(pending)}")
+            logger.error("❌ Requests touching these tables will fail until you run:")
+            logger.error("❌     python -m backend.database.migrations")
+            logger.error("!" * 70)
+        else:
+            ensure_aux_columns(engine)
+            ensure_citizen_clusters(engine)
+        # Only adds the coming months' (empty) partitions; a plain ml_provision is left alone
+        ensure_upcoming_partitions(engine)
+        
         # Check tables
         inspector = inspect(engine)
         existing_tables = inspector.get_table_names()
@@ -136,6 +159,16 @@ async def verify_database():
         logger.error(f"❌ Scheduler startup failed: {e}")
         logger.warning("⚠️  Server starting anyway - Scheduler disabled")
 
+# Startup Event - Per-worker request caches
+@app.on_event("startup")
+async def warm_request_caches():
+    """Load read-only reference snapshots in EVERY worker (not lock-guarded)"""
+    try:
+        await run_in_threadpool(warm_caches)
+    except Exception as e:
+        logger.error(f"❌ Cache warm-up failed: {e}")
+        logger.warning("⚠️  Requests will fall back to DB lookups until caches load")
+
 # Shutdown Event - Stop Scheduler
 @app.on_event("shutdown")
 async def shutdown_scheduler_handler():
@@ -145,11 +178,13 @@ async def shutdown_scheduler_handler():
         shutdown_scheduler()
     except Exception as e:
         logger.error(f"❌ Scheduler shutdown error: {e}")
+    await async_engine.dispose()
 
 # Include Routers
 app.include_router(sync.router, prefix="/api", tags=["Sync"])
 app.include_router(generate.router, prefix="/api", tags=["Generate"])
 app.include_router(recommend.router, prefix="/api", tags=["Recommend"])
+app.include_router(batch.router, prefix="/api", tags=["Recommend"])
 
 # Import admin router
 from .api import admin
@@ -11,15 +11,12 @@ from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
-import nest_asyncio
 import threading
 
-# Apply nest_asyncio to allow nested event loops
-nest_asyncio.apply()
-
 from ..database.connection import SessionLocal
 from ..api.sync import SyncRequest, sync_data as sync_endpoint
 from ..api.generate import regenerate_files, RegenerationType
+from ..database.partitions import ensure_upcoming_partitions, apply_retention
 
 # Load environment variables
 load_dotenv()
@@ -37,13 +34,14 @@ STATIC_REGEN_DELAY_HOURS = int(os.getenv('STATIC_REGEN_DELAY_HOURS', '1'))
 scheduler = BackgroundScheduler(timezone=SCHEDULER_TIMEZONE)
 
 # Tables to sync from external BSK API (in order of dependency)
-# These map to database tables: ml_bsk_master, ml_district, ml_provision, ml_citizen_master, services
+# These map to database tables: ml_bsk_master, ml_district, ml_citizen_master, ml_provision, services
+# Citizens before provisions, so a week's new provisions find their citizen when regeneration counts them
 TABLES_TO_SYNC = [
     'bsk_master',           # → ml_bsk_master (BSK centers)
     'district',             # → ml_district (Districts)  
     'service_master',       # → services (Service catalog)
-    'provision',            # → ml_provision (Historical transactions)
-    'citizen_master'        # → ml_citizen_master (Citizen data)
+    'citizen_master',       # → ml_citizen_master (Citizen data)
+    'provision'             # → ml_provision (Historical transactions)
 ]
 
 # Thread-safe sync guard to prevent concurrent syncs (within same worker process)
@@ -75,6 +73,12 @@ def sync_all_tables():
     results = []
     
     try:
+        # Partitions for the months this sync will write (the loader adds any others it meets)
+        try:
+            ensure_upcoming_partitions()
+        except Exception as e:
+            logger.warning(f"⚠️  Could not pre-create ml_provision partitions: {e}")
+        
         for table in TABLES_TO_SYNC:
             logger.info(f"\n📊 Syncing table: {table}")
             try:
@@ -85,28 +89,9 @@ def sync_all_tables():
                     force_full=False
                 )
                 
-                # Call sync endpoint function directly (not HTTP)
-                # Use synchronous database operations to avoid async issues
-                import asyncio
-                try:
-                    # Try to get existing loop
-                    loop = asyncio.get_event_loop()
-                    if loop.is_running():
-                        # If loop is already running, use run_in_executor
-                        import concurrent.futures
-                        with concurrent.futures.ThreadPoolExecutor() as pool:
-                            # Wait indefinitely for sync to complete (no timeout)
-                            future = pool.submit(asyncio.run, sync_endpoint(request, db))
-                            result = future.result()  # Blocks until completion
-                    else:
-                        result = loop.run_until_complete(sync_endpoint(request, db))
-                except RuntimeError:
-                    # No event loop in current thread, create one
-                    result = asyncio.run(sync_endpoint(request, db))
-                except Exception as async_error:
-                    # Catch ANY async-related errors and continue
-                    logger.error(f"❌ Async error for {table}: {str(async_error)[:200]}")
-                    raise  # Re-raise to be caught by outer except
+                # Call sync endpoint function directly (not HTTP) - it is a plain
+                # sync function, so it runs right here in the scheduler thread
+                result = sync_endpoint(request, db)
                 
                 results.append({
                     'table': table,
@@ -130,6 +115,12 @@ def sync_all_tables():
                 logger.error(f"❌ {table}: FAILED - {error_msg}")
                 continue
         
+        # Archive ml_provision months past PROVISION_RETENTION_MONTHS (0 = keep all)
+        try:
+            apply_retention()
+        except Exception as e:
+            logger.error(f"❌ ml_provision retention failed: {e}")
+        
         # Log summary
         logger.info("\n" + "="*70)
         logger.info("📈 SYNC JOB SUMMARY")
@@ -192,21 +183,8 @@ def regenerate_static_files():
     db: Session = SessionLocal()
     
     try:
-        # Call new regenerate endpoint with type="all"
-        import asyncio
-        import concurrent.futures
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                with concurrent.futures.ThreadPoolExecutor() as pool:
-                    result = pool.submit(
-                        asyncio.run,
-                        regenerate_files(RegenerationType.ALL, db)
-                    ).result()
-            else:
-                result = loop.run_until_complete(regenerate_files(RegenerationType.ALL, db))
-        except RuntimeError:
-            result = asyncio.run(regenerate_files(RegenerationType.ALL, db))
+        # Call regenerate endpoint with type="all" (plain sync function, runs in this thread)
+        result = regenerate_files(RegenerationType.ALL, db)
         
         logger.info("\n📊 Generated Files:")
         if result.get('district_files'):
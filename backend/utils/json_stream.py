@@ -0,0 +1,130 @@
+"""
+Incremental decoding of `{..., "records": [ {...}, {...}, ... ], ...}` responses.
+
+The body is consumed chunk by chunk (e.g. `response.iter_content()`); each array
+element is decoded with `json.JSONDecoder.raw_decode` as soon as it is complete
+and yielded, so only one network chunk plus the current batch of records is in
+memory at a time - regardless of how many records the response holds.
+
+Other top-level keys (success, table_name, total_records, ...) are collected
+in `RecordStream.fields` as they are passed.
+"""
+
+import json
+import codecs
+from typing import Any, Dict, Iterable, Iterator, List
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = frozenset("0123456789+-.eE")
+
+
+class RecordStream:
+    """Iterate the records of one top-level array key of a streamed JSON object."""
+
+    def __init__(self, chunks: Iterable[bytes], array_key: str = "records"):
+        self.array_key = array_key
+        self.fields: Dict[str, Any] = {}
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._consumed = False
+
+    # --- buffer management ---
+
+    def _fill(self) -> bool:
+        """Append the next chunk to the buffer; False at end of input."""
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            text = self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+            if text:
+                # Drop what has been consumed so the buffer does not grow with the body
+                self._buf = self._buf[self._pos:] + text
+                self._pos = 0
+                return True
+        self._buf = self._buf[self._pos:] + self._utf8.decode(b"", final=True)
+        self._pos = 0
+        self._eof = True
+        return False
+
+    def _peek(self) -> str:
+        """Next non-whitespace character ('' at end of input), without consuming it."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise ValueError(f"Malformed JSON stream: expected '{char}' at offset {self._pos}, "
+                             f"got '{self._buf[self._pos:self._pos + 20]}'")
+        self._pos += 1
+
+    def _value(self) -> Any:
+        """Decode one complete JSON value, reading more input until it is complete."""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number cut by the chunk edge ("-1." | "5e10") decodes as a shorter number:
+            # until a delimiter has been seen, read more and decode again
+            if not self._eof and _NUMBER_CHARS.issuperset(self._buf[end:]) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    # --- public API ---
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._consumed:
+            raise RuntimeError("RecordStream can only be iterated once")
+        self._consumed = True
+
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == self.array_key and self._peek() == "[":
+                self._pos += 1
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._peek() == ",":
+                            self._pos += 1
+                            continue
+                        self._expect("]")
+                        break
+            else:
+                self.fields[key] = self._value()
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            return
+
+    def batches(self, size: int) -> Iterator[List[Any]]:
+        """Yield records in lists of at most `size` (the last one may be shorter)."""
+        batch = []
+        for record in self:
+            batch.append(record)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 from typing import Optional
 from dotenv import load_dotenv
 import logging
+import threading
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -45,10 +46,22 @@ class JWTAuthManager:
         self.password = os.getenv('JWT_PASSWORD', '123456')
         self.token = None
         self.token_expiry = None
+        # Sync pages are fetched from several threads - one login at a time
+        self._login_lock = threading.Lock()
         
-        # Initialize session with legacy adapter
-        self.session = requests.Session()
-        self.session.mount('https://', LegacyHttpAdapter())
+        # requests.Session is not thread-safe (shared cookie jar / connection pool state)
+        # and sync pages are fetched from several threads: one session per thread
+        self._local = threading.local()
+    
+    @property
+    def session(self) -> requests.Session:
+        """This thread's session (with the legacy adapter), created on first use."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount('https://', LegacyHttpAdapter())
+            self._local.session = session
+        return session
     
     def get_token(self) -> str:
         """
@@ -64,8 +77,11 @@ class JWTAuthManager:
             return self.token
         
         # Token expired or not present, get new one
-        logger.info("Getting new JWT token...")
-        return self.login()
+        with self._login_lock:
+            if self.token and self.token_expiry and datetime.now() < self.token_expiry:
+                return self.token  # Another thread logged in while we waited
+            logger.info("Getting new JWT token...")
+            return self.login()
     
     def login(self) -> str:
         """
@@ -128,31 +144,45 @@ class JWTAuthManager:
             logger.warning(f"Error calculating token expiry: {e}")
             self.token_expiry = datetime.now() + timedelta(hours=1)
     
-    def refresh_token(self) -> str:
+    def refresh_token(self, stale_token: Optional[str] = None) -> str:
         """
         Force token refresh by performing new login.
         
+        Args:
+            stale_token: The token the rejected request was sent with. If another
+                thread has replaced it since, that newer token is returned instead
+                of logging in again. Defaults to the current token.
+        
         Returns:
             str: Fresh JWT token
         """
-        logger.info("Force refreshing JWT token...")
-        return self.login()
+        if stale_token is None:
+            stale_token = self.token
+        with self._login_lock:
+            if self.token != stale_token:
+                return self.token  # Already refreshed by a concurrent caller
+            logger.info("Force refreshing JWT token...")
+            return self.login()
     
-    def get_auth_header(self) -> dict:
+    def get_auth_header(self, token: Optional[str] = None) -> dict:
         """
         Get authorization header with valid token.
         
+        Args:
+            token: Token to send (default: get_token()). Callers that may retry
+                on 401 keep it to pass to refresh_token().
+        
         Returns:
             dict: Headers dict with Authorization bearer token
         """
-        token = self.get_token()
+        token = token or self.get_token()
         return {
             "Authorization": f"Bearer {token}",
             "Content-Type": "application/json"
         }
     
     def get_session(self) -> requests.Session:
-        """Returns the configured session with Legacy SSL Adapter"""
+        """Returns this thread's configured session with Legacy SSL Adapter"""
         return self.session
 
 
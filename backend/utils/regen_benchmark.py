@@ -0,0 +1,132 @@
+"""
+Timing + parity check for the single-scan full rebuild (regenerate type=all)
+against the separate per-output queries, on the configured database.
+
+Both strategies seed the regen_* counter tables and a grouped_df copy from all
+ml_provision history, each inside a SAVEPOINT that is rolled back, so nothing
+the API serves is changed (the counter tables are locked while it runs). The
+timings are recorded in regeneration_log (table_name 'provision_scan', status
+'benchmark', mode 'separate' / 'single_scan').
+
+    python -m backend.utils.regen_benchmark
+    python -m backend.utils.regen_benchmark --repeat 3 --no-log
+"""
+
+import time
+import argparse
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+from backend.database.connection import SessionLocal
+from backend.database.models import RegenerationLog
+from backend.database.regen_aggregates import (
+    ingest_watermark, reset_aggregates, insert_clusters,
+    apply_cluster_window, apply_district_window, apply_block_window,
+    build_scan_aggregate, seed_aggregates_from_scan, insert_clusters_from_scan,
+    CLUSTER_AGGREGATES, DISTRICT_AGGREGATES, BLOCK_AGGREGATES
+)
+
+AGGREGATES = CLUSTER_AGGREGATES + DISTRICT_AGGREGATES + BLOCK_AGGREGATES
+GROUPED = "_bench_grouped_df"
+
+
+def separate(db, hi):
+    """What regenerate_files does per output family: grouped_df + one scan per counter family."""
+    insert_clusters(db, GROUPED)
+    reset_aggregates(db, AGGREGATES)
+    apply_cluster_window(db, None, hi)
+    apply_district_window(db, None, hi)
+    apply_block_window(db, None, hi)
+
+
+def single_scan(db, hi):
+    build_scan_aggregate(db, hi)
+    insert_clusters_from_scan(db, GROUPED)
+    reset_aggregates(db, AGGREGATES)
+    seed_aggregates_from_scan(db)
+
+
+def checksums(db) -> Dict[str, str]:
+    """Order-independent digest of every counter table and of the grouped_df cluster keys (ids are arbitrary)."""
+    sums = {
+        table: db.execute(text(f"SELECT md5(COALESCE(string_agg(t::text, '|' ORDER BY t::text), '')) FROM {table} t")).scalar()
+        for table in AGGREGATES
+    }
+    sums["grouped_df"] = db.execute(text(f"""
+        SELECT md5(COALESCE(string_agg(k::text, '|' ORDER BY k::text), ''))
+        FROM (SELECT district_id, gender, caste, age_group, religion_group FROM {GROUPED}) k
+    """)).scalar()
+    return sums
+
+
+def row_count(db) -> int:
+    return sum(db.execute(text(f"SELECT COUNT(*) FROM {t}")).scalar() for t in AGGREGATES + [GROUPED])
+
+
+def measure(db, hi, repeat: int = 1) -> Tuple[Dict[str, float], Dict[str, Dict[str, str]], Dict[str, int]]:
+    """Best time, checksums and row count per strategy. Everything is rolled back."""
+    db.execute(text(f"CREATE TEMP TABLE {GROUPED} (LIKE grouped_df) ON COMMIT DROP"))
+
+    best, digest, rows = {}, {}, {}
+    for _ in range(repeat):
+        for name, strategy in [("separate", separate), ("single_scan", single_scan)]:
+            savepoint = db.begin_nested()
+            db.execute(text(f"TRUNCATE TABLE {GROUPED}"))
+            started = time.perf_counter()
+            strategy(db, hi)
+            elapsed = time.perf_counter() - started
+            best[name] = min(best.get(name, elapsed), elapsed)
+            digest[name] = checksums(db)
+            rows[name] = row_count(db)
+            savepoint.rollback()
+    db.rollback()
+    return best, digest, rows
+
+
+def log_timings(db, hi, best: Dict[str, float], rows: Dict[str, int], error: Optional[str] = None,
+                suffix: str = "", triggered_by: str = "benchmark"):
+    """One regeneration_log row per strategy (mode = strategy name + suffix)."""
+    for name in best:
+        db.add(RegenerationLog(
+            table_name="provision_scan",
+            rows_generated=rows[name],
+            duration_seconds=best[name],
+            status="benchmark",
+            error_message=error,
+            triggered_by=triggered_by,
+            mode=f"{name}{suffix}",
+            watermark=hi
+        ))
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per strategy (best is reported)")
+    parser.add_argument("--no-log", action="store_true", help="do not write the timings to regeneration_log")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        hi = ingest_watermark(db)
+        best, digest, rows = measure(db, hi, args.repeat)
+
+        mismatched = [t for t in digest["separate"] if digest["separate"][t] != digest["single_scan"][t]]
+        speedup = best["separate"] / best["single_scan"] if best["single_scan"] else float("inf")
+
+        print(f"watermark      {hi.isoformat()}")
+        print(f"separate       {best['separate']:8.2f}s   {rows['separate']:>12,} rows")
+        print(f"single_scan    {best['single_scan']:8.2f}s   {rows['single_scan']:>12,} rows")
+        print(f"speedup        {speedup:8.2f}x")
+        print("parity         " + ("identical" if not mismatched else f"MISMATCH in {', '.join(mismatched)}"))
+
+        if not args.no_log:
+            log_timings(db, hi, best, rows, f"parity mismatch: {', '.join(mismatched)}" if mismatched else None)
+        return 1 if mismatched else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,73 @@
+"""
+File-backed static service lists (under18 / above60 top services).
+
+Each CSV is parsed once and kept in memory until the file changes on disk.
+Invalidation is by (mtime_ns, inode, size), so both in-place edits and atomic
+replace-by-rename are picked up. Uses the csv module, so pandas is not imported
+on the request path. No DB dependency, so the Streamlit-side inference code
+can share it too.
+"""
+
+import os
+import csv
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "data"))
+
+UNDER18_FILE = "under18_top_services.csv"
+ABOVE60_FILE = "above60_top_services.csv"
+
+
+class StaticListCache:
+    """path → tuple of values from one CSV column, re-parsed only when the file changes."""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], Tuple[tuple, Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(path: str) -> Optional[tuple]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def get(self, path: str, column: str = "service_name") -> Optional[Tuple[str, ...]]:
+        """Return the column values in file order, or None if the file does not exist."""
+        fingerprint = self._fingerprint(path)
+        if fingerprint is None:
+            return None
+
+        key = (path, column)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                return entry[1]
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                reader = csv.DictReader(f)
+                if not reader.fieldnames or column not in reader.fieldnames:
+                    raise KeyError(f"Column '{column}' not found in {path}")
+                values = tuple(row[column] for row in reader if row.get(column))
+            self._entries[key] = (fingerprint, values)
+            logger.info(f"📄 Loaded {len(values)} entries from {os.path.basename(path)}")
+            return values
+
+
+static_lists = StaticListCache()
+
+
+def under18_services(data_dir: str = DATA_DIR) -> Optional[Tuple[str, ...]]:
+    return static_lists.get(os.path.join(data_dir, UNDER18_FILE))
+
+
+def above60_services(data_dir: str = DATA_DIR) -> Optional[Tuple[str, ...]]:
+    return static_lists.get(os.path.join(data_dir, ABOVE60_FILE))
@@ -148,6 +148,7 @@ def create_indexes():
             "CREATE INDEX IF NOT EXISTS idx_provision_service ON ml_provision(service_id)",
             "CREATE INDEX IF NOT EXISTS idx_provision_bsk ON ml_provision(bsk_id)",
             "CREATE INDEX IF NOT EXISTS idx_provision_date ON ml_provision(prov_date)",
+            "CREATE INDEX IF NOT EXISTS ix_ml_provision_ingested_at ON ml_provision(ingested_at)",
             
             # District indexes
             "CREATE INDEX IF NOT EXISTS idx_district_name ON ml_district(district_name)",
@@ -331,24 +332,24 @@ def import_openai_similarity():
         
         logger.info(f"   Read {len(df):,} rows with {len(df.columns)} columns")
         
-        # Convert wide format to JSON
-        rows = []
+        # Binary copy for the API: float32 .npy + service_id sidecar, memory-mapped by every worker
+        from backend.inference.similarity_store import save_similarity_npy
         service_id_col = df.columns[0]
-        
-        for idx, row in df.iterrows():
-            service_id = row[service_id_col]
-            similarity_scores = row.drop(service_id_col).values
-            
-            similar_services = {}
-            for col_idx, col_name in enumerate(df.columns[1:]):
-                similar_service_id = int(col_name)
-                score = float(similarity_scores[col_idx])
-                similar_services[similar_service_id] = score
-            
-            rows.append({
+        service_ids = df[service_id_col].astype(int).to_numpy()
+        matrix = df.drop(columns=[service_id_col]).to_numpy(dtype='float32')
+        npy_path = save_similarity_npy(matrix, service_ids, csv_path)
+        logger.info(f"   ✅ Wrote memory-mappable matrix to {npy_path}")
+        
+        # Convert wide format to JSON (one row per service, no iterrows)
+        similar_ids = [int(col_name) for col_name in df.columns[1:]]
+        scores = df.drop(columns=[service_id_col]).to_numpy(dtype=float)
+        rows = [
+            {
                 'service_id': int(service_id),
-                'similar_services': json.dumps(similar_services)
-            })
+                'similar_services': json.dumps(dict(zip(similar_ids, row.tolist())))
+            }
+            for service_id, row in zip(service_ids, scores)
+        ]
         
         similarity_df = pd.DataFrame(rows)
         similarity_df.to_sql('openai_similarity_matrix', engine, if_exists='replace', index=False, method='multi', chunksize=100)
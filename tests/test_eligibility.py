@@ -0,0 +1,113 @@
+"""
+DB-free parity tests: rule_allows / EligibilityMatrix vs. the original check_eligibility.
+
+Run from the repository root:
+    python -m pytest -q tests
+"""
+
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from backend.inference.eligibility import EligibilityMatrix, rule_allows, verify_parity
+
+FLAG_COLUMNS = ("is_sc", "is_st", "is_obc_a", "is_obc_b", "is_female", "is_minority", "for_all")
+AGE_BOUNDS = [(None, None), (18, None), (None, 60), (18, 60), (25, 25)]
+AGES = [0, 17, 18, 19, 24, 25, 26, 59, 60, 61, 100]
+GENDERS = ["Male", "Female", "Other"]
+CASTES = ["General", "SC", "ST", "OBC-A", "OBC-B", "Other"]
+RELIGIONS = ["Hindu", "Muslim", "Christian", "Other"]
+
+
+def legacy_check_eligibility(rule, age, gender, caste, religion):
+    """check_eligibility as it was before the matrix, minus the DB lookup."""
+    if not rule:
+        return True
+
+    if rule.min_age is not None and age < rule.min_age: return False
+    if rule.max_age is not None and age > rule.max_age: return False
+
+    if rule.for_all: return True
+
+    if caste == 'SC' and not rule.is_sc: return False
+    if caste == 'ST' and not rule.is_st: return False
+    if caste == 'OBC-A' and not rule.is_obc_a: return False
+    if caste == 'OBC-B' and not rule.is_obc_b: return False
+    if caste == 'General':
+        if rule.is_sc or rule.is_st or rule.is_obc_a or rule.is_obc_b: return False
+
+    if gender == 'Female' and not rule.is_female: return False
+    if gender == 'Male' and rule.is_female: return False
+
+    is_minority = religion not in ['Hindu']
+    if not is_minority and rule.is_minority: return False
+    if is_minority and not rule.is_minority: return False
+
+    return True
+
+
+def synthetic_rules():
+    """Every flag combination (for_all included) under every kind of age bound, NULL bounds included."""
+    rules = []
+    for bits in itertools.product((0, 1), repeat=len(FLAG_COLUMNS)):
+        for min_age, max_age in AGE_BOUNDS:
+            rules.append(SimpleNamespace(
+                service_name=f"svc-{len(rules)}", min_age=min_age, max_age=max_age,
+                **dict(zip(FLAG_COLUMNS, bits))
+            ))
+    return rules
+
+
+RULES = synthetic_rules()
+MATRIX = EligibilityMatrix(RULES)
+NAMES = [rule.service_name for rule in RULES]
+
+
+@pytest.mark.parametrize("gender,caste,religion", list(itertools.product(GENDERS, CASTES, RELIGIONS)))
+def test_rule_allows_matches_legacy(gender, caste, religion):
+    for rule, age in itertools.product(RULES, AGES):
+        assert rule_allows(rule, age, gender, caste, religion) == \
+            legacy_check_eligibility(rule, age, gender, caste, religion), (rule, age)
+
+
+@pytest.mark.parametrize("gender,caste,religion", list(itertools.product(GENDERS, CASTES, RELIGIONS)))
+def test_matrix_filter_matches_legacy(gender, caste, religion):
+    by_name = dict(zip(NAMES, RULES))
+    for age in AGES:
+        expected = [n for n in NAMES if legacy_check_eligibility(by_name[n], age, gender, caste, religion)]
+        assert MATRIX.filter(NAMES, age, gender, caste, religion) == expected, age
+
+
+def test_null_age_bounds_never_exclude():
+    rule = SimpleNamespace(service_name="Open", min_age=None, max_age=None, for_all=1,
+                           **{c: 0 for c in FLAG_COLUMNS if c != "for_all"})
+    matrix = EligibilityMatrix([rule])
+    for age in (0, 1000):
+        assert rule_allows(rule, age, "Male", "General", "Hindu")
+        assert matrix.filter(["Open"], age, "Male", "General", "Hindu") == ["Open"]
+
+
+def test_age_limits_are_inclusive():
+    rule = SimpleNamespace(service_name="Adult", min_age=18, max_age=60, for_all=1,
+                           **{c: 0 for c in FLAG_COLUMNS if c != "for_all"})
+    matrix = EligibilityMatrix([rule])
+    for age, allowed in ((17, False), (18, True), (60, True), (61, False)):
+        assert rule_allows(rule, age, "Female", "SC", "Muslim") is allowed
+        assert matrix.filter(["Adult"], age, "Female", "SC", "Muslim") == (["Adult"] if allowed else [])
+
+
+def test_matrix_lookup_semantics():
+    """Case-insensitive names, first row wins, unknown names and no rule are allowed."""
+    closed = SimpleNamespace(service_name="Pension", min_age=60, max_age=None,
+                             **{c: 0 for c in FLAG_COLUMNS})
+    shadowed = SimpleNamespace(service_name="PENSION", min_age=None, max_age=None, for_all=1,
+                               **{c: 0 for c in FLAG_COLUMNS if c != "for_all"})
+    matrix = EligibilityMatrix([closed, shadowed])
+    assert matrix.filter(["pension", "Unknown"], 30, "Male", "General", "Hindu") == ["Unknown"]
+    assert EligibilityMatrix([]).filter(["Anything"], 30, "Male", "General", "Hindu") == ["Anything"]
+    assert rule_allows(None, 30, "Male", "General", "Hindu")
+
+
+def test_verify_parity_reports_no_mismatches():
+    assert verify_parity(dict(zip(NAMES, RULES)), MATRIX) == 0